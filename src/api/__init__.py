@@ -1,18 +1,158 @@
+import time
+import requests
 from abc import ABC, abstractmethod
+from threading import Thread
+from src.api.outbox import Outbox
+from src.api.dispatcher import Dispatcher
+from src.api.admission import Admission, SHED
+from src.intents.router import IntentRouter
+from src.sessions import SessionStore
+from src.sessions.sqlite import SqliteBackend
+from src.sessions.snapshot import SnapshotBackend
+from src.orders import OrderJournal
+from src.utils.dedup import Deduplicator
 from src.utils.logger import Logger
+from src.utils.metrics import Metrics
+from src.utils.profiler import Profiler, current_profile
+from src.utils.tracing import current_trace
 
 
 class Api(ABC):
     """
     Abstract class for api
+    Messenger adapters parse platform webhooks into chat id and text and format replies, the rest is shared:
+    outbound transport (pooled keep-alive connections, platform rate limit policy, retries with backoff),
+    sessions store, intent router, per chat dispatcher behind admission control, updates deduplication and
+    orders journal. Shared parts are built by setup()
     """
+    name = 'api'            # Platform name (metrics label)
+    rate_limits = {}        # Platform outbound rate limit policy (Outbox options, overridden by config)
+    orders = None           # Confirmed orders journal (see OrderJournal)
+    max_length = 4096       # Max message text length of platform
+    text_field = 'text'     # Text field of message request (see merge)
+    separator = '\n'        # Separator of coalesced replies
+
+    non_text_text = "Я понимаю только текстовые сообщения!"     # Reply to messages without text
+
     def __init__(self):
         self.logger = Logger().get()
+        self.profiler = Profiler()      # Updates profiler, adapters open update profile inside update trace
+
+    def setup(self, send_url: str, outbox: dict = None, sessions: dict = None, dispatcher: dict = None, dedup: dict = None,
+              router: dict = None, orders: dict = None, admission: dict = None, cold_start: bool = False,
+              encode=None, check=None):
+        """
+        Build shared updates handling and delivery machinery
+        :param send_url: platform send message method url
+        :param outbox: Outbox options (over platform rate_limits), "coalesce" merges replies to a chat (see merge)
+        :param sessions: SessionStore options, "path" enables sqlite backend, "shared" makes it the single store
+                         of several worker processes, "snapshot" enables compact snapshots directory written
+                         every "snapshot_interval" seconds
+        :param dispatcher: Dispatcher options
+        :param dedup: Deduplicator options, seen ids are kept in shared sessions database if there is one
+        :param router: IntentRouter options, "intents" are registered intent names, first one is default
+        :param orders: OrderJournal options (disabled without "path")
+        :param admission: Admission options, "busy_text" is the reply to shed chats
+        :param cold_start: train router in background (see warm_up)
+        :param encode: platform request format (see Outbox)
+        :param check: platform delivery result (see Outbox)
+        :return:
+        """
+        # Clients sessions store
+        sessions = dict(sessions or {})
+        path = sessions.pop('path', None)
+        shared = sessions.pop('shared', False)
+        snapshot = sessions.pop('snapshot', None)
+        snapshot_interval = sessions.pop('snapshot_interval', 60)
+        if path and snapshot:
+            raise ValueError("Sessions can be persisted either to sqlite (path) or to snapshots (snapshot)")
+        if path:
+            backend = SqliteBackend(path, shared=shared)
+        elif snapshot:
+            backend = SnapshotBackend(snapshot, interval=snapshot_interval)
+        else:
+            backend = None
+        self.clients = SessionStore(self, backend=backend, **sessions)
+
+        # Outbound messages queue
+        self.outbox = Outbox(
+            send_url, api=self.name, encode=encode, check=check, merge=self.merge, **{**self.rate_limits, **(outbox or {})}
+        )
+
+        # Intent started by message of chat without dialog, model is trained at startup (in background for cold start)
+        router = dict(router or {})
+        self.router = IntentRouter.from_names(router.pop('intents', ['Pizza']), **router)
+        self.cold_start = cold_start
+        self.warmer = None
+        if not cold_start:
+            self.router.build()
+
+        # Confirmed orders journal
+        if orders and orders.get('path'):
+            self.orders = OrderJournal(**orders)
+
+        # Per chat ordered updates handling
+        self.dispatcher = Dispatcher(**(dispatcher or {}))
+
+        # Overload protection in front of dispatcher
+        admission = dict(admission or {})
+        self.busy_text = admission.pop('busy_text', "Сейчас слишком много заказов, напишите нам через минуту")
+        self.admission = Admission(**admission)
+
+        # Seen update ids, absorbs webhook redeliveries (to any of worker processes if sessions are shared)
+        self.updates = Deduplicator(backend=backend if path and shared else None, **(dedup or {}))
 
     @abstractmethod
-    def send_message(self, *args, **kwargs):
+    def message(self, chat_id, text: str) -> dict:
+        """
+        Platform send message request
+        :param chat_id: user chat id
+        :param text: text
+        :return: message data (see Outbox encode)
+        """
         raise NotImplementedError
 
+    def send_message(self, chat_id, text):
+        """
+        Send message (text only)
+        Message is queued and delivered in background, text longer than max_length is sent in several messages
+        :param chat_id: user chat id
+        :param text: text
+        :return:
+        """
+        for part in self.split(text):
+            self.outbox.put(chat_id, self.message(chat_id, part))
+
+    def split(self, text: str) -> list:
+        """
+        Split text into parts of max_length, at line or word breaks where possible
+        :param text: text
+        :return:
+        """
+        parts = []
+        while len(text) > self.max_length:
+            end = max(text.rfind('\n', 0, self.max_length + 1), text.rfind(' ', 0, self.max_length + 1))
+            if end > 0:
+                parts.append(text[:end])
+                text = text[end + 1:]       # Break itself is dropped
+            else:
+                parts.append(text[:self.max_length])
+                text = text[self.max_length:]
+        parts.append(text)
+        return parts
+
+    def merge(self, first: dict, second: dict):
+        """
+        Coalesce two replies to a chat into one message (see Outbox coalesce)
+        :param first: message request
+        :param second: next message request of the same chat
+        :return: merged message request or None if merged text does not fit into max_length
+        """
+        text = f"{first[self.text_field]}{self.separator}{second[self.text_field]}"
+        if len(text) > self.max_length:
+            return None
+        return {**first, self.text_field: text}
+
     @abstractmethod
     def register(self, *args, **kwargs):
         raise NotImplementedError
@@ -20,3 +160,182 @@ class Api(ABC):
     @abstractmethod
     def receive_message(self, *args, **kwargs):
         raise NotImplementedError
+
+    def send_bulk(self, chat_ids: list, text: str):
+        """
+        Send the same text to many chats (one message per chat unless platform has bulk send)
+        :param chat_ids: user chat ids
+        :param text: text
+        :return:
+        """
+        for chat_id in chat_ids:
+            self.send_message(chat_id, text)
+
+    def call(self, url: str, retries: int = 3, **kwargs) -> dict:
+        """
+        Platform method call over transport connections pool, network and server errors are retried with backoff
+        :param url: method url
+        :param retries: attempts
+        :param kwargs: requests arguments (data, json, params)
+        :return: response json
+        """
+        for attempt in range(retries):
+            try:
+                resp = self.outbox.session.post(url, timeout=self.outbox.timeout, **kwargs)
+                if resp.status_code < 500:
+                    return resp.json()
+                error = f"{resp.status_code} {resp.text}"
+            except requests.RequestException as e:
+                error = f"{e}"
+            if attempt + 1 < retries:
+                time.sleep(self.outbox.backoff * 2 ** attempt)
+        raise Exception(f"Call {url.rsplit('/', 1)[-1]} failed -> {error}")
+
+    def start_warm_up(self):
+        """
+        Run warm up in background (cold start)
+        :return:
+        """
+        self.warmer = Thread(target=self.warm_up, name=f"{self.name.capitalize()}-warmup", daemon=True)
+        self.warmer.start()
+
+    def warm_up(self):
+        """
+        Off request path startup work: train router, build intents machines and classifiers
+        :return:
+        """
+        self.router.build()
+        for intent in self.router.intents:
+            intent.get_machine()
+            intent.get_classifier()
+
+    def is_duplicate(self, key) -> bool:
+        """
+        Update was already received (webhook redelivery)
+        :param key: platform update id
+        :return:
+        """
+        if self.updates.seen(key):
+            self.logger.info("Duplicate update skipped: %s", key, extra={'category': 'update'})
+            Metrics().counter(f"{self.name}_updates_total", result='duplicate').inc()
+            return True
+        return False
+
+    def handle_text(self, chat_id, text: str):
+        """
+        Queue user text handling (call inside update trace)
+        :param chat_id: user chat id
+        :param text: user text
+        :return:
+        """
+        self.logger.info("Get message: chat_id: %s text: %s", chat_id, text, extra={'category': 'update'})
+        Metrics().counter(f"{self.name}_updates_total", result='text').inc()
+        dialog = not self.is_start(text) and self.clients.has_dialog(chat_id)
+        self.admit(chat_id, dialog, self.message_handle, chat_id, text)
+
+    def is_start(self, text: str) -> bool:
+        """
+        Text is platform start command (new chat, no admission priority)
+        :param text: user text
+        :return:
+        """
+        return False
+
+    def handle_non_text(self, chat_id):
+        """
+        Queue reply to message without text (call inside update trace)
+        :param chat_id: user chat id
+        :return:
+        """
+        Metrics().counter(f"{self.name}_updates_total", result='non_text').inc()
+        self.admit(chat_id, False, self.send_message, chat_id, text=self.non_text_text)
+
+    def handle_skipped(self, reason: str):
+        self.logger.warning(f"Message skipped due to {reason}")
+        Metrics().counter(f"{self.name}_updates_total", result='skipped').inc()
+
+    def message_handle(self, chat_id, text):
+        """
+        Handling message from user
+        Continue user dialog or start intent picked by router (chat without session or with finished dialog)
+        :param chat_id: user chat id
+        :param text: user text
+        :return:
+        """
+        with self.clients.lock_chat(chat_id):
+            client_intent = self.clients.get(chat_id)
+            if client_intent is None or not client_intent.in_dialog:
+                client_intent = self.router.route(text)(self)
+            client_intent.next(chat_id=chat_id, text=text, trace_id=current_trace.get())
+            self.clients.put(chat_id, client_intent)
+
+    def admit(self, chat_id, dialog: bool, func, *args, **kwargs):
+        """
+        Queue update handling on chat dispatcher shard within admission budget
+        Shed chat gets busy reply straight to outbox (no intent work, at most once per cooldown)
+        :param chat_id: user chat id
+        :param dialog: chat is in a dialog (has priority over new chats)
+        :param func: handling task
+        :return:
+        """
+        result = self.admission.admit(chat_id, dialog, lambda: self.dispatcher.submit(chat_id, self.admitted, func, *args, **kwargs))
+        Metrics().counter(f"{self.name}_admission_total", result=result).inc()
+        if result == SHED:
+            self.logger.warning(f"Update of chat {chat_id} shed due to overload")
+            if self.admission.busy(chat_id):
+                self.outbox.put(chat_id, self.message(chat_id, self.busy_text), timeout=0)
+
+    def admitted(self, func, *args, **kwargs):
+        """
+        Dispatcher task which releases admission budget when it is finished
+        Profiled update (see Profiler) is finished by it too
+        :return:
+        """
+        try:
+            profile = current_profile.get()
+            if profile is None:
+                func(*args, **kwargs)
+            else:
+                profile.handle(func, *args, **kwargs)
+        finally:
+            self.admission.done()
+
+    def collect_metrics(self) -> list:
+        """
+        Gauges and counters of updates handling components
+        :return: [(name, labels, value)] gauges and [(name, labels, value, 'counter')] counters
+        """
+        gauges = []
+        for index, shard in enumerate(self.dispatcher.stats()):
+            gauges.append(('dispatcher_queue_depth', {'api': self.name, 'shard': index}, shard['depth']))
+            gauges.append(('dispatcher_latency_max_seconds', {'api': self.name, 'shard': index}, shard['latency_max']))
+        for name, value in self.clients.stats().items():
+            if name == 'size':
+                gauges.append(('sessions_size', {'api': self.name}, value))
+            else:
+                gauges.append((f"sessions_{name}_total", {'api': self.name}, value, 'counter'))
+        gauges.append(('updates_duplicate_rate', {'api': self.name}, self.updates.rate))
+        stats = self.admission.stats()
+        gauges.append(('admission_in_flight', {'api': self.name}, stats['in_flight']))
+        gauges.append(('admission_waiting', {'api': self.name}, stats['waiting']))
+        return gauges
+
+    def join(self):
+        """
+        Wait for api background updates ingestion (polling), nothing to wait for webhook apis
+        :return:
+        """
+        pass
+
+    def close(self):
+        """
+        Finish in-flight work and flush state (called on shutdown): handle queued updates, deliver queued replies,
+        close sessions store and orders journal
+        :return:
+        """
+        self.admission.join()
+        self.dispatcher.close()
+        self.outbox.close()
+        self.clients.close()
+        if self.orders is not None:
+            self.orders.close()
@@ -0,0 +1,148 @@
+import time
+import contextvars
+from collections import deque
+from threading import Lock, Condition
+from src.utils.logger import Logger
+
+ADMITTED = 'admitted'
+DEFERRED = 'deferred'
+SHED = 'shed'
+
+
+class Admission:
+    """
+    Overload protection in front of updates handling
+    At most budget updates are in flight (queued or being handled). Chats without a dialog may use only
+    new_share of the budget, so running dialogs keep going when new users flood in. Updates over budget wait in
+    a bounded deferred queue (dialog chats first) and are submitted as in-flight updates finish, updates which
+    do not fit there are shed. Admission never blocks, so webhook is acknowledged at once under any load
+    """
+    def __init__(self, budget: int = 1000, new_share: float = 0.5, deferred: int = 1000, busy_cooldown: float = 30,
+                 clock=time.monotonic):
+        """
+        :param budget: max updates in flight (keep below dispatcher queue size of a shard)
+        :param new_share: share of budget and of deferred queue chats without dialog may use
+        :param deferred: max updates waiting for budget (0 - shed at once)
+        :param busy_cooldown: min seconds between busy replies to a chat
+        :param clock: time source
+        """
+        self.logger = Logger().get()
+        self.budget = budget
+        self.new_budget = max(int(budget * new_share), 1)
+        self.max_deferred = deferred
+        self.new_deferred = int(deferred * new_share)
+        self.busy_cooldown = busy_cooldown
+        self.clock = clock
+
+        self.lock = Lock()
+        self.idle = Condition(self.lock)                # Notified when nothing is in flight
+        self.in_flight = 0
+        self.queues = {True: deque(), False: deque()}   # Dialog flag -> deferred (chat id, context, submit)
+        self.waiting = {}                               # Chat id -> [deferred count, dialog flag of its queue]
+        self.busy_sent = {}                             # Chat id -> last busy reply time
+
+        # Counters
+        self.admitted = 0
+        self.deferred = 0
+        self.shed = 0
+
+    def limit(self, dialog: bool) -> int:
+        return self.budget if dialog else self.new_budget
+
+    def waiting_limit(self, dialog: bool) -> int:
+        return self.max_deferred if dialog else self.new_deferred
+
+    def admit(self, chat_id, dialog: bool, submit) -> str:
+        """
+        Admit update
+        :param chat_id: user chat id
+        :param dialog: chat is in a dialog (has priority)
+        :param submit: callable which queues update handling, handling must call done() when finished
+        :return: ADMITTED (submitted now), DEFERRED (submitted later) or SHED (dropped)
+        """
+        with self.lock:
+            entry = self.waiting.get(chat_id)
+            if entry is None and self.in_flight < self.limit(dialog):
+                self.in_flight += 1
+                self.admitted += 1
+                result = ADMITTED
+            elif len(self.queues[True]) + len(self.queues[False]) < self.waiting_limit(dialog):
+                # Later updates of a chat follow its deferred ones (chat order is kept)
+                if entry is None:
+                    entry = self.waiting[chat_id] = [0, dialog]
+                entry[0] += 1
+                self.queues[entry[1]].append((chat_id, contextvars.copy_context(), submit))
+                self.deferred += 1
+                return DEFERRED
+            else:
+                self.shed += 1
+                return SHED
+        if not submit():
+            self.done()
+        return ADMITTED
+
+    def done(self):
+        """
+        In-flight update is finished, submit deferred ones which fit into budget
+        :return:
+        """
+        with self.lock:
+            self.in_flight -= 1
+            ready = self.pop()
+            if not self.in_flight:
+                self.idle.notify_all()
+        for context, submit in ready:
+            if not context.run(submit):     # Deferred update keeps trace of its webhook request
+                self.done()
+
+    def pop(self) -> list:
+        """
+        Deferred updates which fit into budget (called under lock)
+        :return: [(context, submit)]
+        """
+        ready = []
+        for dialog in (True, False):
+            queue = self.queues[dialog]
+            while queue and self.in_flight < self.limit(dialog):
+                chat_id, context, submit = queue.popleft()
+                entry = self.waiting[chat_id]
+                entry[0] -= 1
+                if not entry[0]:
+                    del self.waiting[chat_id]
+                self.in_flight += 1
+                ready.append((context, submit))
+        return ready
+
+    def join(self):
+        """
+        Wait until admitted and deferred updates are handled (before dispatcher is closed)
+        :return:
+        """
+        with self.idle:
+            while self.in_flight:
+                self.idle.wait()
+
+    def busy(self, chat_id) -> bool:
+        """
+        Shed chat should get busy reply (not more often than busy_cooldown)
+        :param chat_id: user chat id
+        :return:
+        """
+        now = self.clock()
+        with self.lock:
+            sent = self.busy_sent.get(chat_id)
+            if sent is not None and now - sent < self.busy_cooldown:
+                return False
+            if len(self.busy_sent) >= 100000:
+                self.busy_sent = {chat: sent for chat, sent in self.busy_sent.items() if now - sent < self.busy_cooldown}
+            self.busy_sent[chat_id] = now
+            return True
+
+    def stats(self) -> dict:
+        return {
+            'in_flight': self.in_flight,
+            'waiting': len(self.queues[True]) + len(self.queues[False]),
+            'admitted': self.admitted,
+            'deferred': self.deferred,
+            'shed': self.shed,
+        }
@@ -0,0 +1,128 @@
+import time
+import contextvars
+from queue import Queue, Full
+from threading import Thread, Lock
+from src.utils.logger import Logger
+
+
+class Shard:
+    """
+    Dispatcher worker with its own queue and latency statistics
+    """
+    def __init__(self, queue_size: int):
+        self.queue = Queue(maxsize=queue_size)
+        self.processed = 0          # Tasks done
+        self.latency_total = 0.0    # Sum of seconds from submit to done
+        self.latency_max = 0.0      # Max seconds from submit to done
+        self.thread = None
+
+    def stats(self) -> dict:
+        return {
+            'depth': self.queue.qsize(),
+            'processed': self.processed,
+            'latency_avg': self.latency_total / self.processed if self.processed else 0.0,
+            'latency_max': self.latency_max,
+        }
+
+
+class Dispatcher:
+    """
+    Per chat ordered dispatcher
+    Chat id is hashed onto one of N shards, every shard runs its tasks one by one in a worker thread,
+    so messages of a chat are handled in order while different chats are handled in parallel
+    Task runs in context of submitter (trace id is kept)
+    """
+    STOP = object()     # Worker stop marker
+
+    def __init__(self, shards: int = 4, queue_size: int = 10000, put_timeout: float = 0.5):
+        """
+        :param shards: worker threads count
+        :param queue_size: max queued tasks (split between shards)
+        :param put_timeout: max seconds to wait for free space in full shard queue
+        """
+        self.logger = Logger().get()
+        self.put_timeout = put_timeout
+        self.shards = [Shard(max(queue_size // shards, 1)) for _ in range(shards)]
+        self.lock = Lock()
+        self.started = False
+
+    def start(self):
+        """
+        Start workers (idempotent)
+        :return:
+        """
+        with self.lock:
+            if self.started:
+                return
+            for index, shard in enumerate(self.shards):
+                shard.thread = Thread(target=self.work, args=(shard,), name=f"Dispatcher-{index}", daemon=True)
+                shard.thread.start()
+            self.started = True
+
+    def submit(self, chat_id, func, *args, **kwargs) -> bool:
+        """
+        Queue task on chat shard
+        :param chat_id: user chat id
+        :param func: task
+        :return: False if shard queue is full and task was dropped
+        """
+        if not self.started:
+            self.start()
+        shard = self.shards[hash(chat_id) % len(self.shards)]
+        try:
+            shard.queue.put((time.perf_counter(), contextvars.copy_context(), func, args, kwargs), timeout=self.put_timeout)
+        except Full:
+            self.logger.warning(f"Dispatcher shard is full, update of chat {chat_id} dropped")
+            return False
+        return True
+
+    def join(self):
+        """
+        Wait until every queued task is done
+        :return:
+        """
+        for shard in self.shards:
+            shard.queue.join()
+
+    def close(self):
+        """
+        Finish queued tasks and stop workers
+        :return:
+        """
+        with self.lock:
+            started, self.started = self.started, False
+        if started:
+            for shard in self.shards:
+                shard.queue.put(self.STOP)
+            for shard in self.shards:
+                shard.thread.join()
+
+    def work(self, shard: Shard):
+        """
+        Worker loop
+        :param shard: worker shard
+        :return:
+        """
+        while True:
+            item = shard.queue.get()
+            if item is self.STOP:
+                shard.queue.task_done()
+                break
+            submitted, context, func, args, kwargs = item
+            try:
+                context.run(func, *args, **kwargs)
+            except Exception as e:
+                self.logger.exception(f"Task failed -> {e}")
+            finally:
+                latency = time.perf_counter() - submitted
+                shard.processed += 1
+                shard.latency_total += latency
+                shard.latency_max = max(shard.latency_max, latency)
+                shard.queue.task_done()
+
+    def stats(self) -> list:
+        """
+        Queue depth and latency of every shard
+        :return:
+        """
+        return [shard.stats() for shard in self.shards]
@@ -1,15 +1,141 @@
+import hmac
+import json
+import flask
+import hashlib
+from flask import request
 from src.api import Api
+from src.utils.metrics import Metrics
+from src.utils.tracing import trace, new_trace_id
 
 
 class Facebook(Api):
     """
-    Facebook not implemented
+    Facebook Messenger page bot: webhook with verification handshake, replies by Send API
     """
-    def register(self):
-        raise NotImplementedError
+    name = 'facebook'
+    rate_limits = {'rate': 40, 'chat_rate': 1, 'chat_burst': 3}
+    max_length = 2000                       # Send API text limit
 
-    def send_message(self, chat_id, text):
-        raise NotImplementedError
+    retry_errors = {1, 2, 4, 17, 32, 613}   # Unknown and temporary errors, api rate limits
+
+    def __init__(self, token: str, verify_token: str, app_secret: str = None, api: str = 'https://graph.facebook.com/v17.0',
+                 outbox: dict = None, sessions: dict = None, dispatcher: dict = None, dedup: dict = None,
+                 cold_start: bool = False, orders: dict = None, router: dict = None, admission: dict = None):
+        """
+        :param token: page access token
+        :param verify_token: token of webhook verification request
+        :param app_secret: app secret, events are accepted only with valid X-Hub-Signature-256 when it is set
+        :param api: Graph api url
+        """
+        super().__init__()
+        self.token = token
+        self.verify_token = verify_token
+        self.app_secret = app_secret.encode('utf-8') if app_secret else None
+        self.api = api
+
+        # Sessions, transport, router, orders, dispatcher, admission and dedup (see Api.setup for options)
+        self.setup(
+            f"{self.api}/me/messages?access_token={self.token}", outbox=outbox, sessions=sessions, dispatcher=dispatcher,
+            dedup=dedup, router=router, orders=orders, admission=admission, cold_start=cold_start,
+            encode=self.encode, check=self.check_response,
+        )
+
+    def register(self, app: flask.Flask):
+        """
+        Register webhook url rule (GET is verification handshake)
+        :return:
+        """
+        Metrics().collector(self.collect_metrics)
+        app.add_url_rule('/facebook', 'facebook', self.receive_message, methods=["GET", "POST"])
+        if self.cold_start:
+            self.start_warm_up()
+
+    def message(self, chat_id, text: str) -> dict:
+        return {'recipient': {'id': str(chat_id)}, 'messaging_type': 'RESPONSE', 'message': {'text': text}}
+
+    def merge(self, first: dict, second: dict):
+        text = f"{first['message']['text']}{self.separator}{second['message']['text']}"
+        if len(text) > self.max_length:
+            return None
+        return {**first, 'message': {**first['message'], 'text': text}}
+
+    @staticmethod
+    def encode(data: dict) -> dict:
+        return {'json': data}
+
+    @classmethod
+    def check_response(cls, resp, backoff: float):
+        """
+        Send API delivery result, rate limits and temporary errors are reported as 4xx with error code
+        :param resp: response
+        :param backoff: seconds before retry of this attempt
+        :return: (error or None if delivered, seconds before retry or None to drop message)
+        """
+        if resp.status_code < 400:
+            return None, None
+        error = f"{resp.status_code} {resp.text}"
+        if resp.status_code == 429 or resp.status_code >= 500:
+            return error, backoff
+        try:
+            code = resp.json()['error']['code']
+        except (ValueError, KeyError, TypeError):
+            return error, None
+        return error, backoff if code in cls.retry_errors else None
+
+    def verify(self):
+        """
+        Webhook verification handshake
+        :return:
+        """
+        if request.args.get('hub.mode') == 'subscribe' and request.args.get('hub.verify_token') == self.verify_token:
+            return request.args.get('hub.challenge', '')
+        return 'forbidden', 403
 
     def receive_message(self):
-        raise NotImplementedError
+        """
+        Webhook callback
+        Batch of page events is acknowledged at once, every message is handled like Telegram update
+        Redelivered messages are dropped by message id
+        :return:
+        """
+        if request.method == 'GET':
+            return self.verify()
+        body = request.get_data()
+        if self.app_secret is not None:
+            signature = 'sha256=' + hmac.new(self.app_secret, body, hashlib.sha256).hexdigest()
+            if not hmac.compare_digest(signature, request.headers.get('X-Hub-Signature-256', '')):
+                return 'forbidden', 403
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return 'bad request', 400
+        if payload.get('object') != 'page':
+            return 'not found', 404
+        for entry in payload.get('entry', []):
+            for event in entry.get('messaging', []):
+                mid = event.get('message', {}).get('mid')
+                if mid is not None and self.is_duplicate(mid):
+                    continue
+                self.handle_event(event)
+        return 'EVENT_RECEIVED'
+
+    def handle_event(self, event: dict):
+        """
+        Handle messaging event (deliveries, reads and echoes of page own messages are skipped)
+        :param event: messaging event
+        :return:
+        """
+        with trace(new_trace_id()), self.profiler.update(self.name, event):
+            self.logger.info("Get updates: %s", event, extra={'category': 'update'})
+            message = event.get('message')
+            sender = event.get('sender', {}).get('id')
+            if message is None or message.get('is_echo'):
+                self.handle_skipped("event is not a user message")
+            elif sender is None:
+                self.handle_skipped("sender does not present")
+            else:
+                chat_id = int(sender) if str(sender).isdigit() else sender     # Page scoped ids are numeric
+                if message.get('text') is None:
+                    self.handle_non_text(chat_id)
+                else:
+                    self.handle_text(chat_id, message['text'])
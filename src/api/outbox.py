@@ -0,0 +1,321 @@
+import os
+import time
+import heapq
+import requests
+from collections import deque
+from queue import Queue, Empty, Full
+from threading import Thread, Lock
+from requests.adapters import HTTPAdapter
+from src.utils.logger import Logger
+from src.utils.metrics import Metrics
+from src.utils.tracing import trace, current_trace
+
+
+class RateLimit:
+    """
+    Generic cell rate algorithm (token bucket without timer)
+    State is a single number (theoretical arrival time), so it is cheap to keep per chat
+    """
+    __slots__ = ('interval', 'tolerance')
+
+    def __init__(self, rate: float, burst: int = 1):
+        """
+        :param rate: messages per second, 0 disables limit
+        :param burst: messages allowed at once
+        """
+        self.interval = 1 / rate if rate else 0.0
+        self.tolerance = self.interval * (max(burst, 1) - 1)
+
+    def reserve(self, tat: float, now: float):
+        """
+        Reserve slot for one message
+        :param tat: theoretical arrival time
+        :param now: current time
+        :return: (delay before sending, new theoretical arrival time)
+        """
+        tat = max(tat, now)
+        return max(tat - self.tolerance - now, 0.0), tat + self.interval
+
+
+class Outbox:
+    """
+    Outbound messages delivery
+    Messages are queued and sent by background workers over pooled keep-alive connections
+    Chat is pinned to one worker, so messages of a chat are delivered in FIFO order
+    Global and per chat rate limits are respected, 429 responses are retried after "retry_after"
+    Request format and error handling of a platform are pluggable (encode, check), so every messenger api
+    shares the same delivery machinery
+    With coalescing, messages of a chat waiting for sending are merged into one request (see merge)
+    """
+    STOP = object()     # Worker stop marker
+
+    def __init__(self, url: str, workers: int = 4, queue_size: int = 10000, put_timeout: float = 0.5,
+                 rate: float = 30, chat_rate: float = 1, chat_burst: int = 3,
+                 retries: int = 3, backoff: float = 0.5, timeout: float = 10, api: str = 'telegram',
+                 encode=None, check=None, coalesce: float = None, merge=None):
+        """
+        :param url: send method url
+        :param workers: worker threads count
+        :param queue_size: max queued messages (split between workers)
+        :param put_timeout: max seconds to wait for free space in full queue
+        :param rate: global messages per second limit
+        :param chat_rate: per chat messages per second limit
+        :param chat_burst: per chat burst size
+        :param retries: attempts for failed message before it is dropped
+        :param backoff: first retry delay for network and server errors (doubles every attempt)
+        :param timeout: http timeout
+        :param api: platform name (metrics label)
+        :param encode: message -> request keyword arguments (form fields by default)
+        :param check: (response, backoff seconds) -> (error or None, seconds before retry or None to drop),
+                      see check_response
+        :param coalesce: seconds first message of an idle chat waits for more messages to merge with,
+                         0 merges only messages which are already waiting, None disables merging
+        :param merge: (message, next message) -> merged message or None if they can not be merged (too long),
+                      required for coalescing
+        """
+        self.logger = Logger().get()
+        self.url = url
+        self.put_timeout = put_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.api = api
+        self.encode = encode or self.form
+        self.check = check or self.check_response
+        self.coalesce = coalesce if merge is not None else None
+        self.merge = merge
+
+        # Keep-alive connections pool shared by workers (see session)
+        self.pool_size = workers
+        self.pool = None
+        self.pool_pid = None
+
+        self.limit = RateLimit(rate, burst=max(int(rate), 1))      # Global rate limit
+        self.limit_tat = 0.0                                        # Global theoretical arrival time
+        self.limit_lock = Lock()
+        self.chat_limit = RateLimit(chat_rate, burst=chat_burst)   # Per chat rate limit
+
+        self.send_seconds = Metrics().histogram('outbox_send_seconds', api=api)    # Http latency
+        self.coalesced = Metrics().counter('outbox_coalesced_total', api=api)      # Messages merged (http calls saved)
+
+        self.queues = [Queue(maxsize=max(queue_size // workers, 1)) for _ in range(workers)]
+        self.threads = []
+        self.threads_lock = Lock()
+
+    @property
+    def session(self) -> requests.Session:
+        """
+        Keep-alive connections pool of this process
+        Pool is created again in forked process (gunicorn worker), sockets opened by parent are never shared
+        :return:
+        """
+        if self.pool_pid != os.getpid():
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self.pool, self.pool_pid = session, os.getpid()
+        return self.pool
+
+    def start(self):
+        """
+        Start workers (idempotent)
+        :return:
+        """
+        with self.threads_lock:
+            if self.threads:
+                return
+            for index, queue in enumerate(self.queues):
+                thread = Thread(target=self.work, args=(queue,), name=f"Outbox-{index}", daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def put(self, chat_id, data: dict, timeout: float = None) -> bool:
+        """
+        Queue message for delivery
+        :param chat_id: user chat id
+        :param data: send method parameters
+        :param timeout: max seconds to wait for free space (put_timeout by default)
+        :return: False if queue is full and message was dropped
+        """
+        if not self.threads:
+            self.start()
+        try:
+            self.queues[hash(chat_id) % len(self.queues)].put(
+                (chat_id, data, current_trace.get()), timeout=self.put_timeout if timeout is None else timeout
+            )
+        except Full:
+            self.logger.warning(f"Outbox is full, message to chat {chat_id} dropped")
+            return False
+        return True
+
+    def flush(self):
+        """
+        Wait until every queued message is delivered or dropped
+        :return:
+        """
+        for queue in self.queues:
+            queue.join()
+
+    def close(self):
+        """
+        Deliver queued messages and stop workers
+        :return:
+        """
+        with self.threads_lock:
+            threads, self.threads = self.threads, []
+        if threads:
+            for queue in self.queues:
+                queue.put(self.STOP)
+            for thread in threads:
+                thread.join()
+        if self.pool is not None and self.pool_pid == os.getpid():
+            self.pool.close()
+
+    def work(self, inbox: Queue):
+        """
+        Worker loop
+        :param inbox: worker queue
+        :return:
+        """
+        pending = {}        # Chat id -> deque of [data, attempt, trace id]
+        chats = {}          # Chat id -> theoretical arrival time of chat rate limit
+        schedule = []       # Heap of (send time, sequence, chat id)
+        sequence = 0
+        stopping = False
+
+        while not (stopping and not pending):
+            timeout = max(schedule[0][0] - time.monotonic(), 0) if schedule else None
+            try:
+                item = inbox.get(timeout=timeout)
+            except Empty:
+                pass
+            else:
+                if item is self.STOP:
+                    stopping = True
+                    inbox.task_done()
+                else:
+                    chat_id, data, trace_id = item
+                    if chat_id in pending:
+                        pending[chat_id].append([data, 0, trace_id])
+                    else:
+                        pending[chat_id] = deque([[data, 0, trace_id]])
+                        now = time.monotonic()
+                        delay, chats[chat_id] = self.chat_limit.reserve(chats.get(chat_id, 0.0), now)
+                        if self.coalesce:
+                            delay = max(delay, self.coalesce)
+                        sequence += 1
+                        heapq.heappush(schedule, (now + delay, sequence, chat_id))
+
+            now = time.monotonic()
+            while schedule and schedule[0][0] <= now:
+                _, _, chat_id = heapq.heappop(schedule)
+                messages = pending[chat_id]
+                if self.coalesce is not None and len(messages) > 1:
+                    for _ in range(self.merge_head(messages)):
+                        inbox.task_done()
+                with trace(messages[0][2]):
+                    retry_after = self.deliver(chat_id, messages[0])
+                now = time.monotonic()
+                if retry_after is None:
+                    messages.popleft()
+                    inbox.task_done()
+                    if not messages:
+                        del pending[chat_id]
+                        continue
+                    delay, chats[chat_id] = self.chat_limit.reserve(chats[chat_id], now)
+                else:
+                    delay = retry_after
+                sequence += 1
+                heapq.heappush(schedule, (now + delay, sequence, chat_id))
+
+            # Forget rate limit state of idle chats
+            if len(chats) > 2 * len(pending) + 1024:
+                chats = {chat_id: tat for chat_id, tat in chats.items() if tat > now or chat_id in pending}
+
+    def merge_head(self, messages: deque) -> int:
+        """
+        Merge messages waiting after the first one into it, in order, while merged message fits
+        Message which is being retried is sent as is (retry must repeat the same request)
+        :param messages: chat messages, [data, attempt, trace id]
+        :return: merged messages count
+        """
+        head = messages[0]
+        if head[1]:
+            return 0
+        merged = 0
+        while len(messages) > 1:
+            data = self.merge(head[0], messages[1][0])
+            if data is None:
+                break
+            head[0] = data
+            del messages[1]
+            merged += 1
+        if merged:
+            self.coalesced.inc(merged)
+        return merged
+
+    def deliver(self, chat_id, message: list):
+        """
+        Send one message
+        :param chat_id: user chat id
+        :param message: [data, attempt, trace id]
+        :return: None if message is done (sent or dropped), otherwise seconds to wait before retry
+        """
+        data, attempt, _ = message
+        with self.limit_lock:
+            delay, self.limit_tat = self.limit.reserve(self.limit_tat, time.monotonic())
+        if delay:
+            time.sleep(delay)
+
+        started = time.perf_counter()
+        try:
+            resp = self.session.post(self.url, timeout=self.timeout, **self.encode(data))
+        except requests.RequestException as e:
+            Metrics().counter('outbox_sends_total', api=self.api, status='error').inc()
+            error, retry_after = f"{e}", self.backoff * 2 ** attempt
+        else:
+            self.send_seconds.observe(time.perf_counter() - started)
+            Metrics().counter('outbox_sends_total', api=self.api, status=str(resp.status_code)).inc()
+            error, retry_after = self.check(resp, self.backoff * 2 ** attempt)
+            if error is None:
+                return None
+
+        message[1] = attempt = attempt + 1
+        if retry_after is None or attempt >= self.retries:
+            self.logger.warning(f"Message to chat {chat_id} dropped -> {error}")
+            return None
+        return retry_after
+
+    @staticmethod
+    def form(data: dict) -> dict:
+        return {'data': data}
+
+    @classmethod
+    def check_response(cls, resp, backoff: float):
+        """
+        Http status based delivery result (Telegram): 429 waits for "retry_after", server errors back off
+        :param resp: response
+        :param backoff: seconds before retry of this attempt
+        :return: (error or None if delivered, seconds before retry or None to drop message)
+        """
+        if resp.status_code < 400:
+            return None, None
+        error = f"{resp.status_code} {resp.text}"
+        if resp.status_code == 429:
+            return error, cls.get_retry_after(resp)
+        if resp.status_code >= 500:
+            return error, backoff
+        return error, None
+
+    @staticmethod
+    def get_retry_after(resp) -> float:
+        """
+        Get "retry_after" from 429 response
+        :param resp: response
+        :return:
+        """
+        try:
+            return float(resp.json()['parameters']['retry_after'])
+        except (ValueError, KeyError, TypeError):
+            return float(resp.headers.get('Retry-After', 1))
@@ -1,68 +1,188 @@
-import requests
 import flask
 from src.api import Api
 from flask import request
-from src.intents.pizza import Pizza
-import json
+from src.utils.metrics import Metrics
+from src.utils.tracing import trace, new_trace_id
+import re
 import time
-from threading import Thread, Lock
+import requests
+from threading import Thread, Event
 
 
 class Telegram(Api):
     """
     Telegram api(no libs)
     """
-    def __init__(self, token: str, api: str, webhook: str):
+    name = 'telegram'
+    rate_limits = {'rate': 30, 'chat_rate': 1, 'chat_burst': 3}    # Bot api limits: 30 messages/s, about 1/s per chat
+
+    update_id_pattern = re.compile(rb'"update_id"\s*:\s*(\d+)')   # Update id in raw webhook body
+
+    def __init__(self, token: str, api: str, webhook: str, outbox: dict = None, sessions: dict = None, dispatcher: dict = None,
+                 dedup: dict = None, mode: str = 'webhook', polling: dict = None, cold_start: bool = False,
+                 orders: dict = None, router: dict = None, admission: dict = None):
         super().__init__()
         self.token = token                              # Bot token
         self.api = api                                  # Telegram api url
         self.webhook = webhook                          # Webhook
         self.telegram_url = f"{self.api}{self.token}"   # api + token
-        self.clients = {}                               # Simple clients dict
+
+        # Sessions, transport, router, orders, dispatcher, admission and dedup (see Api.setup for options)
+        self.setup(
+            f"{self.telegram_url}/sendMessage", outbox=outbox, sessions=sessions, dispatcher=dispatcher, dedup=dedup,
+            router=router, orders=orders, admission=admission, cold_start=cold_start,
+        )
+
+        # Updates ingestion: "webhook" or "polling" (getUpdates, options: limit, timeout)
+        self.mode = mode
+        self.polling = {'limit': 100, 'timeout': 30, **(polling or {})}
+        self.polling_stop = Event()
+        self.poller = None
 
     def register(self, app: flask.Flask):
         """
         Register url rule for this api webhook
+        In polling mode webhook is removed and updates are fetched in background instead
+        In cold start mode route is registered before webhook is set (see warm_up)
         :return:
         """
+        Metrics().collector(self.collect_metrics)
+        if self.mode == 'polling':
+            self.start_polling()
+            return
+        if self.cold_start:
+            app.add_url_rule('/telegram', 'telegram', self.receive_message, methods=["POST"])
+            self.start_warm_up()
+            return
         try:
-            self.set_webhook()
+            self.ensure_webhook()
         except Exception as e:
             self.logger.warning(f"Error due to setting telegram webhook -> {e}")
         else:
             app.add_url_rule('/telegram', 'telegram', self.receive_message, methods=["POST"])
 
-    def send_message(self, chat_id, text):
-        """
-        Send message (text only)
-        :param chat_id: user chat id
-        :param text: user text
-        :return:
-        """
-        method = "sendMessage"
-        url = f"{self.telegram_url}/{method}"
-        data = {"chat_id": chat_id, "text": text}
-        requests.post(url, data=data)
+    def message(self, chat_id, text: str) -> dict:
+        return {"chat_id": chat_id, "text": text}
 
     def set_webhook(self):
         """
         Try set webhook
         :return:
         """
-        method = "setWebhook"
-        url = f"{self.telegram_url}/{method}"
-        resp = requests.post(url, data={"url": self.webhook})
-        resp = json.loads(resp.text)
+        resp = self.call(f"{self.telegram_url}/setWebhook", data={"url": self.webhook})
         if resp['ok']:
             self.logger.info('Webhook was set!')
         else:
             raise Exception(f"Cannot set webhook -> {resp}")
 
+    def get_webhook(self) -> str:
+        """
+        Current webhook url
+        :return: empty string if webhook is not set
+        """
+        resp = self.call(f"{self.telegram_url}/getWebhookInfo")
+        if not resp['ok']:
+            raise Exception(f"Cannot get webhook info -> {resp}")
+        return resp['result'].get('url', '')
+
+    def ensure_webhook(self):
+        """
+        Set webhook unless it is already set to the same url (restarts do not reset it)
+        :return:
+        """
+        if self.get_webhook() == self.webhook:
+            self.logger.info('Webhook is already set')
+        else:
+            self.set_webhook()
+
+    def warm_up(self):
+        """
+        Off request path startup work: train router, build intents machines and classifiers, set webhook
+        :return:
+        """
+        super().warm_up()
+        try:
+            self.ensure_webhook()
+        except Exception as e:
+            self.logger.warning(f"Error due to setting telegram webhook -> {e}")
+
+    def delete_webhook(self):
+        """
+        Remove webhook (getUpdates is not available while webhook is set)
+        :return:
+        """
+        resp = self.call(f"{self.telegram_url}/deleteWebhook")
+        if not resp['ok']:
+            raise Exception(f"Cannot delete webhook -> {resp}")
+
+    def start_polling(self):
+        """
+        Start getUpdates polling thread
+        :return:
+        """
+        try:
+            self.delete_webhook()
+        except Exception as e:
+            self.logger.warning(f"Error due to deleting telegram webhook -> {e}")
+        self.polling_stop.clear()
+        self.poller = Thread(target=self.poll, name="Telegram-poller")
+        self.poller.start()
+
+    def stop_polling(self):
+        """
+        Stop polling thread (after current long poll request)
+        :return:
+        """
+        self.polling_stop.set()
+        if self.poller is not None:
+            self.poller.join()
+            self.poller = None
+
+    def join(self):
+        if self.poller is not None:
+            self.poller.join()
+
+    def close(self):
+        """
+        Stop polling, then finish in-flight work (see Api.close)
+        :return:
+        """
+        self.stop_polling()
+        super().close()
+
+    def poll(self):
+        """
+        Long polling loop
+        Updates are fetched in batches, offset confirms every handled batch
+        :return:
+        """
+        url = f"{self.telegram_url}/getUpdates"
+        offset = None
+        session = requests.Session()    # Own keep-alive connection, long poll should not hold outbox connections
+        while not self.polling_stop.is_set():
+            data = {"offset": offset, "limit": self.polling['limit'], "timeout": self.polling['timeout']}
+            try:
+                resp = session.post(url, data=data, timeout=self.polling['timeout'] + 10).json()
+                if not resp['ok']:
+                    raise Exception(resp)
+            except Exception as e:
+                self.logger.warning(f"Error due to getting telegram updates -> {e}")
+                self.polling_stop.wait(1)
+                continue
+            updates = resp['result']
+            if updates:
+                offset = updates[-1]['update_id'] + 1
+                self.handle_updates(updates)
+        session.close()
+
+    def is_start(self, text: str) -> bool:
+        return text == '/start'
+
     def message_handle(self, chat_id, text):
         """
         Handling message from user
         User is new if message = "/start"
-        Otherwise create or continue user intent (only pizza intent available)
+        Otherwise continue user intent or start the one picked by router
         :param chat_id: user chat id
         :param text: user text
         :return:
@@ -70,31 +190,55 @@ class Telegram(Api):
         if text == '/start':
             self.send_message(chat_id, text="Привет! Напишите любой текст, чтобы начать заказывать пиццу. Если захотите прервать диалог напишите \"Выход\"")
         else:
-            # Here should be intent recognition module(ai, simple rules) but in this case only pizza intent is available
-            if chat_id not in self.clients:
-                self.clients[chat_id] = Pizza(self)
-            client_intent = self.clients.get(chat_id)
-            client_intent.next(chat_id=chat_id, text=text)
+            super().message_handle(chat_id, text)
 
     def receive_message(self):
         """
         Webhook callback
         Every message handling by this method
         Message will be skipped if it is not text type message
+        Handling is queued on chat dispatcher shard, so telegram gets response immediately
+        Over admission budget handling is deferred or shed (see Admission), response is not delayed either way
+        Redelivered updates are dropped by update_id before body is parsed
         :return:
         """
-        self.logger.info(f"Get updates: {request.json}")
-        try:
-            chat_id = request.json["message"]["chat"]["id"]
-        except KeyError as e:
-            self.logger.warning(f"Message skipped due to chat_id does not present")
-        else:
-            try:
-                text = request.json["message"]["text"]
-            except KeyError as e:
-                self.send_message(chat_id, text="Я понимаю только текстовые сообщения!")
-            else:
-                self.logger.info(f"Get message: chat_id: {chat_id} text: {text}")
-                self.message_handle(chat_id, text)
+        started = time.perf_counter()
+        match = self.update_id_pattern.search(request.get_data())
+        if match and self.is_duplicate(int(match.group(1))):
+            return {'ok': True}
 
+        update = request.json
+        Metrics().histogram('telegram_update_parse_seconds').observe(time.perf_counter() - started)
+        self.handle_update(update)
         return {'ok': True}
+
+    def handle_updates(self, updates: list):
+        """
+        Handle batch of updates (getUpdates result)
+        :param updates: updates
+        :return:
+        """
+        for update in updates:
+            if not self.is_duplicate(update['update_id']):
+                self.handle_update(update)
+
+    def handle_update(self, update: dict):
+        """
+        Handle single update (same path for webhook and polling)
+        Update gets trace id, it follows update through dispatcher, intent callbacks and outbox
+        :param update: update
+        :return:
+        """
+        with trace(new_trace_id()), self.profiler.update(self.name, update):
+            self.logger.info("Get updates: %s", update, extra={'category': 'update'})      # Payload is formatted only if written
+            try:
+                chat_id = update["message"]["chat"]["id"]
+            except KeyError:
+                self.handle_skipped("chat_id does not present")
+            else:
+                try:
+                    text = update["message"]["text"]
+                except KeyError:
+                    self.handle_non_text(chat_id)
+                else:
+                    self.handle_text(chat_id, text)
@@ -1,15 +1,134 @@
+import flask
+import random
+from flask import request
 from src.api import Api
+from src.utils.metrics import Metrics
+from src.utils.tracing import trace, new_trace_id
 
 
 class Vk(Api):
     """
-    Vk not implemented
+    Vk community bot: Callback API webhook, replies by messages.send
     """
-    def register(self):
-        raise NotImplementedError
+    name = 'vk'
+    rate_limits = {'rate': 20, 'chat_rate': 1, 'chat_burst': 3}    # Community token: 20 calls/s
 
-    def send_message(self, chat_id, text):
-        raise NotImplementedError
+    text_field = 'message'
+    bulk_size = 100                 # Max peer_ids of one messages.send
+    retry_errors = {1, 6, 10}       # Unknown error, too many requests per second, internal server error
+
+    def __init__(self, token: str, confirmation: str, api: str = 'https://api.vk.com/method', version: str = '5.131',
+                 secret: str = None, group_id: int = None, outbox: dict = None, sessions: dict = None,
+                 dispatcher: dict = None, dedup: dict = None, cold_start: bool = False, orders: dict = None,
+                 router: dict = None, admission: dict = None):
+        """
+        :param token: community access token
+        :param confirmation: string Callback API server confirmation returns
+        :param api: Vk api url
+        :param version: api version
+        :param secret: Callback API secret key (events without it are rejected)
+        :param group_id: community id (events of other communities are rejected)
+        """
+        super().__init__()
+        self.token = token
+        self.confirmation = confirmation
+        self.api = api
+        self.version = version
+        self.secret = secret
+        self.group_id = group_id
+
+        # Sessions, transport, router, orders, dispatcher, admission and dedup (see Api.setup for options)
+        self.setup(
+            f"{self.api}/messages.send", outbox=outbox, sessions=sessions, dispatcher=dispatcher, dedup=dedup,
+            router=router, orders=orders, admission=admission, cold_start=cold_start, check=self.check_response,
+        )
+
+    def register(self, app: flask.Flask):
+        """
+        Register Callback API url rule
+        :return:
+        """
+        Metrics().collector(self.collect_metrics)
+        app.add_url_rule('/vk', 'vk', self.receive_message, methods=["POST"])
+        if self.cold_start:
+            self.start_warm_up()
+
+    def message(self, chat_id, text: str) -> dict:
+        # random_id makes retried sends idempotent (Vk drops a repeated random_id)
+        return {'access_token': self.token, 'v': self.version, 'peer_id': chat_id, 'message': text,
+                'random_id': random.getrandbits(31)}
+
+    def send_bulk(self, chat_ids: list, text: str):
+        """
+        Send the same text to many chats, up to bulk_size chats per messages.send
+        :param chat_ids: user chat ids
+        :param text: text
+        :return:
+        """
+        for start in range(0, len(chat_ids), self.bulk_size):
+            peers = chat_ids[start:start + self.bulk_size]
+            data = self.message(peers[0], text)
+            del data['peer_id']
+            data['peer_ids'] = ','.join(str(peer) for peer in peers)
+            self.outbox.put(('bulk', peers[0]), data)
+
+    def merge(self, first: dict, second: dict):
+        if 'peer_ids' in first or 'peer_ids' in second:     # Bulk messages go to different peers
+            return None
+        return super().merge(first, second)
+
+    @classmethod
+    def check_response(cls, resp, backoff: float):
+        """
+        Vk reports errors in 200 responses
+        :param resp: response
+        :param backoff: seconds before retry of this attempt
+        :return: (error or None if delivered, seconds before retry or None to drop message)
+        """
+        if resp.status_code >= 500 or resp.status_code == 429:
+            return f"{resp.status_code} {resp.text}", backoff
+        try:
+            error = resp.json().get('error')
+        except ValueError:
+            return f"{resp.status_code} {resp.text}", backoff
+        if error is None:
+            return None, None
+        return f"{error.get('error_code')} {error.get('error_msg')}", backoff if error.get('error_code') in cls.retry_errors else None
 
     def receive_message(self):
-        raise NotImplementedError
+        """
+        Callback API webhook
+        Confirmation request gets confirmation string, every other event gets "ok" (Vk resends events otherwise)
+        Redelivered events are dropped by event_id
+        :return:
+        """
+        event = request.get_json(silent=True) or {}
+        if self.secret is not None and event.get('secret') != self.secret:
+            return 'forbidden', 403
+        if self.group_id is not None and event.get('group_id') != self.group_id:
+            return 'forbidden', 403
+        if event.get('type') == 'confirmation':
+            return self.confirmation
+        if event.get('event_id') is not None and self.is_duplicate(event['event_id']):
+            return 'ok'
+        if event.get('type') == 'message_new':
+            self.handle_event(event)
+        return 'ok'
+
+    def handle_event(self, event: dict):
+        """
+        Handle message_new event
+        :param event: Callback API event
+        :return:
+        """
+        with trace(new_trace_id()), self.profiler.update(self.name, event):
+            self.logger.info("Get updates: %s", event, extra={'category': 'update'})
+            message = event.get('object', {})
+            message = message.get('message', message)      # Api 5.103+ wraps message with client info
+            chat_id = message.get('peer_id')
+            if chat_id is None:
+                self.handle_skipped("peer_id does not present")
+            elif not message.get('text'):
+                self.handle_non_text(chat_id)
+            else:
+                self.handle_text(chat_id, message['text'])
@@ -0,0 +1,25 @@
+import time
+
+
+def timeit(func, number: int) -> float:
+    """
+    Simple timer
+    :param func: callable without arguments
+    :param number: calls count
+    :return: seconds spent for all calls
+    """
+    started = time.perf_counter()
+    for _ in range(number):
+        func()
+    return time.perf_counter() - started
+
+
+def percentile(values: list, q: float) -> float:
+    """
+    Nearest rank percentile
+    :param values: samples
+    :param q: quantile (0.99 for p99)
+    :return:
+    """
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)] if values else 0.0
@@ -0,0 +1,68 @@
+"""
+Overload benchmark: /telegram latency when updates arrive faster than they are handled
+Updates handling is slowed down to a fixed cost, load is a multiple of the rate handling keeps up with.
+Admission control is compared with the plain dispatcher (queue fills up, webhook waits for free space)
+Usage: python -m src.benchmarks.admission [-n 1000] [--work 0.02] [--load 1 2 5 10]
+"""
+import time
+import argparse
+from src.bot import Bot
+from src.benchmarks import percentile
+from src.tests.servers import FakeTelegram
+from src.tests.test_admission import SlowTelegram
+from src.utils.logger import Logger
+
+MODES = {
+    'admission': {'budget': 50, 'new_share': 0.5, 'deferred': 200},
+    'unbounded': {'budget': 10 ** 9, 'deferred': 0},
+}
+
+
+def run(fake: FakeTelegram, admission: dict, number: int, load: float, work: float) -> dict:
+    """
+    Post updates at load times handling capacity
+    :return:
+    """
+    SlowTelegram.work = work
+    telegram = SlowTelegram(
+        token=fake.token, api=fake.api, webhook='http://127.0.0.1/telegram',
+        outbox={'rate': 0, 'chat_rate': 0}, dispatcher={'shards': 2, 'queue_size': 200}, admission=admission,
+    )
+    bot = Bot()
+    bot.register(telegram)
+    client = bot.get_app().test_client()
+    interval = 1 / (len(telegram.dispatcher.shards) / work * load)
+    latencies = []
+    started = time.perf_counter()
+    for i in range(number):
+        time.sleep(max(started + i * interval - time.perf_counter(), 0))
+        sent = time.perf_counter()
+        client.post('/telegram', json={'update_id': i + 1, 'message': {'chat': {'id': i}, 'text': 'привет'}})
+        latencies.append(time.perf_counter() - sent)
+    telegram.close()
+    return {
+        'p50': percentile(latencies, 0.5) * 1000,
+        'p99': percentile(latencies, 0.99) * 1000,
+        'max': max(latencies) * 1000,
+        **telegram.admission.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="overload benchmark")
+    parser.add_argument('-n', '--number', type=int, default=1000, help='updates per run')
+    parser.add_argument('--work', type=float, default=0.02, help='seconds handling of an update takes')
+    parser.add_argument('--load', type=float, nargs='+', default=[1, 2, 5, 10], help='load multiples of capacity')
+    args = parser.parse_args()
+
+    Logger().configure(level='ERROR')
+    with FakeTelegram() as fake:
+        for load in args.load:
+            for name, admission in MODES.items():
+                result = run(fake, admission, args.number, load, args.work)
+                print(f"load x{load:<4g} {name:<10} p50 {result['p50']:>8.2f} ms p99 {result['p99']:>8.2f} ms "
+                      f"max {result['max']:>8.2f} ms deferred {result['deferred']:>6} shed {result['shed']:>6}")
+
+
+if __name__ == '__main__':
+    main()
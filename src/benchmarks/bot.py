@@ -0,0 +1,251 @@
+"""
+Whole bot benchmark: synthetic or replayed updates driven through the Flask /telegram route or the Pizza FSM directly
+Reports throughput, latency percentiles and memory per active chat, results are saved as JSON to diff between commits
+Usage: python -m src.benchmarks.bot [--runner flask|fsm|all] [-n 10000] [--chats 1000] [--replay updates.jsonl]
+                                    [--output-dir .benchmarks] [--compare old.json]
+"""
+import os
+import gc
+import sys
+import json
+import time
+import platform
+import argparse
+import subprocess
+import tracemalloc
+from src.benchmarks import percentile
+from src.benchmarks.updates import UpdateGenerator, read_updates
+from src.intents.pizza import Pizza
+from src.utils.logger import Logger
+
+
+class RecordingApi:
+    """
+    Messenger api stand-in for FSM runner, counts replies
+    """
+    orders = None
+
+    def __init__(self):
+        self.replies = 0
+
+    def send_message(self, chat_id, text):
+        self.replies += 1
+
+
+class FsmRunner:
+    """
+    Updates handled by Pizza sessions directly (no http, no threads)
+    """
+    name = 'fsm'
+
+    def __enter__(self):
+        self.api = RecordingApi()
+        self.sessions = {}
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def prepare(self, update: dict):
+        return update
+
+    def handle(self, update: dict):
+        message = update.get('message', {})
+        chat_id = message.get('chat', {}).get('id')
+        text = message.get('text')
+        if chat_id is None:
+            return
+        if text is None or text == '/start':
+            self.api.send_message(chat_id, '')
+            return
+        intent = self.sessions.get(chat_id)
+        if intent is None:
+            intent = self.sessions[chat_id] = Pizza(self.api)
+        intent.next(chat_id=chat_id, text=text)
+
+    def finish(self):
+        pass
+
+    @property
+    def chats(self) -> int:
+        return len(self.sessions)
+
+    @property
+    def replies(self) -> int:
+        return self.api.replies
+
+
+class FlaskRunner:
+    """
+    Updates posted to /telegram of in-process Flask app, replies are sent to local fake Telegram api
+    Latency is webhook response time, throughput counts until every reply is delivered
+    """
+    name = 'flask'
+
+    def __enter__(self):
+        from src.bot import Bot
+        from src.api.telegram import Telegram
+        from src.tests.servers import FakeTelegram
+
+        self.telegram = FakeTelegram().__enter__()
+        self.api = Telegram(
+            token=self.telegram.token, api=self.telegram.api, webhook='http://127.0.0.1/telegram',
+            outbox={'rate': 0, 'chat_rate': 0},
+        )
+        bot = Bot()
+        bot.register(self.api)
+        self.client = bot.get_app().test_client()
+        return self
+
+    def __exit__(self, *args):
+        self.api.close()
+        self.telegram.__exit__(*args)
+
+    def prepare(self, update: dict):
+        return json.dumps(update, ensure_ascii=False).encode('utf-8')     # Request body is built before timing
+
+    def handle(self, body: bytes):
+        self.client.post('/telegram', data=body, content_type='application/json')
+
+    def finish(self):
+        self.api.dispatcher.join()
+        self.api.outbox.flush()
+
+    @property
+    def chats(self) -> int:
+        return len(self.api.clients)
+
+    @property
+    def replies(self) -> int:
+        return len(self.telegram.sent())
+
+
+RUNNERS = {runner.name: runner for runner in (FsmRunner, FlaskRunner)}
+
+
+def run(runner_class, updates: list) -> dict:
+    """
+    Throughput and latency pass
+    :param runner_class: runner
+    :param updates: update dicts
+    :return:
+    """
+    with runner_class() as runner:
+        items = [runner.prepare(update) for update in updates]
+        latencies = []
+        gc.collect()
+        started = time.perf_counter()
+        for item in items:
+            handled = time.perf_counter()
+            runner.handle(item)
+            latencies.append(time.perf_counter() - handled)
+        runner.finish()
+        seconds = time.perf_counter() - started
+        return {
+            'updates': len(items),
+            'seconds': round(seconds, 4),
+            'throughput': round(len(items) / seconds, 1),
+            'latency_ms': {
+                name: round(percentile(latencies, q) * 1000, 4)
+                for name, q in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99), ('max', 1))
+            },
+            'chats': runner.chats,
+            'replies': runner.replies,
+        }
+
+
+def measure_memory(runner_class, updates: list) -> float:
+    """
+    Memory pass (separate, tracemalloc slows handling down)
+    :param runner_class: runner
+    :param updates: update dicts
+    :return: bytes retained per active chat
+    """
+    with runner_class() as runner:
+        items = [runner.prepare(update) for update in updates]
+        for item in items[:1]:
+            runner.handle(item)     # Warm up shared machine and classifier
+        runner.finish()
+        gc.collect()
+        tracemalloc.start()
+        for item in items[1:]:
+            runner.handle(item)
+        runner.finish()
+        gc.collect()
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return round(size / max(runner.chats, 1), 1)
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ''
+    return {'commit': commit or 'unknown', 'python': platform.python_version(), 'machine': platform.machine(), 'cpus': os.cpu_count()}
+
+
+def compare(results: dict, path: str):
+    """
+    Print relative change against saved results
+    :param results: current results
+    :param path: saved results file
+    :return:
+    """
+    with open(path, encoding='utf-8') as file:
+        previous = json.load(file)
+    print(f"compared with {path} (commit {previous.get('environment', {}).get('commit')})")
+    for name, result in results['runners'].items():
+        old = previous.get('runners', {}).get(name)
+        if old is None:
+            continue
+        for metric, new_value, old_value in [
+            ('throughput', result['throughput'], old['throughput']),
+            *((f"latency {q}", result['latency_ms'][q], old['latency_ms'][q]) for q in ('p50', 'p99')),
+            ('memory per chat', result['memory_per_chat'], old['memory_per_chat']),
+        ]:
+            change = (new_value - old_value) / old_value * 100 if old_value else 0.0
+            print(f"{name:<6} {metric:<16} {old_value:>12} -> {new_value:>12} ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="whole bot benchmark")
+    parser.add_argument('--runner', choices=[*RUNNERS, 'all'], default='all', help='runner')
+    parser.add_argument('-n', '--number', type=int, default=10000, help='synthetic updates count')
+    parser.add_argument('--chats', type=int, default=1000, help='synthetic concurrent dialogs')
+    parser.add_argument('--seed', type=int, default=1, help='synthetic updates random seed')
+    parser.add_argument('--replay', help='JSONL updates log to replay instead of synthetic updates')
+    parser.add_argument('--output-dir', default='.benchmarks', help='directory for JSON results')
+    parser.add_argument('--compare', help='JSON results to compare with')
+    args = parser.parse_args()
+
+    Logger().configure(level='WARNING')     # Update logs would measure stdout instead of bot
+    if args.replay:
+        updates = list(read_updates(args.replay))
+        source = {'replay': args.replay}
+    else:
+        updates = list(UpdateGenerator(chats=args.chats, seed=args.seed).generate(args.number))
+        source = {'synthetic': {'number': args.number, 'chats': args.chats, 'seed': args.seed}}
+
+    results = {'environment': environment(), 'source': source, 'runners': {}}
+    names = list(RUNNERS) if args.runner == 'all' else [args.runner]
+    for name in names:
+        result = run(RUNNERS[name], updates)
+        result['memory_per_chat'] = measure_memory(RUNNERS[name], updates)
+        results['runners'][name] = result
+        print(f"{name:<6} {result['throughput']:>10.0f} updates/s p50 {result['latency_ms']['p50']:>8.3f} ms "
+              f"p99 {result['latency_ms']['p99']:>8.3f} ms {result['memory_per_chat']:>8.0f} bytes/chat "
+              f"({result['chats']} chats, {result['replies']} replies)")
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    path = os.path.join(args.output_dir, f"bot-{results['environment']['commit']}-{int(time.time())}.json")
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(results, file, indent=2)
+    print(f"results saved to {path}", file=sys.stderr)
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Message classification benchmark (rules evaluation of a single Pizza.next call)
+Usage: python -m src.benchmarks.classifier [-n 100000]
+"""
+import argparse
+import re
+from src.benchmarks import timeit
+from src.intents.pizza import Pizza
+
+MESSAGES = [
+    ('ask_pizza_size', 'хочу большую пиццу'),
+    ('ask_pizza_size', 'Гигантскую'),
+    ('ask_payment_method', 'оплачивать буду картой'),
+    ('ask_payment_method', 'Воздухом'),
+    ('ask_order', 'да подтверждаю'),
+    ('ask_order', 'нет не согласен'),
+    ('ask_order', 'что?'),
+    ('ask_payment_method', 'Выход'),
+]
+
+
+def legacy(state, text):
+    """
+    Guards and savers as they were evaluated before the classifier (every check rescans the text)
+    :return:
+    """
+    if any(str(w).lower() == str(text).lower() for w in Pizza.cancel_words):
+        return 'cancel'
+    if state == 'ask_pizza_size':
+        if any(bool(re.search(v, str(text).lower())) for v in Pizza.pizza_size.values()):
+            for size_var, size_pat in Pizza.pizza_size.items():
+                if re.search(size_pat, str(text).lower()):
+                    return size_var
+        return None if not any(bool(re.search(v, str(text).lower())) for v in Pizza.pizza_size.values()) else 'size'
+    if state == 'ask_payment_method':
+        if any(bool(re.search(v, str(text).lower())) for v in Pizza.payment_methods.values()):
+            for payment_var, payment_pat in Pizza.payment_methods.items():
+                if re.search(payment_pat, str(text).lower()):
+                    return payment_var
+        return None if not any(bool(re.search(v, str(text).lower())) for v in Pizza.payment_methods.values()) else 'payment'
+    if any(str(c).lower() in str(text).lower() for c in Pizza.confirmation_words['yes']):
+        return 'yes'
+    if any(str(c).lower() in str(text).lower() for c in Pizza.confirmation_words['no']):
+        return 'no'
+    yes = any(str(c).lower() in str(text).lower() for c in Pizza.confirmation_words['yes'])
+    no = any(str(c).lower() in str(text).lower() for c in Pizza.confirmation_words['no'])
+    return None if not (yes or no) else 'order'
+
+
+def classified(state, text):
+    """
+    Same decisions read from a single classification result
+    :return:
+    """
+    message = Pizza.get_classifier().classify(text)
+    if 'cancel' in message.phrases:
+        return 'cancel'
+    if state == 'ask_pizza_size':
+        return message.slot('size')[0]
+    if state == 'ask_payment_method':
+        return message.slot('payment')[0]
+    if 'yes' in message.words:
+        return 'yes'
+    if 'no' in message.words:
+        return 'no'
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="message classification benchmark")
+    parser.add_argument('-n', '--number', type=int, default=100000, help='messages count')
+    args = parser.parse_args()
+
+    for state, text in MESSAGES:
+        assert legacy(state, text) == classified(state, text), (state, text)
+
+    for name, rules in [('per condition scans', legacy), ('single pass', classified)]:
+        batches = max(args.number // len(MESSAGES), 1)
+        seconds = timeit(lambda: [rules(state, text) for state, text in MESSAGES], batches)
+        print(f"{name:<20} {batches * len(MESSAGES) / seconds:>12.0f} messages/s")
+
+
+if __name__ == '__main__':
+    main()
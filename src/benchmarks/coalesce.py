@@ -0,0 +1,57 @@
+"""
+Reply coalescing benchmark: sendMessage calls of synthetic dialogs for several coalescing windows
+Updates of many concurrent dialogs (sizes, payments, cancels, junk and non-text messages) are handled at a fixed rate,
+replies go to a local fake Telegram api with per chat rate limit, calls saved by merging replies are counted
+Usage: python -m src.benchmarks.coalesce [-n 2000] [--chats 300] [--rate 100] [--windows none 0 0.05 0.2]
+"""
+import time
+import argparse
+from src.api.telegram import Telegram
+from src.benchmarks.updates import UpdateGenerator
+from src.tests.servers import FakeTelegram
+from src.utils.logger import Logger
+from src.utils.metrics import Metrics
+
+
+def run(fake: FakeTelegram, updates: list, rate: float, coalesce) -> dict:
+    """
+    Handle updates at rate per second and deliver every reply
+    :return:
+    """
+    telegram = Telegram(token=fake.token, api=fake.api, webhook='', outbox={'rate': 0, 'coalesce': coalesce})
+    fake.calls.clear()
+    coalesced = Metrics().counter('outbox_coalesced_total', api='telegram').value
+    started = time.perf_counter()
+    for i, update in enumerate(updates):
+        time.sleep(max(started + i / rate - time.perf_counter(), 0))
+        telegram.handle_update(update)
+    telegram.dispatcher.join()
+    telegram.outbox.flush()
+    elapsed = time.perf_counter() - started
+    telegram.close()
+    calls = len(fake.calls)
+    saved = Metrics().counter('outbox_coalesced_total', api='telegram').value - coalesced
+    return {'replies': calls + saved, 'calls': calls, 'saved': saved, 'elapsed': elapsed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="reply coalescing benchmark")
+    parser.add_argument('-n', '--number', type=int, default=2000, help='updates')
+    parser.add_argument('--chats', type=int, default=300, help='concurrent dialogs')
+    parser.add_argument('--rate', type=float, default=100, help='updates per second')
+    parser.add_argument('--windows', nargs='+', default=['none', '0', '0.05', '0.2'], help='coalescing windows, seconds')
+    args = parser.parse_args()
+
+    Logger().configure(level='ERROR')
+    updates = list(UpdateGenerator(chats=args.chats).generate(args.number))
+    with FakeTelegram() as fake:
+        for window in args.windows:
+            coalesce = None if window == 'none' else float(window)
+            result = run(fake, updates, args.rate, coalesce)
+            print(f"coalesce {window:<6} replies {result['replies']:>6} sendMessage {result['calls']:>6} "
+                  f"saved {result['saved']:>6} ({result['saved'] / max(result['replies'], 1):>6.1%}) "
+                  f"delivered in {result['elapsed']:>6.2f} s")
+
+
+if __name__ == '__main__':
+    main()
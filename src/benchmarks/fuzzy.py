@@ -0,0 +1,85 @@
+"""
+Typo tolerant slot matching benchmark: symmetric delete index against a scan of every vocabulary word
+Vocabularies are synthetic menus (words of 6-12 Cyrillic letters), queries are vocabulary words with 1-2 typos
+Usage: python -m src.benchmarks.fuzzy [-n 2000] [--words 10 100 1000 10000]
+"""
+import time
+import random
+import argparse
+from src.intents.fuzzy import FuzzyIndex
+
+ALPHABET = 'абвгдежзиклмнопрстуфхцчшщыэюя'
+
+
+def menu(size: int, rng: random.Random) -> dict:
+    words = {}
+    while len(words) < size:
+        words[''.join(rng.choice(ALPHABET) for _ in range(rng.randint(6, 12)))] = len(words)
+    return words
+
+
+def misspell(word: str, rng: random.Random) -> str:
+    for _ in range(1 if len(word) < 9 else rng.randint(1, 2)):
+        position = rng.randrange(len(word))
+        kind = rng.choice(('delete', 'insert', 'replace', 'swap'))
+        if kind == 'delete':
+            word = word[:position] + word[position + 1:]
+        elif kind == 'insert':
+            word = word[:position] + rng.choice(ALPHABET) + word[position:]
+        elif kind == 'replace':
+            word = word[:position] + rng.choice(ALPHABET) + word[position + 1:]
+        elif position + 1 < len(word):
+            word = word[:position] + word[position + 1] + word[position] + word[position + 2:]
+    return word
+
+
+def scan(index: FuzzyIndex, word: str):
+    """
+    Closest word by distance to every vocabulary word (what matching without index costs)
+    :return:
+    """
+    best = None
+    for candidate in index.words:
+        limit = index.allowed(len(candidate))
+        edits = index.distance(word, candidate, limit)
+        if edits <= limit:
+            key = (edits / len(candidate), index.order[candidate])
+            if best is None or key < best[0]:
+                best = (key, candidate)
+    return None if best is None else (index.words[best[1]], 1.0 - best[0][0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="typo tolerant slot matching benchmark")
+    parser.add_argument('-n', '--number', type=int, default=2000, help='queries per vocabulary')
+    parser.add_argument('--words', type=int, nargs='+', default=[10, 100, 1000, 10000], help='vocabulary sizes')
+    parser.add_argument('--seed', type=int, default=1, help='random seed')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    for size in args.words:
+        words = menu(size, rng)
+        started = time.perf_counter()
+        index = FuzzyIndex(words)
+        build = time.perf_counter() - started
+        targets = rng.choices(list(words), k=args.number)
+        queries = [misspell(word, rng) for word in targets]
+
+        started = time.perf_counter()
+        found = [index.lookup(query) for query in queries]
+        indexed = time.perf_counter() - started
+        hits = sum(result is not None and result[0] == words[target] for result, target in zip(found, targets))
+
+        count = max(args.number * 10 // size, 20)       # Scan is slow, fewer queries for big menus
+        started = time.perf_counter()
+        scanned = [scan(index, query) for query in queries[:count]]
+        scanned_seconds = time.perf_counter() - started
+        assert scanned == found[:count]
+
+        print(f"{size:>6} words build {build * 1000:>8.1f} ms {len(index.index):>8} keys "
+              f"index {len(queries) / indexed:>10.0f} matches/s scan {count / scanned_seconds:>10.0f} matches/s "
+              f"recall {hits / len(queries):.3f}")
+
+
+if __name__ == '__main__':
+    main()
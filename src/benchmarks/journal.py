@@ -0,0 +1,50 @@
+"""
+Orders journal append throughput (durable orders per second) by concurrent confirming threads
+One thread is the fsync per order case, more threads share fsyncs (group commit)
+Usage: python -m src.benchmarks.journal [-n 2000] [--threads 1 4 16 64]
+"""
+import os
+import time
+import argparse
+import tempfile
+from threading import Thread
+from src.orders import OrderJournal
+
+
+def measure(path: str, number: int, threads: int):
+    """
+    :return: (orders per second, orders per fsync)
+    """
+    journal = OrderJournal(path)
+    order = {'chat_id': 123456789, 'size': 'большую', 'payment': 'картой', 'time': time.time(), 'trace_id': '0123456789abcdef'}
+
+    def confirm():
+        for _ in range(number // threads):
+            journal.append(order)
+
+    workers = [Thread(target=confirm) for _ in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    seconds = time.perf_counter() - started
+    journal.close()
+    appended = number // threads * threads
+    return appended / seconds, appended / max(journal.syncs, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="orders journal benchmark")
+    parser.add_argument('-n', '--number', type=int, default=2000, help='orders count')
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 4, 16, 64], help='confirming threads')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir='.') as directory:
+        for threads in args.threads:
+            rate, batch = measure(os.path.join(directory, f"orders-{threads}.jsonl"), args.number, threads)
+            print(f"{threads:>4} threads {rate:>10.0f} orders/s {batch:>8.1f} orders per fsync")
+
+
+if __name__ == '__main__':
+    main()
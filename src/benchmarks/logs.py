@@ -0,0 +1,74 @@
+"""
+Logging overhead per handled message
+"caller" is time spent by handling thread in log calls, "background" is time the listener needs to write them
+(listener is started after caller loop, so both are measured without competing for GIL)
+Usage: python -m src.benchmarks.logs [-n 50000]
+"""
+import os
+import logging
+import argparse
+from queue import Queue
+from logging.handlers import QueueListener
+from src.benchmarks import timeit
+from src.utils.logger import Logger, DeferredQueueHandler, CategoryLimiter, JsonFormatter
+
+UPDATE = {'update_id': 1, 'message': {'message_id': 1, 'from': {'id': 1, 'first_name': 'Иван'}, 'chat': {'id': 1, 'type': 'private'}, 'date': 0, 'text': 'хочу большую пиццу'}}
+
+
+def legacy_message(logger):
+    # Log calls of a message before the pipeline (eager f-strings, synchronous handler)
+    logger.info(f"Get updates: {UPDATE}")
+    logger.info(f"Get message: chat_id: {1} text: {'хочу большую пиццу'}")
+    logger.info(f'Change state to: \"{"ask_pizza_size"}\"')
+
+
+def message(logger):
+    logger.info("Get updates: %s", UPDATE, extra={'category': 'update'})
+    logger.info("Get message: chat_id: %s text: %s", 1, 'хочу большую пиццу', extra={'category': 'update'})
+    logger.info('Change state to: "%s"', "ask_pizza_size", extra={'category': 'state'})
+
+
+def build(name: str, queued: bool, formatter: logging.Formatter, level=logging.INFO, limits: dict = None):
+    devnull = open(os.devnull, 'w')
+    handler = logging.StreamHandler(devnull)
+    handler.setFormatter(formatter)
+    logger = logging.getLogger(f"benchmark.{name}")
+    logger.propagate = False
+    logger.setLevel(level)
+    listener = None
+    if queued:
+        queue = Queue(maxsize=0)
+        logger.addHandler(DeferredQueueHandler(queue))
+        listener = QueueListener(queue, handler)
+    else:
+        logger.addHandler(handler)
+    if limits:
+        logger.addFilter(CategoryLimiter(limits))
+    return logger, listener
+
+
+def main():
+    parser = argparse.ArgumentParser(description="logging overhead benchmark")
+    parser.add_argument('-n', '--number', type=int, default=50000, help='messages count')
+    args = parser.parse_args()
+
+    text = Logger.text_formatter
+    cases = [
+        ('sync stream', legacy_message, False, text, logging.INFO, None),
+        ('queue', message, True, text, logging.INFO, None),
+        ('queue json', message, True, JsonFormatter(), logging.INFO, None),
+        ('queue limited', message, True, text, logging.INFO, {'update': 100, 'state': 100}),
+        ('level warning', message, True, text, logging.WARNING, None),
+    ]
+    for name, func, queued, formatter, level, limits in cases:
+        logger, listener = build(name.replace(' ', '_'), queued, formatter, level, limits)
+        seconds = timeit(lambda: func(logger), args.number)
+        background = 0.0
+        if listener is not None:
+            background = timeit(lambda: (listener.start(), listener.stop()), 1)
+        print(f"{name:<15} caller {seconds / args.number * 1e6:>8.2f} us/message "
+              f"background {background / args.number * 1e6:>8.2f} us/message")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Multi-process throughput with shared sessions store
+Every process handles dialog messages of random chats through SQLite store shared by all processes
+Usage: python -m src.benchmarks.processes [-p 4] [-n 5000] [--chats 1000]
+"""
+import os
+import time
+import random
+import argparse
+import tempfile
+import multiprocessing
+from src.intents.pizza import Pizza
+from src.sessions import SessionStore
+from src.sessions.sqlite import SqliteBackend
+
+TEXTS = ['привет', 'большую', 'картой', 'да']
+
+
+class NullApi:
+    """
+    Api stub, replies are not sent, orders are not journaled
+    """
+    orders = None
+
+    def send_message(self, chat_id, text):
+        pass
+
+
+def worker(path: str, number: int, chats: int, seed: int):
+    api = NullApi()
+    store = SessionStore(api, backend=SqliteBackend(path, shared=True))
+    rnd = random.Random(seed)
+    for _ in range(number):
+        chat_id = rnd.randrange(chats)
+        with store.lock_chat(chat_id):
+            intent = store.get(chat_id) or Pizza(api)
+            intent.next(chat_id=chat_id, text=rnd.choice(TEXTS))
+            store.put(chat_id, intent)
+    store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="multi-process shared sessions benchmark")
+    parser.add_argument('-p', '--processes', type=int, default=os.cpu_count(), help='max processes')
+    parser.add_argument('-n', '--number', type=int, default=5000, help='messages per process')
+    parser.add_argument('--chats', type=int, default=1000, help='chats count')
+    args = parser.parse_args()
+
+    Pizza.get_machine()     # Built before fork, shared by children
+    Pizza.get_classifier()
+    Pizza.logger.disabled = True
+    context = multiprocessing.get_context('fork')
+    with tempfile.TemporaryDirectory() as directory:
+        for processes in range(1, args.processes + 1):
+            path = os.path.join(directory, f"sessions-{processes}.db")
+            SqliteBackend(path, shared=True).close()
+            workers = [context.Process(target=worker, args=(path, args.number, args.chats, seed)) for seed in range(processes)]
+            started = time.perf_counter()
+            for process in workers:
+                process.start()
+            for process in workers:
+                process.join()
+            seconds = time.perf_counter() - started
+            print(f"processes {processes:>3} {processes * args.number / seconds:>10.0f} messages/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Profiler overhead benchmark: updates handling time with profiler off, slow updates capture and call stacks sampling
+Synthetic dialog updates are handled by Telegram api (receive, dispatcher, Pizza FSM, outbox to local fake Telegram api),
+every mode is run several times interleaved and the best run is taken. Cost of profiler hooks when it is off is timed apart
+Usage: python -m src.benchmarks.profiler [-n 5000] [--chats 500] [--repeat 3] [--sample 1000 100 10]
+"""
+import time
+import argparse
+from src.api.telegram import Telegram
+from src.benchmarks import timeit
+from src.benchmarks.updates import UpdateGenerator
+from src.tests.servers import FakeTelegram
+from src.utils.logger import Logger
+from src.utils.profiler import Profiler, current_profile
+
+
+def run(fake: FakeTelegram, updates: list) -> float:
+    """
+    Handle updates until every one is handled
+    :return: seconds per update
+    """
+    telegram = Telegram(token=fake.token, api=fake.api, webhook='', outbox={'rate': 0, 'chat_rate': 0})
+    telegram.handle_updates(updates[:100])     # Build classifiers and start threads before timing
+    telegram.dispatcher.join()
+    started = time.perf_counter()
+    telegram.handle_updates(updates[100:])
+    telegram.dispatcher.join()
+    seconds = time.perf_counter() - started
+    telegram.close()
+    return seconds / (len(updates) - 100)
+
+
+def off_hooks(number: int) -> float:
+    """
+    Profiler hooks of one update when profiler is off: update context and two profile lookups (dispatcher, intent)
+    :return: seconds per update
+    """
+    profiler = Profiler()
+    update = {'update_id': 1}
+
+    def hooks():
+        with profiler.update('telegram', update):
+            pass
+        current_profile.get()
+        current_profile.get()
+    return (timeit(hooks, number) - timeit(lambda: None, number)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description="profiler overhead benchmark")
+    parser.add_argument('-n', '--number', type=int, default=5000, help='updates per run')
+    parser.add_argument('--chats', type=int, default=500, help='concurrent dialogs')
+    parser.add_argument('--repeat', type=int, default=3, help='runs of every mode')
+    parser.add_argument('--sample', type=int, nargs='+', default=[1000, 100, 10], help='sampling rates (1 in N updates)')
+    args = parser.parse_args()
+
+    Logger().configure(level='ERROR')
+    modes = {'off': {}, 'slow capture': {'slow_threshold': 1.0}}
+    modes.update({f"sample 1/{every}": {'sample_every': every, 'slow_threshold': 1.0} for every in args.sample})
+    updates = list(UpdateGenerator(chats=args.chats).generate(args.number + 100))
+    best = {}
+    with FakeTelegram() as fake:
+        for _ in range(args.repeat):
+            for name, options in modes.items():
+                Profiler().configure(**options)
+                seconds = run(fake, updates)
+                best[name] = min(best.get(name, seconds), seconds)
+    Profiler().configure()
+
+    for name, seconds in best.items():
+        print(f"{name:<14} {seconds * 1e6:>8.1f} us/update {seconds / best['off'] - 1:>+8.1%}")
+    print(f"hooks when off {off_hooks(100000) * 1e9:>8.0f} ns/update")
+
+
+if __name__ == '__main__':
+    main()
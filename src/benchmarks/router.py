@@ -0,0 +1,84 @@
+"""
+Intent routing latency by number of registered intents (single message and micro-batch of messages)
+A micro-batch holds at most one message of every dispatcher shard (route() callers wait for their own result),
+so batches of shards messages are timed, and route() is called from shards threads at once to show batch sizes
+it really forms
+Usage: python -m src.benchmarks.router [-n 2000] [--intents 2 8 32 128 512] [--shards 4]
+"""
+import random
+import argparse
+from threading import Thread
+from src.benchmarks import timeit
+from src.intents import Intent
+from src.intents.router import IntentRouter
+from src.utils.logger import Logger
+
+SYLLABLES = ['ка', 'ро', 'ми', 'ту', 'за', 'ле', 'ны', 'во', 'пи', 'ца', 'ст', 'ор', 'да', 'не', 'бу']
+
+
+def word(rng) -> str:
+    return ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+
+def intents(number: int, rng) -> list:
+    """
+    Synthetic intents with own vocabulary
+    :param number: intents count
+    :param rng: random source
+    :return:
+    """
+    classes = []
+    for index in range(number):
+        vocabulary = [word(rng) for _ in range(8)]
+        examples = [' '.join(rng.sample(vocabulary, 3)) for _ in range(10)]
+        classes.append(type(f"Benchmark{index}", (Intent,), {'examples': examples}))
+    return classes
+
+
+def route_concurrently(router: IntentRouter, texts: list, shards: int) -> float:
+    """
+    Route texts from shards threads at once
+    :return: mean batch size
+    """
+    batches, routed = router.batches, router.routed
+
+    def shard(index):
+        for text in texts[index::shards]:
+            router.route(text)
+
+    threads = [Thread(target=shard, args=(index,)) for index in range(shards)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return (router.routed - routed) / max(router.batches - batches, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="intent routing benchmark")
+    parser.add_argument('-n', '--number', type=int, default=2000, help='messages routed')
+    parser.add_argument('--intents', type=int, nargs='+', default=[2, 8, 32, 128], help='intents counts')
+    parser.add_argument('--shards', type=int, default=4, help='dispatcher shards (max micro-batch size)')
+    args = parser.parse_args()
+
+    Logger().configure(level='WARNING')
+    rng = random.Random(1)
+    for number in args.intents:
+        classes = intents(number, rng)
+        router = IntentRouter(classes)
+        training = timeit(router.build, 1)
+        texts = [rng.choice(rng.choice(classes).examples) for _ in range(args.number)]
+        messages = iter(texts * 2)
+        single = timeit(lambda: router.classify([next(messages)]), args.number) / args.number
+        batches = [texts[i:i + args.shards] for i in range(0, len(texts), args.shards)]
+        batched = iter(batches)
+        batch = timeit(lambda: router.classify(next(batched)), len(batches)) / len(texts)
+        correct = sum(intent.examples.count(text) > 0 for text, intent in zip(texts, router.classify(texts))) / len(texts)
+        mean = route_concurrently(router, texts, args.shards)
+        print(f"{number:>5} intents train {training * 1000:>8.1f} ms single {single * 1e6:>8.1f} us/message "
+              f"batch of {args.shards} {batch * 1e6:>8.1f} us/message accuracy {correct:.3f} "
+              f"route batch mean {mean:.2f} max {router.largest}")
+
+
+if __name__ == '__main__':
+    main()
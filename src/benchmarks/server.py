@@ -0,0 +1,63 @@
+"""
+Webhook load test: requests per second and latency percentiles of /telegram for every server mode
+Usage: python -m src.benchmarks.server [-n 5000] [-c 16] [--workers 2] [--threads 8]
+"""
+import argparse
+import time
+import requests
+from threading import Thread
+from src.benchmarks import percentile
+from src.tests.servers import FakeTelegram, BotProcess
+
+
+def load(url: str, number: int, concurrency: int):
+    """
+    Post updates from concurrent keep-alive clients
+    :param url: webhook url
+    :param number: requests count
+    :param concurrency: clients count
+    :return: (requests per second, latencies)
+    """
+    latencies = [[] for _ in range(concurrency)]
+
+    def client(index):
+        session = requests.Session()
+        for i in range(index, number, concurrency):
+            update = {'update_id': i + 1, 'message': {'chat': {'id': i % 1000}, 'text': ('привет', 'большую', 'картой', 'да')[i // 1000 % 4]}}
+            started = time.perf_counter()
+            session.post(url, json=update)
+            latencies[index].append(time.perf_counter() - started)
+        session.close()
+
+    threads = [Thread(target=client, args=(index,)) for index in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - started
+    return number / seconds, [latency for client_latencies in latencies for latency in client_latencies]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="webhook load test")
+    parser.add_argument('-n', '--number', type=int, default=5000, help='requests count')
+    parser.add_argument('-c', '--concurrency', type=int, default=16, help='concurrent clients')
+    parser.add_argument('--workers', type=int, default=1, help='gunicorn workers')
+    parser.add_argument('--threads', type=int, default=8, help='gunicorn threads per worker')
+    args = parser.parse_args()
+
+    modes = [
+        ('flask', {'name': 'flask'}),
+        ('gunicorn', {'name': 'gunicorn', 'workers': args.workers, 'threads': args.threads}),
+    ]
+    with FakeTelegram() as telegram:
+        for name, server in modes:
+            with BotProcess(telegram.api, server=server) as bot:
+                rps, latencies = load(f"{bot.url}/telegram", args.number, args.concurrency)
+            print(f"{name:<10} {rps:>10.0f} requests/s p50 {percentile(latencies, 0.5) * 1000:>8.2f} ms "
+                  f"p99 {percentile(latencies, 0.99) * 1000:>8.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
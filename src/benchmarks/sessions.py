@@ -0,0 +1,56 @@
+"""
+Session footprint benchmark
+Usage: python -m src.benchmarks.sessions [-n 10000]
+"""
+import argparse
+import gc
+import tracemalloc
+from transitions import Machine
+from src.benchmarks import timeit
+from src.intents.pizza import Pizza
+
+
+class LegacyModel:
+    """
+    Model with per-session machine (how Pizza sessions were built before the machine was shared)
+    """
+    def __init__(self):
+        self.machine = Machine(model=self, states=Pizza.states, initial=Pizza.initial, transitions=Pizza.transitions, send_event=True)
+        self.order = {'size': 'большую', 'payment': 'наличкой'}
+
+
+def measure(factory, number: int):
+    """
+    Measure memory and creation time of sessions
+    :param factory: session factory
+    :param number: sessions count
+    :return: (bytes per session, microseconds per session)
+    """
+    gc.collect()
+    tracemalloc.start()
+    sessions = [factory() for _ in range(number)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del sessions
+
+    seconds = timeit(factory, number)
+    return size / number, seconds / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="session footprint benchmark")
+    parser.add_argument('-n', '--number', type=int, default=10000, help='sessions count')
+    args = parser.parse_args()
+
+    Pizza.get_machine()     # Shared machine is built once, exclude it from per session numbers
+
+    for name, factory, number in [
+        ('shared machine', lambda: Pizza(None), args.number),
+        ('machine per session', LegacyModel, max(args.number // 10, 1)),
+    ]:
+        size, micros = measure(factory, number)
+        print(f"{name:<20} {size:>10.0f} bytes/session {micros:>10.2f} us/session")
+
+
+if __name__ == '__main__':
+    main()
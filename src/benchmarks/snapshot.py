@@ -0,0 +1,68 @@
+"""
+Sessions snapshot benchmark: write, open and restore time of compact snapshots
+Usage: python -m src.benchmarks.snapshot [-n 1000000] [--lookups 100000]
+"""
+import os
+import time
+import random
+import argparse
+import tempfile
+from src.benchmarks import timeit
+from src.intents import Intent
+from src.intents.pizza import Pizza
+from src.sessions.snapshot import SnapshotBackend
+from src.utils.logger import Logger
+
+
+def main():
+    parser = argparse.ArgumentParser(description="sessions snapshot benchmark")
+    parser.add_argument('-n', '--number', type=int, default=1000000, help='sessions count')
+    parser.add_argument('--lookups', type=int, default=100000, help='random chat lookups')
+    args = parser.parse_args()
+
+    Logger().configure(level='WARNING')
+    rng = random.Random(1)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'snapshots')
+        backend = SnapshotBackend(path, interval=0)
+        chat_ids = rng.sample(range(1, 1 << 40), args.number)
+        for chat_id in chat_ids:
+            backend.save(chat_id, {
+                'intent': 'Pizza', 'state': rng.choice(Pizza.states),
+                'order': {'size': rng.choice(list(Pizza.pizza_size)), 'payment': rng.choice(list(Pizza.payment_methods))},
+            })
+
+        seconds = timeit(backend.snapshot, 1)
+        size = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+        print(f"write base      {seconds:>8.3f} s   {size / args.number:>6.1f} bytes/chat")
+
+        for chat_id in chat_ids[:args.number // 100]:
+            backend.save(chat_id, {'intent': 'Pizza', 'state': 'start', 'order': {'size': 'большую', 'payment': 'картой'}})
+        seconds = timeit(backend.snapshot, 1)
+        print(f"write delta 1%  {seconds:>8.3f} s")
+        backend.close()
+
+        started = time.perf_counter()
+        backend = SnapshotBackend(path, interval=0)
+        print(f"open            {(time.perf_counter() - started) * 1000:>8.3f} ms (first request is not blocked)")
+
+        lookups = [rng.choice(chat_ids) for _ in range(args.lookups)]
+        started = time.perf_counter()
+        for chat_id in lookups:
+            Intent.restore(None, backend.load(chat_id))
+        seconds = time.perf_counter() - started
+        print(f"restore on hit  {seconds / args.lookups * 1e6:>8.2f} us/chat")
+
+        started = time.perf_counter()
+        restored = 0
+        for segment in backend.segments[-1:]:
+            for row in segment.rows():
+                Intent.restore(None, segment.decode(row))
+                restored += 1
+        seconds = time.perf_counter() - started
+        print(f"restore all     {seconds:>8.3f} s   ({restored} sessions)")
+        backend.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,27 @@
+"""
+Startup time: seconds from process start to first 200 response of /telegram
+Telegram api round-trip is simulated by fake api latency
+Usage: python -m src.benchmarks.startup [-n 5] [--latency 0.2]
+"""
+import argparse
+import statistics
+from src.tests.servers import FakeTelegram, BotProcess
+
+
+def main():
+    parser = argparse.ArgumentParser(description="startup time benchmark")
+    parser.add_argument('-n', '--number', type=int, default=5, help='starts of every mode')
+    parser.add_argument('--latency', type=float, default=0.2, help='telegram api round-trip seconds')
+    args = parser.parse_args()
+
+    with FakeTelegram(latency=args.latency) as telegram:
+        for name, options in [('blocking', {'cold_start': False}), ('cold start', {'cold_start': True})]:
+            times = []
+            for _ in range(args.number):
+                with BotProcess(telegram.api, bot=options) as bot:
+                    times.append(bot.wait())
+            print(f"{name:<12} median {statistics.median(times) * 1000:>8.0f} ms min {min(times) * 1000:>8.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
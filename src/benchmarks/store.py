@@ -0,0 +1,41 @@
+"""
+Sessions store benchmark (long tail of users, every user writes once)
+Usage: python -m src.benchmarks.store [-n 200000] [-c 10000] [--path sessions.db]
+"""
+import argparse
+import tracemalloc
+from src.benchmarks import timeit
+from src.intents.pizza import Pizza
+from src.sessions import SessionStore
+from src.sessions.sqlite import SqliteBackend
+
+
+def main():
+    parser = argparse.ArgumentParser(description="sessions store benchmark")
+    parser.add_argument('-n', '--number', type=int, default=200000, help='chats count')
+    parser.add_argument('-c', '--capacity', type=int, default=10000, help='store capacity')
+    parser.add_argument('--path', type=str, default=None, help='sqlite backend file')
+    args = parser.parse_args()
+
+    store = SessionStore(None, capacity=args.capacity, backend=SqliteBackend(args.path) if args.path else None)
+    chats = iter(range(args.number))
+
+    def message():
+        chat_id = next(chats)
+        session = store.get(chat_id) or Pizza(None)
+        store.put(chat_id, session)
+
+    tracemalloc.start()
+    checkpoints = 4
+    for checkpoint in range(1, checkpoints + 1):
+        seconds = timeit(message, args.number // checkpoints)
+        size, _ = tracemalloc.get_traced_memory()
+        print(f"chats {args.number * checkpoint // checkpoints:>10} memory {size / 2 ** 20:>8.1f} MiB "
+              f"{args.number // checkpoints / seconds:>10.0f} messages/s")
+    tracemalloc.stop()
+    print(store.stats())
+    store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""
+Synthetic Telegram updates generator and JSONL update logs
+Usage: python -m src.benchmarks.updates [-n 10000] [--chats 1000] [--seed 1] -o updates.jsonl
+"""
+import argparse
+import json
+import random
+import time
+
+
+class UpdateGenerator:
+    """
+    Realistic Telegram updates of many concurrent pizza dialogs
+    Every chat follows its own script (greeting, size, payment, confirmation) with junk text, cancels
+    and non-text messages mixed in, scripts of different chats are interleaved randomly
+    """
+    sizes = ['большую', 'Большую', 'хочу большую пиццу', 'очень большую', 'маленькую', 'Маленькую пожалуйста', 'давай маленькую']
+    payments = ['картой', 'Картой', 'оплачу картой', 'наличкой', 'Наличкой', 'буду платить наличкой']
+    confirmations = ['да', 'Да', 'подтверждаю', 'согласен', 'нет', 'Нет', 'не согласен', 'отказываюсь']
+    cancels = ['выход', 'Выход', 'конец', 'отстань']
+    greetings = ['привет', 'Привет!', 'хочу пиццу', 'здравствуйте', 'меню']
+    junk = ['что?', 'а можно с ананасами', 'ммм', '???', 'сколько стоит', 'эээ давай', 'ok', '🍕']
+    non_text = [
+        {'sticker': {'file_id': 'CAACAgIAAxkBAAE', 'emoji': '🍕', 'width': 512, 'height': 512}},
+        {'photo': [{'file_id': 'AgACAgIAAxkBAAE', 'width': 90, 'height': 90, 'file_size': 1203}]},
+        {'voice': {'file_id': 'AwACAgIAAxkBAAE', 'duration': 2, 'mime_type': 'audio/ogg'}},
+    ]
+
+    def __init__(self, chats: int = 1000, seed: int = 1, junk: float = 0.1, non_text: float = 0.03,
+                 cancel: float = 0.05, start: float = 0.2):
+        """
+        :param chats: concurrent dialogs
+        :param seed: random seed (same seed gives same updates)
+        :param junk: probability of junk text instead of expected answer
+        :param non_text: probability of non-text message
+        :param cancel: probability of dialog cancel on every step
+        :param start: probability of dialog started with "/start"
+        """
+        self.chats = chats
+        self.random = random.Random(seed)
+        self.junk_rate = junk
+        self.non_text_rate = non_text
+        self.cancel_rate = cancel
+        self.start_rate = start
+        self.update_id = 0
+        self.message_id = 0
+        self.date = int(time.time())
+
+    def script(self) -> list:
+        """
+        Texts of one dialog
+        :return:
+        """
+        texts = ['/start'] if self.random.random() < self.start_rate else []
+        for choices in (self.greetings, self.sizes, self.payments, self.confirmations):
+            while self.random.random() < self.junk_rate:
+                texts.append(self.random.choice(self.junk))
+            if self.random.random() < self.cancel_rate:
+                texts.append(self.random.choice(self.cancels))
+                break
+            texts.append(self.random.choice(choices))
+        return texts
+
+    def message(self, chat_id: int, text: str = None) -> dict:
+        """
+        Telegram message dict
+        :param chat_id: chat id (same as user id in private chats)
+        :param text: message text, random non-text message if None
+        :return:
+        """
+        self.message_id += 1
+        self.date += self.random.randint(0, 2)
+        user = {'id': chat_id, 'is_bot': False, 'first_name': f"User{chat_id}", 'language_code': 'ru'}
+        message = {
+            'message_id': self.message_id,
+            'from': user,
+            'chat': {'id': chat_id, 'first_name': user['first_name'], 'type': 'private'},
+            'date': self.date,
+        }
+        if text is None:
+            message.update(self.random.choice(self.non_text))
+        else:
+            message['text'] = text
+        return message
+
+    def generate(self, number: int):
+        """
+        Generate updates
+        :param number: updates count
+        :return: iterator of update dicts
+        """
+        scripts = {}
+        chat_ids = range(1, self.chats + 1)
+        for _ in range(number):
+            chat_id = self.random.choice(chat_ids)
+            if self.random.random() < self.non_text_rate:
+                message = self.message(chat_id)
+            else:
+                script = scripts.get(chat_id)
+                if not script:
+                    script = scripts[chat_id] = self.script()
+                message = self.message(chat_id, script.pop(0))
+            self.update_id += 1
+            yield {'update_id': self.update_id, 'message': message}
+
+
+def write_updates(path: str, updates) -> int:
+    """
+    Write updates log (one update JSON per line)
+    :param path: file path
+    :param updates: iterable of update dicts
+    :return: updates written
+    """
+    written = 0
+    with open(path, 'w', encoding='utf-8') as file:
+        for update in updates:
+            file.write(json.dumps(update, ensure_ascii=False))
+            file.write('\n')
+            written += 1
+    return written
+
+
+def read_updates(path: str):
+    """
+    Read updates log for replay (empty and broken lines are skipped)
+    Log lines can also be JSON log records with update in "update" field
+    :param path: file path
+    :return: iterator of update dicts
+    """
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                update = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(update, dict) and 'update' in update:
+                update = update['update']
+            if isinstance(update, dict):
+                yield update
+
+
+def main():
+    parser = argparse.ArgumentParser(description="synthetic telegram updates generator")
+    parser.add_argument('-n', '--number', type=int, default=10000, help='updates count')
+    parser.add_argument('--chats', type=int, default=1000, help='concurrent dialogs')
+    parser.add_argument('--seed', type=int, default=1, help='random seed')
+    parser.add_argument('-o', '--output', required=True, help='JSONL file')
+    args = parser.parse_args()
+
+    written = write_updates(args.output, UpdateGenerator(chats=args.chats, seed=args.seed).generate(args.number))
+    print(f"{written} updates written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,21 +1,30 @@
 import argparse
+import hmac
 import os
-from yaml import load, FullLoader
-from flask import Flask
+import signal
+from flask import Flask, Response, request
 from src.api import Api
 from src.api.telegram import Telegram
 from src.api.vk import Vk
 from src.api.facebook import Facebook
+from src.utils.config import load_config
 from src.utils.logger import Logger
+from src.utils.metrics import Metrics
+from src.utils.profiler import Profiler
 
 
 class Bot:
     """
     Bot class implement simple flask server and messengers api registration
     """
+    service_endpoints = {'static', 'metrics', 'admin_profile', 'admin_slow'}     # Routes which are not messenger webhooks
+
     def __init__(self):
         self.logger = Logger().get()    # Logger singleton
         self.app = Flask(__name__)      # Flask app
+        self.apis = []                  # Registered apis
+        self.admin_token = None         # Token of admin routes
+        self.app.add_url_rule('/metrics', 'metrics', self.metrics)
 
     def get_app(self):
         """
@@ -24,14 +33,128 @@ class Bot:
         """
         return self.app
 
-    def start(self, host, port):
+    def start(self, host, port, server: dict = None):
         """
-        Running flask server
+        Running server
+        Server is not started if no webhook was registered (all apis are polling)
+        Apis are drained (queued updates handled, replies sent) on SIGTERM
         :param host: host
         :param port: port
+        :param server: server options, "name" is "flask" (development server) or "gunicorn"
+        :return:
+        """
+        server = dict(server or {})
+        name = server.pop('name', 'flask')
+        signal.signal(signal.SIGTERM, self.terminate)
+        try:
+            if not any(rule.endpoint not in self.service_endpoints for rule in self.app.url_map.iter_rules()):
+                self.logger.info('No webhooks registered, waiting for polling apis')
+                for api in self.apis:
+                    api.join()
+            elif name == 'gunicorn':
+                self.start_gunicorn(host, port, **server)
+            else:
+                self.app.run(host=host, port=port, threaded=True)
+        finally:
+            self.drain()
+
+    def start_gunicorn(self, host, port, workers: int = 1, threads: int = 8, keepalive: int = 75, graceful_timeout: int = 30,
+                       timeout: int = 30, backlog: int = 2048):
+        """
+        Running gunicorn server (gthread workers)
+        Every worker drains its apis when it exits
+        :param host: host
+        :param port: port
+        :param workers: worker processes
+        :param threads: threads per worker
+        :param keepalive: seconds to keep idle connection
+        :param graceful_timeout: seconds for in-flight requests after SIGTERM
+        :param timeout: seconds before silent worker is restarted
+        :param backlog: pending connections
+        :return:
+        """
+        from src.server import GunicornServer     # gunicorn is not available on every platform
+        GunicornServer(self.app, {
+            'bind': f"{host}:{port}",
+            'workers': workers,
+            'threads': threads,
+            'worker_class': 'gthread',
+            'keepalive': keepalive,
+            'graceful_timeout': graceful_timeout,
+            'timeout': timeout,
+            'backlog': backlog,
+            'worker_exit': lambda arbiter, worker: self.drain(),
+        }).run()
+
+    def terminate(self, signum, frame):
+        """
+        SIGTERM handler
+        :return:
+        """
+        raise SystemExit(0)
+
+    def drain(self):
+        """
+        Flush apis in-flight work and state
+        :return:
+        """
+        for api in self.apis:
+            try:
+                api.close()
+            except Exception as e:
+                self.logger.warning(f"Error due to closing api -> {e}")
+
+    def metrics(self):
+        """
+        Metrics of this process in prometheus text format
         :return:
         """
-        self.app.run(host=host, port=port)
+        return Response(Metrics().render(), mimetype='text/plain')
+
+    def profile(self, token: str = None, **options):
+        """
+        Enable updates profiler (see Profiler.configure for options) and its admin routes:
+        /admin/profile - sampled call stacks in collapsed format ("reset=1" drops them after reading),
+        /admin/slow - captured slow updates
+        :param token: token admin requests pass in X-Admin-Token header, routes are not registered without it
+                      (they expose user messages)
+        :return:
+        """
+        Profiler().configure(**options)
+        if not token or token == '<token>':
+            self.admin_token = None
+            self.logger.warning('Profiler admin routes are disabled: admin token is not set')
+            return
+        self.admin_token = token
+        if 'admin_profile' not in self.app.view_functions:
+            self.app.add_url_rule('/admin/profile', 'admin_profile', self.admin_profile)
+            self.app.add_url_rule('/admin/slow', 'admin_slow', self.admin_slow)
+
+    def is_admin(self) -> bool:
+        return self.admin_token is not None and hmac.compare_digest(request.headers.get('X-Admin-Token', ''), self.admin_token)
+
+    def admin_profile(self):
+        """
+        Sampled call stacks of this process (flamegraph.pl or speedscope input)
+        :return:
+        """
+        if not self.is_admin():
+            return 'forbidden', 403
+        profiler = Profiler()
+        collapsed = profiler.collapsed()
+        if request.args.get('reset'):
+            profiler.reset()
+        return Response(collapsed, mimetype='text/plain')
+
+    def admin_slow(self):
+        """
+        Slow updates of this process: payload, intent transitions and stage timings
+        :return:
+        """
+        if not self.is_admin():
+            return 'forbidden', 403
+        profiler = Profiler()
+        return {'profiler': profiler.stats(), 'updates': profiler.slow_updates()}
 
     def register(self, api: Api):
         """
@@ -40,6 +163,7 @@ class Bot:
         :return:
         """
         api.register(self.get_app())
+        self.apis.append(api)
 
 
 if __name__ == '__main__':
@@ -53,25 +177,49 @@ if __name__ == '__main__':
     if not os.path.exists(config):
         raise FileNotFoundError(f"Config file is not found on: {config}")
 
-    # Reading config file
-    with open(config, encoding='utf-8') as file:
-        config = load(file, Loader=FullLoader)
+    # Reading config file (parsed config is cached)
+    config = load_config(config)
+
+    # Logging options
+    Logger().configure(**config.get('logging', {}))
 
     bot = Bot()
 
+    # Updates profiler (opt-in)
+    profiler = dict(config['bot'].get('profiler') or {})
+    if profiler.pop('enabled', False):
+        bot.profile(**profiler)
+
     apis = [
         Telegram(
             token=config['messengers']['telegram']['token'],
             api=config['messengers']['telegram']['api'],
             webhook=config['messengers']['telegram']['webhook'],
+            outbox=config['messengers']['telegram'].get('outbox'),
+            sessions=config['messengers']['telegram'].get('sessions'),
+            dispatcher=config['messengers']['telegram'].get('dispatcher'),
+            dedup=config['messengers']['telegram'].get('dedup'),
+            mode=config['messengers']['telegram'].get('mode', 'webhook'),
+            polling=config['messengers']['telegram'].get('polling'),
+            cold_start=config['bot'].get('cold_start', False),
+            orders=config['messengers']['telegram'].get('orders'),
+            router=config['messengers']['telegram'].get('router'),
+            admission=config['messengers']['telegram'].get('admission'),
         ),
-        # Vk(app=bot.get_app()),
-        # Facebook(app=bot.get_app())
     ]
+    # Other messengers share handling options of telegram section which they do not set (not rate limits and storage paths)
+    telegram = config['messengers']['telegram']
+    shared = {key: telegram.get(key) for key in ('dispatcher', 'dedup', 'router', 'admission')}
+    shared['sessions'] = {key: value for key, value in (telegram.get('sessions') or {}).items() if key in ('capacity', 'ttl')}
+    shared['outbox'] = {key: value for key, value in (telegram.get('outbox') or {}).items() if key == 'coalesce'}
+    for name, cls in (('vk', Vk), ('facebook', Facebook)):
+        options = dict(config['messengers'].get(name) or {})
+        if options.pop('enabled', False):
+            apis.append(cls(**{**shared, 'cold_start': config['bot'].get('cold_start', False), **options}))
 
     # Api registration
     for messenger_api in apis:
         bot.register(messenger_api)
 
     # Running flask server
-    bot.start(host=config['bot']['host'], port=os.environ.get("PORT", config['bot']['port']))   # Get heroku port from env
+    bot.start(host=config['bot']['host'], port=os.environ.get("PORT", config['bot']['port']), server=config['bot'].get('server'))   # Get heroku port from env
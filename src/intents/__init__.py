@@ -1,7 +1,219 @@
-from abc import ABC, abstractmethod
+import time
+from abc import ABC
+from threading import Lock
+from transitions import Machine
+from src.intents.classifier import MessageClassifier
 from src.utils.logger import Logger
+from src.utils.metrics import Metrics
+from src.utils.profiler import current_profile
+
+
+class BoundMachine:
+    """
+    Lightweight view of the shared intent machine bound to one session
+    Created on access only, so sessions do not pay for it
+    """
+    __slots__ = ('machine', 'model')
+
+    def __init__(self, machine: Machine, model):
+        self.machine = machine      # Shared class machine
+        self.model = model          # Session the view is bound to
+
+    def set_state(self, state):
+        self.machine.set_state(state, model=self.model)
+
+    def is_state(self, state):
+        return self.machine.is_state(state, self.model)
+
+    def __getattr__(self, item):
+        return getattr(self.machine, item)
 
 
 class Intent(ABC):
-    def __init__(self):
-        self.logger = Logger().get()
\ No newline at end of file
+    """
+    Base intent
+    States, transitions and rule tables are class level, the transitions.Machine is built once per intent class
+    and shared by every session, so an intent instance holds only the dialog state of a single chat
+    """
+    __slots__ = ()
+
+    logger = Logger().get()     # Logger singleton
+
+    states = []                 # Intent states
+    transitions = []            # Intent transitions
+    initial = 'start'           # Initial state
+    examples = []               # Texts which start intent (IntentRouter training set)
+
+    _build_lock = Lock()        # Guards class level builds
+    _event_metrics = {}         # (intent, trigger, source state, outcome) -> histogram
+
+    classes = {}                # Intent name -> intent class (filled by subclasses)
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        Intent.classes[cls.__name__] = cls
+
+    @staticmethod
+    def registry() -> dict:
+        """
+        Registered intent classes, built-in intents are registered on first call
+        :return: intent name -> intent class
+        """
+        import src.intents.pizza     # Pizza imports api, so this module can not import it at load time
+        return Intent.classes
+
+    @classmethod
+    def build_once(cls, attribute: str, builder):
+        """
+        Build class level object once per intent class
+        :param attribute: class attribute to cache object in
+        :param builder: object factory
+        :return:
+        """
+        value = cls.__dict__.get(attribute)
+        if value is None:
+            with Intent._build_lock:
+                value = cls.__dict__.get(attribute)
+                if value is None:
+                    value = builder()
+                    setattr(cls, attribute, value)
+        return value
+
+    @classmethod
+    def get_machine(cls) -> Machine:
+        """
+        Shared machine getter (built on first call for every intent class)
+        :return:
+        """
+        return cls.build_once('_machine', cls.build_machine)
+
+    @classmethod
+    def get_classifier(cls) -> MessageClassifier:
+        """
+        Shared message classifier getter (built on first call for every intent class)
+        :return:
+        """
+        return cls.build_once('_classifier', cls.build_classifier)
+
+    @classmethod
+    def build_machine(cls) -> Machine:
+        """
+        Build machine without models, sessions are passed to the events explicitly
+        :return:
+        """
+        return Machine(
+            model=None,
+            states=cls.states,
+            initial=cls.initial,
+            transitions=cls.transitions,
+            prepare_event=['classify_message'],
+            before_state_change=['log_state_change'],
+            send_event=True     # Encapsulate all callback arguments in Event object
+        )
+
+    @classmethod
+    def build_classifier(cls) -> MessageClassifier:
+        """
+        Build message classifier from intent rules (no rules by default)
+        :return:
+        """
+        return MessageClassifier()
+
+    @property
+    def machine(self) -> BoundMachine:
+        return BoundMachine(self.get_machine(), self)
+
+    def trigger(self, trigger_name, *args, **kwargs):
+        """
+        Trigger machine event for this session
+        Event time is observed per source state and outcome (destination state or "none"),
+        transitions of profiled update are recorded to its profile
+        :param trigger_name: event name
+        :return: True if transition was executed
+        """
+        started = time.perf_counter()
+        source = self.state
+        result = self.get_machine().events[trigger_name].trigger(self, *args, **kwargs)
+        key = (type(self).__name__, trigger_name, source, self.state if result else 'none')
+        histogram = Intent._event_metrics.get(key)
+        if histogram is None:
+            histogram = Intent._event_metrics.setdefault(key, Metrics().histogram(
+                'intent_event_seconds', intent=key[0], trigger=key[1], state=key[2], outcome=key[3]
+            ))
+        seconds = time.perf_counter() - started
+        histogram.observe(seconds)
+        profile = current_profile.get()
+        if profile is not None:
+            profile.transition(*key, seconds)
+        return result
+
+    def next(self, *args, **kwargs):
+        return self.trigger('next', *args, **kwargs)
+
+    @property
+    def in_dialog(self) -> bool:
+        """
+        Dialog is going on (session in initial state has finished or cancelled dialog, next message is routed again)
+        :return:
+        """
+        return self.state != self.initial
+
+    def dump(self) -> dict:
+        """
+        Compact dialog record (enough to restore session)
+        :return:
+        """
+        return {'intent': type(self).__name__, 'state': self.state}
+
+    @classmethod
+    def restore(cls, api, record: dict) -> 'Intent':
+        """
+        Restore session from dialog record (Intent.restore picks intent class by record)
+        :param api: messenger api instance
+        :param record: record made by dump
+        :return:
+        """
+        if cls is Intent:
+            return Intent.registry()[record['intent']].restore(api, record)
+        intent = cls(api)
+        intent.state = record['state']
+        return intent
+
+    @classmethod
+    def code_tables(cls) -> dict:
+        """
+        Values kept as codes in compact snapshot (see SnapshotBackend), code is index of value in its table
+        :return: table name -> values (up to 255 values)
+        """
+        return {'state': list(cls.states)}
+
+    @classmethod
+    def encode(cls, record: dict, codes: dict) -> tuple:
+        """
+        Dialog record -> one code per table
+        :param record: record made by dump
+        :param codes: table name -> value -> code
+        :return:
+        """
+        return (codes['state'][record['state']],)
+
+    @classmethod
+    def decode(cls, values: tuple, tables: dict) -> dict:
+        """
+        Codes -> dialog record
+        :param values: codes made by encode
+        :param tables: code tables values were encoded with
+        :return:
+        """
+        return {'intent': cls.__name__, 'state': tables['state'][values[0]]}
+
+    def classify_message(self, event):
+        """
+        Classify user text once per event, guards and savers read event.message
+        :param event: machine event
+        :return:
+        """
+        event.message = self.get_classifier().classify(event.kwargs.get('text'))
+
+    def log_state_change(self, event):
+        self.logger.info('Change state to: "%s" (trace %s)', event.state.value, event.kwargs.get('trace_id'), extra={'category': 'state'})
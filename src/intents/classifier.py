@@ -0,0 +1,248 @@
+import re
+from src.intents.fuzzy import FuzzyIndex
+
+
+class Automaton:
+    """
+    Aho-Corasick style multi word matcher
+    Vocabulary trie is compiled into one regex, so the text is scanned by the C regex engine in a single pass
+    and every start position costs a trie walk instead of a check per word
+    """
+    __slots__ = ('words', 'pattern', 'closure')
+
+    def __init__(self, words: dict):
+        """
+        :param words: word -> label
+        """
+        self.words = words      # Word -> label
+
+        trie = {}
+        for word in words:
+            node = trie
+            for char in word:
+                node = node.setdefault(char, {})
+            node[''] = True     # Word end marker
+
+        # Lookahead reports the longest word starting at every position (overlapping words included)
+        self.pattern = re.compile(f"(?=({self.compile(trie)}))") if words else None
+
+        # Longest word -> labels of every vocabulary word inside it
+        self.closure = {
+            word: frozenset(label for other, label in words.items() if other in word)
+            for word in words
+        }
+
+    @classmethod
+    def compile(cls, node: dict) -> str:
+        """
+        Trie node to regex, longer words are tried first
+        :param node: trie node
+        :return:
+        """
+        branches = [re.escape(char) + cls.compile(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+        return f"(?:{body})?" if '' in node else body
+
+    def search(self, text: str):
+        """
+        Find all word labels in text
+        :param text: text
+        :return: (labels found anywhere, labels of words equal to the whole text)
+        """
+        found = set()
+        if self.pattern is not None:
+            for word in self.pattern.findall(text):
+                found |= self.closure[word]
+        label = self.words.get(text)
+        return found, frozenset() if label is None else frozenset((label,))
+
+
+class Message:
+    """
+    Classified user message
+    Every rule family is evaluated at most once and only when asked for,
+    typo tolerant lookup runs only for the slot which is asked for (see slot)
+    """
+    __slots__ = ('text', 'classifier', '_exact', '_fuzzy', '_words', '_phrases')
+
+    def __init__(self, classifier: 'MessageClassifier', text: str):
+        self.classifier = classifier    # Classifier which produced the message
+        self.text = text                # Normalized text
+        self._exact = None              # Slot name -> (slot value, 1.0) of pattern matches
+        self._fuzzy = None              # Slot name -> (slot value, confidence) or None of typo tolerant lookups
+        self._words = None              # Labels of words found anywhere in text
+        self._phrases = None            # Labels of phrases equal to the whole text
+
+    def slot(self, name: str) -> tuple:
+        """
+        Value of one slot, misspelled words are looked up only if patterns did not match the slot
+        :param name: slot name
+        :return: (slot value, confidence) or (None, 0.0)
+        """
+        if self._exact is None:
+            self._exact = self.classifier.match_slots(self.text)
+        found = self._exact.get(name)
+        if found is None:
+            if self._fuzzy is None:
+                self._fuzzy = {}
+            if name not in self._fuzzy:
+                self._fuzzy[name] = self.classifier.match_fuzzy(self.text, name)
+            found = self._fuzzy[name]
+        return found or (None, 0.0)
+
+    @property
+    def slots(self) -> dict:
+        """
+        Every slot found in text (typo tolerant lookup for every slot patterns missed)
+        :return: slot name -> slot value
+        """
+        return {name: value for name, (value, _) in self.found().items()}
+
+    @property
+    def confidence(self) -> dict:
+        """
+        Confidence of every slot found in text
+        :return: slot name -> confidence of slot value (1.0 for pattern match)
+        """
+        return {name: confidence for name, (_, confidence) in self.found().items()}
+
+    def found(self) -> dict:
+        """
+        Every slot found in text
+        :return: slot name -> (slot value, confidence)
+        """
+        found = {}
+        for name in self.classifier.slots:
+            value, confidence = self.slot(name)
+            if value is not None:
+                found[name] = (value, confidence)
+        return found
+
+    @property
+    def words(self) -> set:
+        if self._words is None:
+            self._words, self._phrases = self.classifier.match_words(self.text)
+        return self._words
+
+    @property
+    def phrases(self) -> frozenset:
+        if self._phrases is None:
+            self._words, self._phrases = self.classifier.match_words(self.text)
+        return self._phrases
+
+
+class MessageClassifier:
+    """
+    Single pass message classifier
+    Slot patterns are compiled into one alternation regex, word lists into one Aho-Corasick automaton.
+    Slots not matched by patterns are looked up word by word in a typo tolerant index of slot vocabularies,
+    only when the slot is asked for (guards of the current state ask for the slot they expect)
+    """
+    word_pattern = re.compile(r'\w+')
+    max_cached_words = 65536    # Typo lookups cache size (user words repeat a lot)
+
+    def __init__(self, slots: dict = None, words: dict = None, vocabularies: dict = None, max_distance: int = 2):
+        """
+        :param slots: slot name -> {slot value: pattern}, first value in dict order wins
+        :param words: label -> list of words
+        :param vocabularies: slot name -> {slot value: word forms} for typo tolerant matching (slot values by default)
+        :param max_distance: max typos in a slot word (0 - patterns only)
+        """
+        self.slots = slots or {}
+        self.words = words or {}
+        self.vocabularies = vocabularies or {}
+
+        # Slot patterns, every value gets its own named group
+        self.groups = {}
+        alternatives = []
+        for slot, values in self.slots.items():
+            for priority, (value, pattern) in enumerate(values.items()):
+                group = f"g{len(self.groups)}"
+                self.groups[group] = (slot, priority, value)
+                alternatives.append(f"(?P<{group}>{pattern})")
+        self.slots_pattern = re.compile("|".join(alternatives)) if alternatives else None
+
+        # Typo tolerant index of slot words -> (slot, priority, value)
+        vocabulary = {}
+        for slot, values in self.slots.items():
+            forms = self.vocabularies.get(slot, {})
+            for priority, value in enumerate(values):
+                for word in [value, *forms.get(value, [])]:
+                    vocabulary.setdefault(str(word).lower(), (slot, priority, value))
+        self.fuzzy = FuzzyIndex(vocabulary, max_distance) if max_distance else None
+        self.fuzzy_cache = {}   # Word -> lookup result
+
+        # Words automaton
+        self.automaton = Automaton({str(word).lower(): label for label, items in self.words.items() for word in items})
+
+    @staticmethod
+    def normalize(text) -> str:
+        return str(text).lower()
+
+    def classify(self, text) -> Message:
+        """
+        Classify user text
+        :param text: user text
+        :return:
+        """
+        return Message(self, self.normalize(text))
+
+    def match_slots(self, text: str) -> dict:
+        """
+        Find slot values matched by patterns in normalized text
+        :param text: normalized text
+        :return: slot -> (value, 1.0)
+        """
+        if self.slots_pattern is None:
+            return {}
+        best = {}
+        for match in self.slots_pattern.finditer(text):
+            slot, priority, value = self.groups[match.lastgroup]
+            if slot not in best or priority < best[slot][0]:
+                best[slot] = (priority, value)
+        return {slot: (value, 1.0) for slot, (_, value) in best.items()}
+
+    def match_fuzzy(self, text: str, slot: str):
+        """
+        Find misspelled value of one slot in normalized text, the closest word wins (earlier value on ties)
+        :param text: normalized text
+        :param slot: slot name
+        :return: (value, confidence) or None
+        """
+        if self.fuzzy is None:
+            return None
+        best = None
+        for word in self.word_pattern.findall(text):
+            found = self.lookup(word)
+            if found is None or found[0][0] != slot:
+                continue
+            (_, priority, value), score = found
+            if best is None or (-score, priority) < (-best[0], best[1]):
+                best = (score, priority, value)
+        return None if best is None else (best[2], best[0])
+
+    def lookup(self, word: str):
+        """
+        Cached typo tolerant lookup of slot word
+        :param word: normalized word
+        :return: ((slot, priority, value), confidence) or None
+        """
+        try:
+            return self.fuzzy_cache[word]
+        except KeyError:
+            pass
+        found = self.fuzzy.lookup(word)
+        if len(self.fuzzy_cache) >= self.max_cached_words:
+            self.fuzzy_cache.clear()
+        self.fuzzy_cache[word] = found
+        return found
+
+    def match_words(self, text: str):
+        """
+        Find word labels in normalized text
+        :param text: normalized text
+        :return: (labels found anywhere, labels of words equal to the whole text)
+        """
+        return self.automaton.search(text)
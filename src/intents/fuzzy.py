@@ -0,0 +1,114 @@
+class FuzzyIndex:
+    """
+    Typo tolerant word lookup (symmetric delete index)
+    Every vocabulary word is indexed by all its variants with up to allowed characters deleted, a query looks up
+    its own deletion variants, so lookup cost depends on query length only, not on vocabulary size.
+    Candidates are verified with optimal string alignment distance (adjacent transposition is one edit)
+    """
+    __slots__ = ('words', 'order', 'index', 'max_distance', 'max_length')
+
+    # Edits allowed for vocabulary word length: (min length, edits), longest first
+    # Shorter words are one or two edits away from real words of other meaning ("карма" - "карта")
+    distances = ((9, 2), (6, 1))
+
+    def __init__(self, words: dict, max_distance: int = 2):
+        """
+        :param words: word -> label, earlier words win ties
+        :param max_distance: max edits for any word (0 - exact lookup only)
+        """
+        self.max_distance = max_distance
+        self.words = {}         # Word -> label
+        self.order = {}         # Word -> priority
+        self.index = {}         # Deletion variant -> words
+        self.max_length = 0     # Longest vocabulary word
+        for word, label in words.items():
+            word = str(word).lower()
+            if word in self.words:
+                continue
+            self.words[word] = label
+            self.order[word] = len(self.order)
+            self.max_length = max(self.max_length, len(word))
+            for variant in self.deletions(word, self.allowed(len(word))):
+                self.index.setdefault(variant, []).append(word)
+
+    def allowed(self, length: int) -> int:
+        """
+        Edits allowed for word of length
+        :param length: word length
+        :return:
+        """
+        for min_length, edits in self.distances:
+            if length >= min_length:
+                return min(edits, self.max_distance)
+        return 0
+
+    @staticmethod
+    def deletions(word: str, depth: int) -> set:
+        """
+        Word and its variants with up to depth characters deleted
+        :param word: word
+        :param depth: max deleted characters
+        :return:
+        """
+        variants = {word}
+        level = variants
+        for _ in range(depth):
+            level = {variant[:i] + variant[i + 1:] for variant in level for i in range(len(variant))}
+            variants |= level
+        return variants
+
+    @staticmethod
+    def distance(first: str, second: str, limit: int) -> int:
+        """
+        Optimal string alignment distance
+        :param first: word
+        :param second: word
+        :param limit: distances above limit are reported as limit + 1
+        :return:
+        """
+        if abs(len(first) - len(second)) > limit:
+            return limit + 1
+        previous2, previous = None, list(range(len(second) + 1))
+        for i, a in enumerate(first, 1):
+            current = [i] + [0] * len(second)
+            for j, b in enumerate(second, 1):
+                cost = a != b
+                current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+                if i > 1 and j > 1 and a == second[j - 2] and first[i - 2] == b:
+                    current[j] = min(current[j], previous2[j - 2] + 1)
+            if min(current) > limit:
+                return limit + 1
+            previous2, previous = previous, current
+        return min(previous[-1], limit + 1)
+
+    def lookup(self, word: str):
+        """
+        Closest vocabulary word
+        :param word: lower case word
+        :return: (label, confidence) or None, confidence is 1 - edits / vocabulary word length
+        """
+        label = self.words.get(word)
+        if label is not None:
+            return label, 1.0
+        # Longer words can not match, their deletion variants (about n^2 / 2 strings of length n) are not built
+        if len(word) > self.max_length + self.max_distance:
+            return None
+        # Vocabulary words within reach are at most max_distance characters longer than query
+        depth = self.allowed(len(word) + self.max_distance)
+        best = None
+        checked = set()
+        for variant in self.deletions(word, depth):
+            for candidate in self.index.get(variant, ()):
+                if candidate in checked:
+                    continue
+                checked.add(candidate)
+                limit = self.allowed(len(candidate))
+                edits = self.distance(word, candidate, limit)
+                if edits <= limit:
+                    key = (edits / len(candidate), self.order[candidate])
+                    if best is None or key < best[0]:
+                        best = (key, candidate)
+        if best is None:
+            return None
+        (share, _), candidate = best
+        return self.words[candidate], 1.0 - share
@@ -1,12 +1,13 @@
-from transitions import Machine
+import time
 from src.intents import Intent
+from src.intents.classifier import MessageClassifier
 from src.api import Api
-import re
 
 
 class Pizza(Intent):
     """
     FSM implemented by https://github.com/pytransitions/transitions
+    Machine and rules are shared by all sessions, instance keeps only state and order of a single chat
     Pizza intent:
         Бот должен обрабатывать следующий диалог
         1. Какую вы хотите пиццу? Большую или маленькую?
@@ -38,27 +39,66 @@ class Pizza(Intent):
         {'trigger': 'next', 'source': 'ask_payment_method', 'dest': 'ask_payment_method', 'unless': ['is_payment_method_valid'], 'after': ['send_payment_clarification']},
 
         # Ask for order confirmation and handling depends on user response
-        {'trigger': 'next', 'source': 'ask_order', 'dest': 'start', 'conditions': ['is_order_confirmed'], 'after': ['send_order_positive_text']},
+        {'trigger': 'next', 'source': 'ask_order', 'dest': 'start', 'conditions': ['is_order_confirmed'], 'after': ['save_order', 'send_order_positive_text']},
         {'trigger': 'next', 'source': 'ask_order', 'dest': 'start', 'conditions': ['is_order_not_confirmed'], 'after': ['send_order_negative_text']},
         {'trigger': 'next', 'source': 'ask_order', 'dest': 'ask_order', 'unless': ['is_order_confirmed', 'is_order_not_confirmed'], 'after': ['send_order_clarification']},
 
     ]
 
-    def __init__(self, api: Api):
-        super().__init__()
+    # Texts which start pizza order (see IntentRouter)
+    examples = [
+        'хочу пиццу', 'закажу пиццу', 'можно заказать пиццу', 'пицца', 'пиццу', 'хочу заказать',
+        'большую пиццу', 'маленькую пиццу', 'хочу большую', 'давай маленькую', 'меню', 'что есть поесть',
+        'привет', 'здравствуйте', 'добрый день', 'хочу есть', 'голоден', 'доставка пиццы',
+    ]
+
+    # Simple pizza sizes validation rules
+    pizza_size = {
+        'большую': r'больш[уюаяой]{2,}',
+        'маленькую': r'маленьк[уюаяой]{2,}'
+    }
+
+    # Simple payment method validation rules
+    payment_methods = {
+        'наличкой': r'наличк[уаойе]{1,2}',
+        'картой': r'карт[ыуаойе]{1,2}'
+    }
+
+    # Word forms of slot values for typo tolerant matching (see FuzzyIndex)
+    slot_vocabularies = {
+        'size': {
+            'большую': ['большая', 'большой', 'большие'],
+            'маленькую': ['маленькая', 'маленький', 'маленькие'],
+        },
+        'payment': {
+            'наличкой': ['наличка', 'наличные', 'наличными', 'наличностью'],
+            'картой': ['карта', 'карточкой', 'карточка'],
+        },
+    }
+
+    # Min confidence of a misspelled slot value to accept it without clarification
+    # (two typos are accepted in words of 10+ letters only, "маленько" is not "маленькую")
+    min_slot_confidence = 0.8
+
+    # Simple confirmation words validation rules
+    confirmation_words = {
+        'yes': ['Да', 'Подтверждаю', 'Согласен'],
+        'no': ['Нет', 'Не', 'Отказываюсь', 'Не согласен']
+    }
+
+    # Signal words for intent exit
+    cancel_words = [
+        'Выход', 'Конец', 'Отстань'
+    ]
 
+    __slots__ = ('api', 'state', 'order')
+
+    def __init__(self, api: Api):
         # Messenger api instance
         self.api = api
 
-        # Transition machine instance
-        self.machine = Machine(
-            model=self,
-            states=Pizza.states,
-            initial='start',
-            transitions=Pizza.transitions,
-            before_state_change=lambda event: self.logger.info(f'Change state to: \"{event.state.value}\"'),
-            send_event=True     # Encapsulate all callback arguments in Event object
-        )
+        # Current machine state
+        self.state = self.initial
 
         # Simple order info
         self.order = {
@@ -66,62 +106,79 @@ class Pizza(Intent):
             'payment': 'наличкой',  # Default
         }
 
-        # Simple pizza sizes validation rules
-        self.pizza_size = {
-            'большую': r'больш[уюаяой]{2,}',
-            'маленькую': r'маленьк[уюаяой]{2,}'
-        }
-
-        # Simple payment method validation rules
-        self.payment_methods = {
-            'наличкой': r'наличк[уаойе]{1,2}',
-            'картой': r'карт[ыуаойе]{1,2}'
-        }
-
-        # Simple confirmation words validation rules
-        self.confirmation_words = {
-            'yes': ['Да', 'Подтверждаю', 'Согласен'],
-            'no': ['Нет', 'Не', 'Отказываюсь', 'Не согласен']
-        }
-
-        # Signal words for intent exit
-        self.cancel_words = [
-            'Выход', 'Конец', 'Отстань'
-        ]
+    def dump(self) -> dict:
+        record = super().dump()
+        record['order'] = dict(self.order)
+        return record
+
+    @classmethod
+    def restore(cls, api, record: dict) -> 'Pizza':
+        intent = super().restore(api, record)
+        intent.order.update(record.get('order', {}))
+        return intent
+
+    @classmethod
+    def code_tables(cls) -> dict:
+        tables = super().code_tables()
+        tables['size'] = list(cls.pizza_size)
+        tables['payment'] = list(cls.payment_methods)
+        return tables
+
+    @classmethod
+    def encode(cls, record: dict, codes: dict) -> tuple:
+        order = record['order']
+        return super().encode(record, codes) + (codes['size'][order['size']], codes['payment'][order['payment']])
+
+    @classmethod
+    def decode(cls, values: tuple, tables: dict) -> dict:
+        record = super().decode(values, tables)
+        record['order'] = {'size': tables['size'][values[1]], 'payment': tables['payment'][values[2]]}
+        return record
+
+    @classmethod
+    def build_classifier(cls) -> MessageClassifier:
+        return MessageClassifier(
+            slots={'size': cls.pizza_size, 'payment': cls.payment_methods},
+            vocabularies=cls.slot_vocabularies,
+            words={'yes': cls.confirmation_words['yes'], 'no': cls.confirmation_words['no'], 'cancel': cls.cancel_words}
+        )
 
     def is_pizza_size_valid(self, event):
-        size = str(event.kwargs.get('text')).lower()        # Get user text from event
-        return any(bool(re.search(v, size)) for v in self.pizza_size.values())
+        return event.message.slot('size')[1] >= self.min_slot_confidence
 
     def save_pizza_size(self, event):
-        size = str(event.kwargs.get('text')).lower()        # Get user text from event
-        for size_var, size_pat in self.pizza_size.items():
-            if re.search(size_pat, size):
-                self.order['size'] = size_var
-                break
+        self.order['size'] = event.message.slot('size')[0]
 
     def is_payment_method_valid(self, event):
-        payment = str(event.kwargs.get('text')).lower()     # Get user text from event
-        return any(bool(re.search(v, payment)) for v in self.payment_methods.values())
+        return event.message.slot('payment')[1] >= self.min_slot_confidence
 
     def save_payment_method(self, event):
-        payment = str(event.kwargs.get('text')).lower()     # Get user text from event
-        for payment_var, payment_pat in self.payment_methods.items():
-            if re.search(payment_pat, payment):
-                self.order['payment'] = payment_var
-                break
+        self.order['payment'] = event.message.slot('payment')[0]
+
+    def save_order(self, event):
+        """
+        Write confirmed order to orders journal (durable before confirmation is sent)
+        :param event: machine event
+        :return:
+        """
+        if self.api.orders is not None:
+            self.api.orders.append({
+                'messenger': self.api.name,
+                'chat_id': event.kwargs.get('chat_id'),
+                'size': self.order['size'],
+                'payment': self.order['payment'],
+                'time': time.time(),
+                'trace_id': event.kwargs.get('trace_id'),
+            })
 
     def is_order_confirmed(self, event):
-        text = str(event.kwargs.get('text')).lower()        # Get user text from event
-        return any(str(c).lower() in text for c in self.confirmation_words['yes'])
+        return 'yes' in event.message.words
 
     def is_order_not_confirmed(self, event):
-        text = str(event.kwargs.get('text')).lower()        # Get user text from event
-        return any(str(c).lower() in text for c in self.confirmation_words['no'])
+        return 'no' in event.message.words
 
     def is_intent_cancel_text(self, event):
-        text = str(event.kwargs.get('text')).lower()        # Get user text from event
-        return any(str(cancel_word).lower() == text for cancel_word in self.cancel_words)
+        return 'cancel' in event.message.phrases
 
     #### BOT ANSWER CALLBACKS ####
     def send_pizza_size_question(self, event):
@@ -0,0 +1,205 @@
+from threading import Lock, Condition
+from src.intents import Intent
+from src.utils.logger import Logger
+
+
+class NgramHasher:
+    """
+    Character n-grams of texts hashed into fixed size feature vectors (computed with numpy for a batch at once)
+    numpy is imported on first use, bot with a single intent never routes and does not pay for the import
+    """
+    multiplier = 1000003                # Polynomial rolling hash base
+    mixer = 0x9E3779B97F4A7C15          # Fibonacci hashing of n-gram hash into feature index
+
+    def __init__(self, bits: int = 13, ngrams: tuple = (2, 3, 4)):
+        """
+        :param bits: feature vector size is 2 ** bits
+        :param ngrams: n-gram sizes
+        """
+        self.dimension = 1 << bits
+        self.shift = 64 - bits
+        self.ngrams = ngrams
+
+    def transform(self, texts: list):
+        """
+        Texts -> L2 normalized log term frequency matrix
+        :param texts: texts
+        :return: (texts, dimension) float32 matrix
+        """
+        import numpy as np
+        multiplier, mixer, shift = np.uint64(self.multiplier), np.uint64(self.mixer), np.uint64(self.shift)
+        # Texts are joined with zero separators, n-grams which cross a separator are dropped
+        joined = '\0'.join(f" {str(text).lower()} " for text in texts) + '\0'
+        codes = np.frombuffer(joined.encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+        separators = codes == 0
+        rows = np.cumsum(separators) - separators       # Text index of every character
+        crossed = np.concatenate(([0], np.cumsum(separators)))
+
+        indexes, owners = [], []
+        for n in self.ngrams:
+            windows = len(codes) - n + 1
+            if windows <= 0:
+                continue
+            hashes = np.full(windows, np.uint64(n))
+            for k in range(n):
+                hashes = hashes * multiplier + codes[k:k + windows]
+            valid = crossed[n:n + windows] == crossed[:windows]
+            indexes.append((hashes[valid] * mixer) >> shift)
+            owners.append(rows[:windows][valid])
+
+        matrix = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        if indexes:
+            flat = np.concatenate(owners) * self.dimension + np.concatenate(indexes).astype(np.int64)
+            counts = np.bincount(flat, minlength=len(texts) * self.dimension)
+            matrix = np.log1p(counts.reshape(len(texts), self.dimension).astype(np.float32))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-12)
+
+
+class IntentRouter:
+    """
+    Decides which intent a message of a chat without dialog starts
+    Linear (softmax regression) model over hashed character n-grams is trained at startup on intents examples,
+    text is scored against every intent with one matrix product. Concurrent route() calls are scored together
+    in micro-batches: the caller which finds router idle scores every waiting message. Every caller waits for
+    its own result, so a batch holds at most one message of every calling thread (dispatcher shards)
+    """
+    logger = Logger().get()
+
+    def __init__(self, intents: list, default=None, threshold: float = 0.5,
+                 bits: int = 13, epochs: int = 30, learning_rate: float = 2.0, regularization: float = 1e-4,
+                 scale: float = 20.0):
+        """
+        :param intents: intent classes (with examples)
+        :param default: intent started when no intent is confident enough (first intent by default)
+        :param threshold: min probability of routed intent
+        :param bits: feature vector size is 2 ** bits
+        :param epochs: training iterations
+        :param learning_rate: training step
+        :param regularization: L2 weight penalty
+        :param scale: initial weights norm (softmax temperature of centroids model)
+        """
+        self.intents = list(intents)
+        self.default = default or self.intents[0]
+        self.threshold = threshold
+        self.hasher = NgramHasher(bits)
+        self.epochs = epochs
+        self.learning_rate = learning_rate
+        self.regularization = regularization
+        self.scale = scale
+
+        self.weights = None     # (intents, dimension)
+        self.bias = None        # (intents,)
+        self.build_lock = Lock()
+
+        self.condition = Condition()
+        self.waiting = []       # [text, intent] entries waiting for scoring
+        self.busy = False       # Some caller is scoring a batch
+
+        # Counters
+        self.batches = 0
+        self.routed = 0
+        self.largest = 0        # Largest batch
+
+    @classmethod
+    def from_names(cls, names: list, **kwargs) -> 'IntentRouter':
+        """
+        Router over registered intents
+        :param names: intent class names (see Intent.registry)
+        :return:
+        """
+        intents = Intent.registry()
+        return cls([intents[name] for name in names], **kwargs)
+
+    def build(self):
+        """
+        Train model (once), single intent needs no model
+        :return:
+        """
+        if len(self.intents) == 1:
+            return
+        import numpy as np
+        with self.build_lock:
+            if self.weights is not None:
+                return
+            texts, labels = [], []
+            for label, intent in enumerate(self.intents):
+                texts.extend(intent.examples)
+                labels.extend([label] * len(intent.examples))
+            features = self.hasher.transform(texts) if texts else np.zeros((0, self.hasher.dimension), dtype=np.float32)
+            targets = np.eye(len(self.intents), dtype=np.float32)[labels]
+
+            # Start from scaled intents centroids (nearest centroid model), then fit softmax regression
+            weights = targets.T @ features
+            weights *= self.scale / np.maximum(np.linalg.norm(weights, axis=1, keepdims=True), 1e-12)
+            bias = np.zeros(len(self.intents), dtype=np.float32)
+            for _ in range(self.epochs if texts else 0):
+                error = (self.softmax(features @ weights.T + bias) - targets) / len(texts)
+                weights -= self.learning_rate * (error.T @ features + self.regularization * weights)
+                bias -= self.learning_rate * error.sum(axis=0)
+            self.bias = bias
+            self.weights = weights
+            self.logger.info(f"Intent router is trained on {len(texts)} examples of {len(self.intents)} intents")
+
+    @staticmethod
+    def softmax(scores):
+        import numpy as np
+        scores = scores - scores.max(axis=1, keepdims=True)
+        exponents = np.exp(scores)
+        return exponents / exponents.sum(axis=1, keepdims=True)
+
+    def probabilities(self, texts: list):
+        """
+        Intent probabilities of texts
+        :param texts: texts
+        :return: (texts, intents) matrix
+        """
+        if self.weights is None:
+            self.build()
+        return self.softmax(self.hasher.transform(texts) @ self.weights.T + self.bias)
+
+    def classify(self, texts: list) -> list:
+        """
+        Intent started by every text
+        :param texts: texts
+        :return: intent classes
+        """
+        if len(self.intents) == 1:
+            return [self.default] * len(texts)
+        probabilities = self.probabilities(texts)
+        best = probabilities.argmax(axis=1)
+        return [
+            self.intents[index] if probabilities[row, index] >= self.threshold else self.default
+            for row, index in enumerate(best)
+        ]
+
+    def route(self, text: str):
+        """
+        Intent started by text (scored together with other waiting texts)
+        :param text: user text
+        :return: intent class
+        """
+        entry = [text, None]
+        with self.condition:
+            self.waiting.append(entry)
+        while True:
+            with self.condition:
+                while entry[1] is None and self.busy:
+                    self.condition.wait()
+                if entry[1] is not None:
+                    return entry[1]
+                self.busy = True
+                batch, self.waiting = self.waiting, []
+            try:
+                intents = self.classify([waiting[0] for waiting in batch])
+            except Exception as e:
+                self.logger.exception(f"Intent routing failed -> {e}")
+                intents = [self.default] * len(batch)
+            with self.condition:
+                for waiting, intent in zip(batch, intents):
+                    waiting[1] = intent
+                self.busy = False
+                self.batches += 1
+                self.routed += len(batch)
+                self.largest = max(self.largest, len(batch))
+                self.condition.notify_all()
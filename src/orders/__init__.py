@@ -0,0 +1,195 @@
+import os
+import json
+import time
+from threading import Thread, Lock, Condition
+from src.utils.logger import Logger
+
+
+class OrderJournal:
+    """
+    Append-only journal of confirmed orders (JSON lines)
+    Appends are queued and written by a background thread, every batch is made durable with a single fsync
+    (group commit), so a burst of confirmations does not cost one fsync each
+    Consumers stream orders with tail() from a byte offset
+    """
+    def __init__(self, path: str, fsync: bool = True):
+        """
+        :param path: journal file
+        :param fsync: fsync every batch (disable only for tests and benchmarks)
+        """
+        self.logger = Logger().get()
+        self.path = path
+        self.fsync = fsync
+        self.recover()
+        self.file = None
+        self.pid = None
+        self.thread = None
+
+        self.lock = Lock()
+        self.queued = Condition(self.lock)      # Writer waits for appends
+        self.written = Condition(self.lock)     # Appenders wait for commit
+        self.pending = []                       # Encoded records not written yet
+        self.appended = 0                       # Records appended by this process
+        self.committed = 0                      # Records durable
+        self.error = None                       # Write error (journal is broken)
+        self.closed = False
+
+        # Counters
+        self.syncs = 0
+
+    def recover(self):
+        """
+        Cut record torn by crash (journal ends with incomplete line)
+        :return:
+        """
+        try:
+            file = open(self.path, 'rb+')
+        except FileNotFoundError:
+            return
+        with file:
+            size = file.seek(0, os.SEEK_END)
+            end = size
+            while end > 0:
+                start = max(end - 4096, 0)
+                file.seek(start)
+                index = file.read(end - start).rfind(b'\n')
+                if index >= 0:
+                    end = start + index + 1
+                    break
+                end = start
+            if end < size:
+                self.logger.warning(f"Orders journal: torn record of {size - end} bytes is cut")
+                file.truncate(end)
+                os.fsync(file.fileno())
+
+    def start(self):
+        """
+        Open journal and start writer in this process (threads do not survive fork)
+        :return:
+        """
+        self.pid = os.getpid()
+        created = not os.path.exists(self.path)
+        self.file = open(self.path, 'ab')
+        if created and self.fsync:
+            self.sync_directory()
+        self.thread = Thread(target=self.work, name="Orders-journal", daemon=True)
+        self.thread.start()
+
+    def sync_directory(self):
+        """
+        Make entry of new journal file durable (file fsync does not cover it, new journal can vanish on power loss)
+        Directories can not be opened for fsync on Windows
+        :return:
+        """
+        if os.name != 'posix':
+            return
+        directory = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+
+    def append(self, order: dict, wait: bool = True):
+        """
+        Append order
+        :param order: order record
+        :param wait: return only when order is durable
+        :return:
+        """
+        line = (json.dumps(order, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+        with self.lock:
+            if self.closed:
+                raise ValueError("Orders journal is closed")
+            if self.error is not None:
+                raise self.error
+            if self.pid != os.getpid():
+                self.start()
+            self.pending.append(line)
+            self.appended += 1
+            sequence = self.appended
+            self.queued.notify()
+            while wait and self.committed < sequence:
+                if self.error is not None:
+                    raise self.error
+                self.written.wait()
+
+    def work(self):
+        """
+        Writer loop: take everything queued, write it and fsync once
+        :return:
+        """
+        while True:
+            with self.lock:
+                while not self.pending and not self.closed:
+                    self.queued.wait()
+                if not self.pending:
+                    return
+                batch, self.pending = self.pending, []
+                sequence = self.appended
+            try:
+                self.file.write(b''.join(batch))
+                self.file.flush()
+                if self.fsync:
+                    os.fsync(self.file.fileno())
+            except OSError as e:
+                # Failed fsync is not retried (dirty pages state is unknown), journal stops accepting orders
+                self.logger.exception(f"Orders journal write failed -> {e}")
+                with self.lock:
+                    self.error = e
+                    self.written.notify_all()
+                return
+            with self.lock:
+                self.committed = sequence
+                self.syncs += 1
+                self.written.notify_all()
+
+    def stats(self) -> dict:
+        return {'appended': self.appended, 'committed': self.committed, 'syncs': self.syncs}
+
+    def close(self):
+        """
+        Write queued orders and stop writer
+        :return:
+        """
+        with self.lock:
+            self.closed = True
+            self.queued.notify()
+        if self.thread is not None and self.pid == os.getpid():
+            self.thread.join()
+        if self.file is not None:
+            self.file.close()
+        self.thread = self.file = None
+
+    @staticmethod
+    def tail(path: str, offset: int = 0, follow: bool = False, interval: float = 0.1, stop=None):
+        """
+        Stream orders from offset
+        Only complete records are read, corrupted ones are skipped
+        :param path: journal file
+        :param offset: byte offset to start from (0 or offset yielded before)
+        :param follow: wait for new orders instead of stopping at the end of journal
+        :param interval: seconds between checks for new orders
+        :param stop: threading.Event which ends following
+        :return: iterator of (offset after order, order)
+        """
+        while True:
+            try:
+                with open(path, 'rb') as file:
+                    file.seek(offset)
+                    for line in file:
+                        if not line.endswith(b'\n'):
+                            break       # Record is being written
+                        offset += len(line)
+                        try:
+                            order = json.loads(line)
+                        except ValueError:
+                            continue
+                        yield offset, order
+            except FileNotFoundError:
+                pass
+            if not follow or (stop is not None and stop.is_set()):
+                return
+            if stop is not None:
+                stop.wait(interval)
+            else:
+                time.sleep(interval)
@@ -0,0 +1,22 @@
+from gunicorn.app.base import BaseApplication
+
+
+class GunicornServer(BaseApplication):
+    """
+    Embedded gunicorn server (multi process, multi thread WSGI server)
+    """
+    def __init__(self, app, options: dict):
+        """
+        :param app: WSGI app
+        :param options: gunicorn settings
+        """
+        self.application = app
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return self.application
@@ -0,0 +1,188 @@
+import time
+from collections import OrderedDict
+from contextlib import nullcontext
+from threading import Lock
+from src.intents import Intent
+
+
+class SessionBackend:
+    """
+    Persistent sessions storage (stores dialog records, see Intent.dump)
+    """
+    shared = False      # Backend is shared by worker processes
+
+    def lock(self, chat_id):
+        """
+        Chat lock for get-handle-put sequence (nothing to lock for process local backend)
+        :param chat_id: user chat id
+        :return: context manager
+        """
+        return nullcontext()
+
+    def load(self, chat_id):
+        raise NotImplementedError
+
+    def save(self, chat_id, record: dict):
+        raise NotImplementedError
+
+    def delete(self, chat_id):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class SessionStore:
+    """
+    Bounded in-memory sessions store
+    Sessions are kept in LRU order, idle sessions are evicted after ttl and the least recently used one
+    is evicted when capacity is reached
+    With backend every put is written through, evicted sessions are rehydrated when their chat writes again
+    With shared backend sessions are not cached in memory, other worker processes may change them
+    """
+    def __init__(self, api, capacity: int = 100000, ttl: float = 86400, backend: SessionBackend = None, clock=time.monotonic):
+        """
+        :param api: messenger api instance (for rehydrated sessions)
+        :param capacity: max sessions in memory
+        :param ttl: idle seconds before session is evicted
+        :param backend: persistent backend
+        :param clock: time source
+        """
+        self.api = api
+        self.capacity = capacity
+        self.ttl = ttl
+        self.backend = backend
+        self.clock = clock
+        self.sessions = OrderedDict()   # Chat id -> [session, last access time]
+        self.lock = Lock()
+
+        # Counters
+        self.hits = 0           # Found in memory
+        self.misses = 0         # Not in memory
+        self.restores = 0       # Misses rehydrated from backend
+        self.evictions = 0      # Evicted due to capacity
+        self.expirations = 0    # Evicted due to ttl
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def get(self, chat_id):
+        """
+        Get session (rehydrate from backend if it was evicted)
+        :param chat_id: user chat id
+        :return: session or None
+        """
+        now = self.clock()
+        if self.backend is not None and self.backend.shared:
+            return self.load(chat_id, now)
+        with self.lock:
+            self.expire(now)
+            entry = self.sessions.get(chat_id)
+            if entry is not None:
+                self.hits += 1
+                entry[1] = now
+                self.sessions.move_to_end(chat_id)
+                return entry[0]
+            self.misses += 1
+        return self.load(chat_id, now)
+
+    def has_dialog(self, chat_id) -> bool:
+        """
+        Cheap dialog check for admission priority (no backend reads, sessions of shared backend are assumed to exist)
+        Session in initial state of its intent has no dialog (finished or cancelled)
+        :param chat_id: user chat id
+        :return:
+        """
+        if self.backend is not None and self.backend.shared:
+            return True
+        entry = self.sessions.get(chat_id)
+        return entry is not None and entry[0].in_dialog
+
+    def load(self, chat_id, now):
+        """
+        Rehydrate session from backend
+        :param chat_id: user chat id
+        :param now: current time
+        :return: session or None
+        """
+        if self.backend is None:
+            return None
+        record = self.backend.load(chat_id)
+        if record is None:
+            return None
+        session = Intent.restore(self.api, record)
+        with self.lock:
+            self.restores += 1
+            if not self.backend.shared:
+                self.insert(chat_id, session, now)
+        return session
+
+    def lock_chat(self, chat_id):
+        """
+        Chat lock for get-handle-put sequence (only shared backend needs it)
+        :param chat_id: user chat id
+        :return: context manager
+        """
+        return nullcontext() if self.backend is None else self.backend.lock(chat_id)
+
+    def put(self, chat_id, session):
+        """
+        Add or refresh session (written through to backend)
+        :param chat_id: user chat id
+        :param session: intent instance
+        :return:
+        """
+        now = self.clock()
+        if self.backend is None or not self.backend.shared:
+            with self.lock:
+                self.expire(now)
+                self.insert(chat_id, session, now)
+        if self.backend is not None:
+            self.backend.save(chat_id, session.dump())
+
+    def pop(self, chat_id):
+        """
+        Remove session from memory and backend
+        :param chat_id: user chat id
+        :return: session or None
+        """
+        with self.lock:
+            entry = self.sessions.pop(chat_id, None)
+        if self.backend is not None:
+            self.backend.delete(chat_id)
+        return entry[0] if entry else None
+
+    def insert(self, chat_id, session, now):
+        self.sessions[chat_id] = [session, now]
+        self.sessions.move_to_end(chat_id)
+        while len(self.sessions) > self.capacity:
+            self.sessions.popitem(last=False)
+            self.evictions += 1
+
+    def expire(self, now):
+        # Sessions are ordered by last access, so expired ones are at the front
+        deadline = now - self.ttl
+        while self.sessions:
+            entry = next(iter(self.sessions.values()))
+            if entry[1] > deadline:
+                break
+            self.sessions.popitem(last=False)
+            self.expirations += 1
+
+    def stats(self) -> dict:
+        """
+        Store counters
+        :return:
+        """
+        return {
+            'size': len(self.sessions),
+            'hits': self.hits,
+            'misses': self.misses,
+            'restores': self.restores,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+    def close(self):
+        if self.backend is not None:
+            self.backend.close()
@@ -0,0 +1,46 @@
+import os
+import zlib
+from threading import Lock
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:     # Not available on Windows, locks are process local there
+    fcntl = None
+
+
+class ChatLocks:
+    """
+    Striped per chat locks shared by worker processes and threads
+    Every chat maps onto one byte of a lock file, the byte is locked with a POSIX record lock
+    (owned by process) together with a thread lock of the same stripe (POSIX locks do not exclude threads)
+    """
+    def __init__(self, path: str, stripes: int = 4096):
+        """
+        :param path: lock file
+        :param stripes: lockable slots (chats sharing a slot wait for each other)
+        """
+        self.path = path
+        self.stripes = stripes
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        self.threads = [Lock() for _ in range(stripes)]
+
+    def stripe(self, chat_id) -> int:
+        # Stable across processes (str hash is randomized per process)
+        return zlib.crc32(str(chat_id).encode('utf-8')) % self.stripes
+
+    @contextmanager
+    def __call__(self, chat_id):
+        stripe = self.stripe(chat_id)
+        with self.threads[stripe]:
+            if fcntl is None:
+                yield
+                return
+            fcntl.lockf(self.fd, fcntl.LOCK_EX, 1, stripe)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self.fd, fcntl.LOCK_UN, 1, stripe)
+
+    def close(self):
+        os.close(self.fd)
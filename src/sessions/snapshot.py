@@ -0,0 +1,332 @@
+import os
+import re
+import json
+import mmap
+import time
+import heapq
+import struct
+from threading import Thread, Lock, Event
+from src.intents import Intent
+from src.sessions import SessionBackend
+from src.utils.logger import Logger
+
+DELETED = 255   # Intent code of deleted session
+
+
+class Segment:
+    """
+    Snapshot file read through mmap, nothing is loaded until a chat is looked up
+    Layout: prefix (magic, header length, records count), JSON header (sequence, code tables), fixed size records
+    (chat id, intent code, one code per table) sorted by chat id
+    """
+    magic = b'PZS1'
+    prefix = struct.Struct('<4sIQ')
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, length, self.count = self.prefix.unpack_from(self.map, 0)
+        if magic != self.magic:
+            raise ValueError(f"{path} is not a sessions snapshot")
+        header = json.loads(self.map[self.prefix.size:self.prefix.size + length])
+        self.sequence = header['sequence']
+        self.width = header['width']
+        self.intents = header['intents']    # [[intent name, code tables]] (intent code is index)
+        self.record = struct.Struct(f"<qB{self.width}B")
+        self.offset = self.prefix.size + length
+
+    @classmethod
+    def write(cls, path: str, sequence: int, intents: list, width: int, rows):
+        """
+        Write snapshot file atomically (temporary file, fsync, rename)
+        :param path: file path
+        :param sequence: snapshot sequence number
+        :param intents: [[intent name, code tables]]
+        :param width: codes per record
+        :param rows: records (chat id, intent code, codes...) sorted by chat id
+        :return: records written
+        """
+        record = struct.Struct(f"<qB{width}B")
+        header = json.dumps({'sequence': sequence, 'width': width, 'intents': intents}, ensure_ascii=False).encode('utf-8')
+        temporary = f"{path}.tmp"
+        count = 0
+        with open(temporary, 'wb') as file:
+            file.write(cls.prefix.pack(cls.magic, len(header), 0))
+            file.write(header)
+            buffer = bytearray()
+            for row in rows:
+                buffer += record.pack(*row)
+                count += 1
+                if len(buffer) >= 1 << 20:
+                    file.write(buffer)
+                    buffer.clear()
+            file.write(buffer)
+            file.seek(0)
+            file.write(cls.prefix.pack(cls.magic, len(header), count))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, path)
+        return count
+
+    def find(self, chat_id):
+        """
+        Binary search of chat record
+        :param chat_id: user chat id
+        :return: record or None
+        """
+        low, high, size = 0, self.count, self.record.size
+        while low < high:
+            middle = (low + high) // 2
+            current = self.record.unpack_from(self.map, self.offset + middle * size)
+            if current[0] < chat_id:
+                low = middle + 1
+            elif current[0] > chat_id:
+                high = middle
+            else:
+                return current
+        return None
+
+    def rows(self):
+        """
+        All records in chat id order
+        :return:
+        """
+        return self.record.iter_unpack(self.map[self.offset:self.offset + self.count * self.record.size])
+
+    def decode(self, row) -> dict:
+        """
+        Record -> dialog record
+        :param row: record
+        :return: None if session was deleted or its intent does not exist anymore
+        """
+        if row[1] == DELETED:
+            return None
+        name, tables = self.intents[row[1]]
+        cls = Intent.classes.get(name)
+        return cls.decode(row[2:], tables) if cls is not None else None
+
+
+class SnapshotBackend(SessionBackend):
+    """
+    Compact binary snapshots of dialogs (a dozen bytes per chat)
+    Changed sessions are kept in memory and written periodically as a delta snapshot, deltas are merged
+    into a new base snapshot when there are too many of them. Files are mapped into memory on start,
+    so restore does not read anything before a chat writes again
+    Backend is process local (use with one server worker)
+    """
+    file_pattern = re.compile(r'^(\d{10})\.(base|delta)$')
+
+    def __init__(self, path: str, interval: float = 60, max_deltas: int = 8):
+        """
+        :param path: snapshots directory
+        :param interval: seconds between snapshots (0 - only on close)
+        :param max_deltas: deltas before they are merged into base
+        """
+        self.logger = Logger().get()
+        self.path = path
+        self.interval = interval
+        self.max_deltas = max_deltas
+
+        # Code tables of current intents
+        self.intents = []
+        self.encoders = {}      # Intent name -> (intent code, intent class, table name -> value -> code)
+        registry = Intent.registry()
+        for code, name in enumerate(sorted(registry)):
+            cls = registry[name]
+            tables = cls.code_tables()
+            self.intents.append([name, tables])
+            self.encoders[name] = (code, cls, {table: {value: i for i, value in enumerate(values)} for table, values in tables.items()})
+        self.width = max([len(tables) for _, tables in self.intents] or [1])
+
+        self.lock = Lock()
+        self.dirty = {}         # Chat id -> record changed since last snapshot (None if deleted)
+        self.writing = {}       # Records of snapshot being written
+        self.segments = []      # Newest first, base is the last one
+        self.sequence = 0
+        self.write_lock = Lock()
+
+        # Counters
+        self.snapshots = 0
+        self.written = 0
+        self.last_seconds = 0.0
+
+        self.stop = Event()
+        self.thread = None
+        self.pid = None
+        self.open()
+
+    def open(self):
+        """
+        Map latest base and its deltas, remove stale files
+        :return:
+        """
+        os.makedirs(self.path, exist_ok=True)
+        files = []
+        for name in os.listdir(self.path):
+            match = self.file_pattern.match(name)
+            if match:
+                files.append((int(match.group(1)), match.group(2), name))
+            elif name.endswith('.tmp'):
+                os.remove(os.path.join(self.path, name))    # Interrupted write
+        files.sort()
+        bases = [sequence for sequence, kind, _ in files if kind == 'base']
+        base = bases[-1] if bases else 0
+        for sequence, kind, name in files:
+            if sequence < base or (sequence == base and kind == 'delta'):
+                os.remove(os.path.join(self.path, name))    # Merged into base
+            else:
+                self.segments.insert(0, Segment(os.path.join(self.path, name)))
+        self.sequence = files[-1][0] if files else 0
+
+    def start(self):
+        """
+        Start snapshot thread in this process (threads do not survive fork)
+        :return:
+        """
+        self.pid = os.getpid()
+        if self.interval:
+            self.stop.clear()
+            self.thread = Thread(target=self.run, name="Sessions-snapshot", daemon=True)
+            self.thread.start()
+
+    def run(self):
+        while not self.stop.wait(self.interval):
+            self.snapshot()
+
+    def load(self, chat_id):
+        with self.lock:
+            for changed in (self.dirty, self.writing):
+                if chat_id in changed:
+                    return changed[chat_id]
+            segments = self.segments
+        for segment in segments:
+            row = segment.find(chat_id)
+            if row is not None:
+                return segment.decode(row)
+        return None
+
+    def save(self, chat_id, record: dict):
+        if self.pid != os.getpid():
+            self.start()
+        with self.lock:
+            self.dirty[chat_id] = record
+
+    def delete(self, chat_id):
+        with self.lock:
+            self.dirty[chat_id] = None
+
+    def encode(self, chat_id, record) -> tuple:
+        """
+        Dialog record -> snapshot record
+        :param chat_id: user chat id
+        :param record: dialog record (None if deleted)
+        :return:
+        """
+        if record is None:
+            return (chat_id, DELETED) + (0,) * self.width
+        code, cls, codes = self.encoders[record['intent']]
+        values = cls.encode(record, codes)
+        return (chat_id, code) + values + (0,) * (self.width - len(values))
+
+    def convert(self, segment: Segment):
+        """
+        Segment records in current codes (files written by other intents version are decoded and encoded again)
+        :param segment: segment
+        :return:
+        """
+        if segment.intents == self.intents and segment.width == self.width:
+            return segment.rows()
+        return (self.encode(row[0], segment.decode(row)) for row in segment.rows())
+
+    def snapshot(self):
+        """
+        Write changed sessions (delta, or new base when deltas limit is reached)
+        :return:
+        """
+        with self.write_lock:
+            with self.lock:
+                if not self.dirty:
+                    return
+                self.writing, self.dirty = self.dirty, {}
+            started = time.perf_counter()
+            try:
+                rows = []
+                for chat_id, record in self.writing.items():
+                    try:
+                        rows.append(self.encode(chat_id, record))
+                    except (KeyError, IndexError, struct.error) as e:
+                        self.logger.warning(f"Session of chat {chat_id} is not written to snapshot -> {e!r}")
+                rows.sort()
+
+                sequence = self.sequence + 1
+                deltas = len(self.segments) - 1
+                if not self.segments or deltas + 1 >= self.max_deltas:
+                    # Merge newest first sources, first record of a chat wins
+                    sources = [rows] + [self.convert(segment) for segment in self.segments]
+                    merged = heapq.merge(*[self.ranked(source, rank) for rank, source in enumerate(sources)])
+                    kind, output = 'base', self.latest(merged)
+                else:
+                    kind, output = 'delta', rows
+                path = os.path.join(self.path, f"{sequence:010d}.{kind}")
+                written = Segment.write(path, sequence, self.intents, self.width, output)
+                segment = Segment(path)
+            except Exception as e:
+                self.logger.exception(f"Sessions snapshot failed -> {e}")
+                with self.lock:
+                    self.dirty = {**self.writing, **self.dirty}
+                    self.writing = {}
+                return
+
+            with self.lock:
+                stale = self.segments if kind == 'base' else []
+                self.segments = [segment] + (self.segments if kind == 'delta' else [])
+                self.writing = {}
+            self.sequence = sequence
+            for old in stale:
+                os.remove(old.path)     # Mapping is closed when last reader drops it
+
+            self.snapshots += 1
+            self.written += written
+            self.last_seconds = time.perf_counter() - started
+            self.logger.info(f"Sessions snapshot {kind} {sequence}: {written} records in {self.last_seconds:.3f}s")
+
+    @staticmethod
+    def ranked(rows, rank: int):
+        for row in rows:
+            yield row[0], rank, row
+
+    @staticmethod
+    def latest(merged):
+        """
+        Newest record of every chat without deleted ones
+        :param merged: (chat id, rank, record) ordered by chat id and rank
+        :return:
+        """
+        previous = None
+        for chat_id, _, row in merged:
+            if chat_id != previous:
+                previous = chat_id
+                if row[1] != DELETED:
+                    yield row
+
+    def stats(self) -> dict:
+        return {
+            'snapshots': self.snapshots,
+            'written': self.written,
+            'last_seconds': self.last_seconds,
+            'segments': len(self.segments),
+            'dirty': len(self.dirty),
+        }
+
+    def close(self):
+        """
+        Stop snapshot thread and write last changes
+        :return:
+        """
+        self.stop.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.snapshot()
+        self.pid = None
@@ -0,0 +1,87 @@
+import os
+import time
+import json
+import sqlite3
+from threading import local
+from src.sessions import SessionBackend
+from src.sessions.locks import ChatLocks
+
+
+class SqliteBackend(SessionBackend):
+    """
+    SQLite (WAL) sessions backend
+    Keeps only dialog state and slots of every chat, connection is opened per thread (and per process after fork)
+    Shared backend is the single source of dialogs for several worker processes, chat is locked
+    while its update is handled (see ChatLocks), seen update ids are kept in the same database (see seen)
+    """
+    purge_every = 1000      # Seen update ids between purges of expired ones (per thread)
+
+    def __init__(self, path: str, shared: bool = False):
+        """
+        :param path: database file
+        :param shared: database is shared by worker processes
+        """
+        self.path = path
+        self.shared = shared
+        self.locks = ChatLocks(f"{path}.lock") if shared else None
+        self.local = local()
+        connection = self.connect()
+        connection.execute('CREATE TABLE IF NOT EXISTS sessions (chat_id PRIMARY KEY, intent TEXT, state TEXT, data TEXT)')
+        connection.execute('CREATE TABLE IF NOT EXISTS updates (key PRIMARY KEY, time REAL)')
+        connection.execute('CREATE INDEX IF NOT EXISTS updates_time ON updates (time)')
+
+    def connect(self) -> sqlite3.Connection:
+        connection = getattr(self.local, 'connection', None)
+        if connection is None or self.local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, isolation_level=None, timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self.local.connection = connection
+            self.local.pid = os.getpid()
+        return connection
+
+    def load(self, chat_id):
+        row = self.connect().execute('SELECT intent, state, data FROM sessions WHERE chat_id = ?', (chat_id,)).fetchone()
+        if row is None:
+            return None
+        intent, state, data = row
+        return {'intent': intent, 'state': state, **json.loads(data)}
+
+    def save(self, chat_id, record: dict):
+        data = {k: v for k, v in record.items() if k not in ('intent', 'state')}
+        self.connect().execute(
+            'INSERT OR REPLACE INTO sessions (chat_id, intent, state, data) VALUES (?, ?, ?, ?)',
+            (chat_id, record['intent'], record['state'], json.dumps(data, ensure_ascii=False, separators=(',', ':')))
+        )
+
+    def delete(self, chat_id):
+        self.connect().execute('DELETE FROM sessions WHERE chat_id = ?', (chat_id,))
+
+    def seen(self, key, window: float) -> bool:
+        """
+        Check update id and remember it, every worker process sees ids received by the others (see Deduplicator)
+        Unique key makes check and insert one atomic statement. Expired ids are purged every purge_every calls,
+        so an id may be remembered a bit longer than window
+        :param key: update id
+        :param window: seconds an id is remembered
+        :return: True if id was already seen
+        """
+        now = time.time()       # Wall clock, comparable between processes
+        connection = self.connect()
+        calls = getattr(self.local, 'seen_calls', 0)
+        self.local.seen_calls = calls + 1
+        if calls % self.purge_every == 0:
+            connection.execute('DELETE FROM updates WHERE time <= ?', (now - window,))
+        return connection.execute('INSERT OR IGNORE INTO updates (key, time) VALUES (?, ?)', (key, now)).rowcount == 0
+
+    def lock(self, chat_id):
+        return self.locks(chat_id) if self.shared else super().lock(chat_id)
+
+    def close(self):
+        if self.locks is not None:
+            self.locks.close()
+            self.locks = None
+        connection = getattr(self.local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self.local.connection = None
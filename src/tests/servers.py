@@ -0,0 +1,324 @@
+import os
+import sys
+import json
+import time
+import yaml
+import socket
+import tempfile
+import subprocess
+import requests
+from collections import defaultdict
+from threading import Thread, Lock
+from urllib.parse import parse_qsl
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from src.api.telegram import Telegram
+from src.utils.tracing import current_trace
+
+
+class Clock:
+    """
+    Manual time source
+    """
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class RecordingTelegram(Telegram):
+    """
+    Telegram api which records replies and trace ids of their updates instead of sending them
+    """
+    def __init__(self, **kwargs):
+        super().__init__(token='token', api='http://127.0.0.1:9/bot', webhook='', **kwargs)
+        self.replies = defaultdict(list)    # Chat id -> reply texts
+        self.traces = defaultdict(list)     # Chat id -> trace ids of replies
+        self.replies_lock = Lock()
+
+    def ensure_webhook(self):
+        pass
+
+    def send_message(self, chat_id, text):
+        with self.replies_lock:
+            self.replies[chat_id].append(text)
+            self.traces[chat_id].append(current_trace.get())
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    """
+    Keep-alive request handler, every request is passed to server.handle
+    """
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length).decode('utf-8')
+        if self.headers.get('Content-Type', '').startswith('application/json'):
+            params = json.loads(body or '{}')
+        else:
+            params = dict(parse_qsl(body))
+        status, payload = self.server.handle(self.path, params, self.client_address)
+        raw = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    do_GET = do_POST
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeTelegram(ThreadingHTTPServer):
+    """
+    Local stand-in for Telegram bot api
+    Records every call, responses for a chat can be scripted with fail()
+    Updates for getUpdates are scripted with push()
+    """
+    daemon_threads = True
+
+    def __init__(self, token: str = 'token', latency: float = 0.0):
+        super().__init__(('127.0.0.1', 0), FakeHandler)
+        self.token = token
+        self.latency = latency          # Seconds every call takes
+        self.calls = []                 # (method, params, client address, response status)
+        self.scripted = {}              # Chat id -> list of (status, payload) returned before success
+        self.updates = []               # Not confirmed updates for getUpdates
+        self.update_id = 0              # Last pushed update id
+        self.poll_wait = 0.2            # Max seconds empty long poll waits
+        self.webhook = ''               # Url set by setWebhook
+        self.lock = Lock()
+        self.thread = Thread(target=self.serve_forever, args=(0.05,), daemon=True)
+
+    @property
+    def api(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/bot"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError):     # Client gone (bot process stopped)
+            super().handle_error(request, client_address)
+
+    def fail(self, chat_id, status: int, payload: dict, times: int = 1):
+        """
+        Script error responses for chat
+        :return:
+        """
+        self.scripted.setdefault(str(chat_id), []).extend([(status, payload)] * times)
+
+    def push(self, *messages):
+        """
+        Script updates batch for getUpdates
+        :param messages: message dicts
+        :return:
+        """
+        with self.lock:
+            for message in messages:
+                self.update_id += 1
+                self.updates.append({'update_id': self.update_id, 'message': message})
+
+    def get_updates(self, params: dict) -> list:
+        """
+        getUpdates: confirm updates below offset, return next batch (waits for updates like long poll)
+        :return:
+        """
+        offset = int(params.get('offset', 0))
+        limit = int(params.get('limit', 100))
+        deadline = time.monotonic() + min(float(params.get('timeout', 0)), self.poll_wait)
+        while True:
+            with self.lock:
+                self.updates = [update for update in self.updates if update['update_id'] >= offset]
+                if self.updates or time.monotonic() >= deadline:
+                    return self.updates[:limit]
+            time.sleep(0.01)
+
+    def sent(self, chat_id=None) -> list:
+        """
+        Texts successfully sent by sendMessage
+        :param chat_id: filter by chat
+        :return:
+        """
+        with self.lock:
+            return [
+                params['text'] for method, params, _, status in self.calls
+                if method == 'sendMessage' and status == 200 and (chat_id is None or params['chat_id'] == str(chat_id))
+            ]
+
+    def handle(self, path: str, params: dict, client):
+        if self.latency:
+            time.sleep(self.latency)
+        method = path.rsplit('/', 1)[-1]
+        status, payload = 200, {'ok': True, 'result': True}
+        if method == 'getUpdates':
+            payload = {'ok': True, 'result': self.get_updates(params)}
+        elif method == 'setWebhook':
+            self.webhook = params.get('url', '')
+        elif method == 'deleteWebhook':
+            self.webhook = ''
+        elif method == 'getWebhookInfo':
+            payload = {'ok': True, 'result': {'url': self.webhook, 'pending_update_count': len(self.updates)}}
+        with self.lock:
+            scripted = self.scripted.get(str(params.get('chat_id')))
+            if scripted:
+                status, payload = scripted.pop(0)
+            self.calls.append((method, params, client, status))
+        return status, payload
+
+
+class FakeVk(FakeTelegram):
+    """
+    Local stand-in for Vk api (messages.send)
+    Vk errors come in 200 responses, script them with fail(peer_id, 200, {'error': {...}})
+    """
+    @property
+    def api(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/method"
+
+    def sent(self, chat_id=None) -> list:
+        """
+        Texts delivered by messages.send (bulk sends count for every peer)
+        :param chat_id: filter by chat
+        :return:
+        """
+        with self.lock:
+            return [
+                params['message'] for method, params, _, status in self.calls
+                if method == 'messages.send' and status == 200
+                and (chat_id is None or str(chat_id) in params.get('peer_ids', params.get('peer_id', '')).split(','))
+            ]
+
+    def handle(self, path: str, params: dict, client):
+        method = path.split('?')[0].rsplit('/', 1)[-1]
+        status, payload = 200, {'response': 1}
+        with self.lock:
+            scripted = self.scripted.get(params.get('peer_id', params.get('peer_ids', '').split(',')[0]))
+            if scripted:
+                status, payload = scripted.pop(0)
+            self.calls.append((method, params, client, 'error' if 'error' in payload else status))
+        return status, payload
+
+
+class FakeFacebook(FakeTelegram):
+    """
+    Local stand-in for Facebook Send API (me/messages)
+    """
+    @property
+    def api(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/v17.0"
+
+    def sent(self, chat_id=None) -> list:
+        """
+        Texts delivered by Send API
+        :param chat_id: filter by chat
+        :return:
+        """
+        with self.lock:
+            return [
+                params['message']['text'] for method, params, _, status in self.calls
+                if method == 'messages' and status == 200 and (chat_id is None or params['recipient']['id'] == str(chat_id))
+            ]
+
+    def handle(self, path: str, params: dict, client):
+        method = path.split('?')[0].rsplit('/', 1)[-1]
+        status, payload = 200, {'recipient_id': params.get('recipient', {}).get('id'), 'message_id': 'm'}
+        with self.lock:
+            scripted = self.scripted.get(params.get('recipient', {}).get('id'))
+            if scripted:
+                status, payload = scripted.pop(0)
+            self.calls.append((method, params, client, status))
+        return status, payload
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class BotProcess:
+    """
+    Bot started as "python -m src.bot" with generated config (telegram api points to fake server)
+    """
+    def __init__(self, api: str, token: str = 'token', server: dict = None, telegram: dict = None, bot: dict = None):
+        """
+        :param api: telegram api url
+        :param token: bot token
+        :param server: bot server options
+        :param telegram: extra telegram options
+        :param bot: extra bot options
+        """
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.config = {
+            'bot': {'host': '127.0.0.1', 'port': self.port, 'server': server or {'name': 'flask'}, **(bot or {})},
+            'messengers': {'telegram': {
+                'token': token, 'api': api, 'webhook': f"{self.url}/telegram",
+                'outbox': {'rate': 0, 'chat_rate': 0},
+                **(telegram or {}),
+            }},
+        }
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'config.yaml')
+        self.process = None
+        self.started = None             # Process start time (monotonic)
+
+    def start(self, wait: bool = True) -> 'BotProcess':
+        with open(self.path, 'w', encoding='utf-8') as file:
+            yaml.safe_dump(self.config, file, allow_unicode=True)
+        root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        env = {**os.environ, 'PYTHONPATH': root, 'PORT': str(self.port)}
+        self.started = time.monotonic()
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'src.bot', '--config', self.path],
+            cwd=root, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        if wait:
+            self.wait()
+        return self
+
+    def wait(self, timeout: float = 20) -> float:
+        """
+        Wait until webhook responds with 200
+        :return: seconds from process start to first 200 response
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                if requests.post(f"{self.url}/telegram", json={}, timeout=1).status_code == 200:
+                    return time.monotonic() - self.started
+            except requests.ConnectionError:
+                pass
+            time.sleep(0.01)
+        raise TimeoutError(f"Bot is not started on {self.url}")
+
+    def stop(self, timeout: float = 30) -> int:
+        """
+        Send SIGTERM and wait for exit
+        :return: exit code
+        """
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        return self.process.returncode
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+        self.directory.cleanup()
@@ -0,0 +1,126 @@
+import time
+import unittest
+from src.bot import Bot
+from src.api.telegram import Telegram
+from src.api.admission import Admission, ADMITTED, DEFERRED, SHED
+from src.benchmarks import percentile
+from src.intents.pizza import Pizza
+from src.tests.servers import FakeTelegram
+
+
+class SlowTelegram(Telegram):
+    """
+    Telegram api with slow updates handling (FSM or outbound sends backed up)
+    """
+    work = 0.02     # Seconds every update takes
+
+    def message_handle(self, chat_id, text):
+        time.sleep(self.work)
+        super().message_handle(chat_id, text)
+
+
+class TestAdmission(unittest.TestCase):
+    """
+    Admission control cases test class
+    """
+    def setUp(self) -> None:
+        self.submitted = []
+        self.admission = Admission(budget=4, new_share=0.5, deferred=4, busy_cooldown=30, clock=lambda: self.now)
+        self.now = 0.0
+
+    def admit(self, chat_id, dialog: bool):
+        return self.admission.admit(chat_id, dialog, lambda: self.submitted.append(chat_id) or True)
+
+    def test_budget(self):
+        """
+        New chats get their share of budget, dialogs the whole budget, then updates are deferred and shed
+        :return:
+        """
+        self.assertEqual([self.admit(chat_id, False) for chat_id in (1, 2, 3)], [ADMITTED, ADMITTED, DEFERRED])
+        self.assertEqual([self.admit(chat_id, True) for chat_id in (4, 5, 6)], [ADMITTED, ADMITTED, DEFERRED])
+        self.assertEqual(self.admit(7, False), SHED)            # New chats may use half of deferred queue
+        self.assertEqual([self.admit(chat_id, True) for chat_id in (8, 9, 10)], [DEFERRED, DEFERRED, SHED])
+        self.assertEqual(self.submitted, [1, 2, 4, 5])
+
+        # Finished updates let dialogs in first, new chat waits until in flight updates fit into its share
+        for _ in range(4):
+            self.admission.done()
+        self.assertEqual(self.submitted, [1, 2, 4, 5, 6, 8, 9])
+        self.assertEqual(self.admission.stats(), {'in_flight': 3, 'waiting': 1, 'admitted': 4, 'deferred': 4, 'shed': 2})
+        self.admission.done()
+        self.admission.done()
+        self.assertEqual(self.submitted[-1], 3)
+
+    def test_chat_order(self):
+        """
+        Update of a chat with deferred updates is deferred too, even when budget is free
+        :return:
+        """
+        for chat_id in (1, 2, 3, 4):
+            self.admit(chat_id, True)
+        self.assertEqual(self.admit(5, True), DEFERRED)
+        self.admission.done()
+        self.assertEqual(self.submitted[-1], 5)
+        self.assertEqual(self.admit(6, False), DEFERRED)
+        self.admission.done()
+        self.admission.done()
+        self.assertEqual(self.admit(6, True), DEFERRED)        # Budget is free, but update 6 is still waiting
+        self.admission.done()
+        self.admission.done()
+        self.assertEqual(self.submitted[-2:], [6, 6])
+
+    def test_busy_cooldown(self):
+        """
+        Shed chat gets busy reply once per cooldown
+        :return:
+        """
+        self.assertTrue(self.admission.busy(1))
+        self.assertFalse(self.admission.busy(1))
+        self.assertTrue(self.admission.busy(2))
+        self.now = 31.0
+        self.assertTrue(self.admission.busy(1))
+
+    def test_overload(self):
+        """
+        At 10x the load handling keeps up with, webhook p99 stays low, dialogs are not shed,
+        shed new chats get one busy reply
+        :return:
+        """
+        with FakeTelegram() as fake:
+            telegram = SlowTelegram(
+                token=fake.token, api=fake.api, webhook='http://127.0.0.1/telegram',
+                outbox={'rate': 0, 'chat_rate': 0}, dispatcher={'shards': 2, 'queue_size': 1000},
+                admission={'budget': 20, 'new_share': 0.5, 'deferred': 60, 'busy_text': 'busy'},
+            )
+            bot = Bot()
+            bot.register(telegram)
+            client = bot.get_app().test_client()
+
+            dialogs = list(range(1, 41))
+            for chat_id in dialogs:
+                session = Pizza(telegram)
+                session.state = 'ask_pizza_size'
+                telegram.clients.put(chat_id, session)
+
+            capacity = len(telegram.dispatcher.shards) / SlowTelegram.work      # Updates per second
+            interval = 1 / (capacity * 10)
+            latencies = []
+            started = time.perf_counter()
+            for i in range(600):
+                chat_id = dialogs[i // 15] if i % 15 == 0 else 1000 + i       # Every 15th update continues a dialog
+                text = 'большую' if chat_id in dialogs else 'привет'
+                time.sleep(max(started + i * interval - time.perf_counter(), 0))
+                sent = time.perf_counter()
+                resp = client.post('/telegram', json={'update_id': i + 1, 'message': {'chat': {'id': chat_id}, 'text': text}})
+                latencies.append(time.perf_counter() - sent)
+                self.assertEqual(resp.status_code, 200)
+
+            telegram.close()
+            stats = telegram.admission.stats()
+            self.assertLess(percentile(latencies, 0.99), 0.05)
+            self.assertGreater(stats['shed'], 0)
+            self.assertGreater(stats['deferred'], 0)
+            for chat_id in dialogs:
+                self.assertEqual(fake.sent(chat_id), ['Как вы будете платить?'], chat_id)
+            busy = fake.sent()
+            self.assertEqual(busy.count('busy'), stats['shed'])
@@ -0,0 +1,53 @@
+import os
+import tempfile
+import unittest
+from src.benchmarks.updates import UpdateGenerator, write_updates, read_updates
+from src.benchmarks.bot import FsmRunner, FlaskRunner, run, measure_memory
+
+
+class TestBenchmarks(unittest.TestCase):
+    """
+    Benchmark harness cases test class
+    """
+    def test_generator(self):
+        """
+        Same seed gives same updates, the mix has every kind of message
+        :return:
+        """
+        updates = list(UpdateGenerator(chats=50, seed=7).generate(2000))
+        self.assertEqual(updates, list(UpdateGenerator(chats=50, seed=7).generate(2000)))
+        self.assertEqual([update['update_id'] for update in updates], list(range(1, 2001)))
+
+        texts = [update['message'].get('text') for update in updates]
+        self.assertIn(None, texts)
+        self.assertIn('/start', texts)
+        for choices in (UpdateGenerator.sizes, UpdateGenerator.payments, UpdateGenerator.confirmations,
+                        UpdateGenerator.cancels, UpdateGenerator.junk):
+            self.assertTrue(set(choices) & set(texts))
+
+    def test_replay_log(self):
+        """
+        Updates log round trip, broken lines are skipped
+        :return:
+        """
+        updates = list(UpdateGenerator(chats=5).generate(20))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'updates.jsonl')
+            self.assertEqual(write_updates(path, updates), 20)
+            with open(path, 'a', encoding='utf-8') as file:
+                file.write('\n{broken\n')
+            self.assertEqual(list(read_updates(path)), updates)
+
+    def test_runners(self):
+        """
+        Both runners reply to every update and report results
+        :return:
+        """
+        updates = list(UpdateGenerator(chats=20).generate(200))
+        for runner in (FsmRunner, FlaskRunner):
+            result = run(runner, updates)
+            self.assertEqual(result['updates'], 200)
+            self.assertEqual(result['replies'], 200)
+            self.assertEqual(result['chats'], len({update['message']['chat']['id'] for update in updates}))
+            self.assertLessEqual(result['latency_ms']['p50'], result['latency_ms']['p99'])
+            self.assertGreater(measure_memory(runner, updates[:50]), 0)
@@ -0,0 +1,55 @@
+import unittest
+from src.intents.classifier import Automaton, MessageClassifier
+
+
+class TestClassifier(unittest.TestCase):
+    """
+    Message classifier cases test class
+    """
+    def setUp(self) -> None:
+        self.classifier = MessageClassifier(
+            slots={
+                'size': {'большую': r'больш[уюаяой]{2,}', 'маленькую': r'маленьк[уюаяой]{2,}'},
+                'payment': {'наличкой': r'наличк[уаойе]{1,2}', 'картой': r'карт[ыуаойе]{1,2}'},
+            },
+            words={'yes': ['Да', 'Согласен'], 'no': ['Нет', 'Не', 'Не согласен'], 'cancel': ['Выход']}
+        )
+
+    def test_slots(self):
+        """
+        All slots are found in one pass, first value in rules order wins
+        :return:
+        """
+        message = self.classifier.classify('Маленькую или БОЛЬШУЮ, оплачу картой')
+        self.assertEqual(message.slots, {'size': 'большую', 'payment': 'картой'})
+        self.assertEqual(self.classifier.classify('гигантскую').slots, {})
+
+    def test_words(self):
+        """
+        Overlapping and nested words are all found
+        :return:
+        """
+        message = self.classifier.classify('Нет, не согласен')
+        self.assertEqual(message.words, {'yes', 'no'})
+        self.assertEqual(self.classifier.classify('данет').words, {'yes', 'no'})
+        self.assertEqual(self.classifier.classify('что?').words, set())
+
+    def test_phrases(self):
+        """
+        Phrase matches only the whole text
+        :return:
+        """
+        self.assertEqual(self.classifier.classify('Выход').phrases, {'cancel'})
+        self.assertEqual(self.classifier.classify('выход сейчас').phrases, set())
+        self.assertEqual(self.classifier.classify('выход сейчас').words, {'cancel'})
+
+    def test_automaton_brute_force(self):
+        """
+        Automaton agrees with substring checks
+        :return:
+        """
+        words = {'he': 1, 'she': 2, 'his': 3, 'hers': 4, 'abcd': 5, 'bc': 6}
+        automaton = Automaton(words)
+        for text in ['ushers', 'ahishers', 'abcd', 'xbcx', 'hhe', '']:
+            found, _ = automaton.search(text)
+            self.assertEqual(found, {label for word, label in words.items() if word in text}, text)
@@ -0,0 +1,122 @@
+import os
+import tempfile
+import unittest
+import multiprocessing
+from unittest.mock import Mock
+from flask import Flask
+from src.api.telegram import Telegram
+from src.sessions.sqlite import SqliteBackend
+from src.tests.servers import Clock
+from src.utils.dedup import Deduplicator
+
+
+def receive(path: str, keys: list, fresh):
+    """
+    Check update ids with deduplicator of a worker sharing the sessions database (runs in child process)
+    """
+    backend = SqliteBackend(path, shared=True)
+    updates = Deduplicator(backend=backend)
+    for key in keys:
+        if not updates.seen(key):
+            with fresh.get_lock():
+                fresh.value += 1
+    backend.close()
+
+
+class TestDeduplicator(unittest.TestCase):
+    """
+    Update ids deduplication cases test class
+    """
+    def test_duplicates(self):
+        """
+        Repeated id is reported, rate is counted
+        :return:
+        """
+        updates = Deduplicator(capacity=10)
+        self.assertFalse(updates.seen(1))
+        self.assertTrue(updates.seen(1))
+        self.assertFalse(updates.seen(2))
+        self.assertEqual(updates.duplicates, 1)
+        self.assertAlmostEqual(updates.rate, 1 / 3)
+
+    def test_capacity(self):
+        """
+        Oldest id is forgotten when capacity is reached
+        :return:
+        """
+        updates = Deduplicator(capacity=3)
+        for key in range(4):
+            updates.seen(key)
+        self.assertEqual(updates.size, 3)
+        self.assertEqual(len(updates.index), 3)
+        self.assertFalse(updates.seen(0))
+        self.assertTrue(updates.seen(3))
+
+    def test_window(self):
+        """
+        Ids are forgotten after window
+        :return:
+        """
+        clock = Clock()
+        updates = Deduplicator(capacity=10, window=5, clock=clock)
+        updates.seen(1)
+        clock.now = 3
+        updates.seen(2)
+        clock.now = 6
+        self.assertFalse(updates.seen(1))
+        self.assertTrue(updates.seen(2))
+
+    def test_webhook_redelivery(self):
+        """
+        Redelivered webhook update does not reach handling
+        :return:
+        """
+        telegram = Telegram(token='token', api='http://127.0.0.1:9/bot', webhook='')
+        telegram.dispatcher = Mock()
+        app = Flask(__name__)
+        app.add_url_rule('/telegram', 'telegram', telegram.receive_message, methods=["POST"])
+        client = app.test_client()
+
+        update = {'update_id': 42, 'message': {'chat': {'id': 1}, 'text': 'привет'}}
+        for _ in range(3):
+            self.assertEqual(client.post('/telegram', json=update).status_code, 200)
+        client.post('/telegram', json={**update, 'update_id': 43})
+        self.assertEqual(telegram.dispatcher.submit.call_count, 2)
+        self.assertEqual(telegram.updates.duplicates, 2)
+
+    def test_shared_workers(self):
+        """
+        Update redelivered to another worker process is dropped, expired ids are purged
+        :return:
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'sessions.db')
+            SqliteBackend(path, shared=True).close()
+            context = multiprocessing.get_context('fork')
+            fresh = context.Value('i', 0)
+            keys = list(range(300))
+            processes = [context.Process(target=receive, args=(path, keys[::step], fresh)) for step in (1, -1)]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+                self.assertEqual(process.exitcode, 0)
+            self.assertEqual(fresh.value, len(keys))
+
+            backend = SqliteBackend(path, shared=True)
+            updates = Deduplicator(window=0, backend=backend)
+            self.assertFalse(updates.seen(1000))
+            self.assertEqual(backend.connect().execute('SELECT COUNT(*) FROM updates').fetchone()[0], 1)
+            backend.close()
+
+    def test_shared_sessions(self):
+        """
+        Api with shared sessions keeps seen ids in sessions database, other apis in memory
+        :return:
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'sessions.db')
+            for sessions, shared in [({'path': path, 'shared': True}, True), ({'path': path}, False), (None, False)]:
+                telegram = Telegram(token='token', api='http://127.0.0.1:9/bot', webhook='', sessions=sessions)
+                self.assertIs(telegram.updates.backend, telegram.clients.backend if shared else None)
+                telegram.close()
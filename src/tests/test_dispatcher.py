@@ -0,0 +1,83 @@
+import time
+import unittest
+from collections import defaultdict
+from threading import Thread
+from flask import Flask
+from src.api.dispatcher import Dispatcher
+from src.tests.servers import RecordingTelegram
+
+
+class TestDispatcher(unittest.TestCase):
+    """
+    Dispatcher cases test class
+    """
+    def test_order_and_parallelism(self):
+        """
+        Chat tasks run in order, different chats run in parallel
+        :return:
+        """
+        dispatcher = Dispatcher(shards=4)
+        done = defaultdict(list)
+        started = time.monotonic()
+        for i in range(5):
+            for chat_id in range(4):
+                dispatcher.submit(chat_id, lambda c=chat_id, n=i: (time.sleep(0.02), done[c].append(n)))
+        dispatcher.join()
+        self.assertLess(time.monotonic() - started, 4 * 5 * 0.02)
+        for chat_id in range(4):
+            self.assertEqual(done[chat_id], list(range(5)))
+        self.assertEqual(sum(shard['processed'] for shard in dispatcher.stats()), 20)
+        dispatcher.close()
+
+    def test_failed_task(self):
+        """
+        Failed task does not stop shard
+        :return:
+        """
+        dispatcher = Dispatcher(shards=1)
+        done = []
+        dispatcher.submit(1, lambda: 1 / 0)
+        dispatcher.submit(1, lambda: done.append(1))
+        dispatcher.join()
+        self.assertEqual(done, [1])
+        dispatcher.close()
+
+    def test_stress(self):
+        """
+        Interleaved webhook updates of many chats from concurrent requests end in correct dialog state
+        :return:
+        """
+        telegram = RecordingTelegram(dispatcher={'shards': 8})
+        app = Flask(__name__)
+        app.add_url_rule('/telegram', 'telegram', telegram.receive_message, methods=["POST"])
+
+        chats = 200
+        dialog = ['привет', None, 'картой']
+        senders = 8
+
+        def send(sender):
+            client = app.test_client()
+            for step in dialog:
+                for chat_id in range(sender, chats, senders):
+                    text = step or ('большую' if chat_id % 2 else 'маленькую')
+                    resp = client.post('/telegram', json={'message': {'chat': {'id': chat_id}, 'text': text}})
+                    self.assertEqual(resp.status_code, 200)
+
+        threads = [Thread(target=send, args=(sender,)) for sender in range(senders)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        telegram.dispatcher.join()
+
+        for chat_id in range(chats):
+            intent = telegram.clients.get(chat_id)
+            size = 'большую' if chat_id % 2 else 'маленькую'
+            self.assertEqual(intent.state, 'ask_order')
+            self.assertEqual(intent.order, {'size': size, 'payment': 'картой'})
+            self.assertEqual(telegram.replies[chat_id], [
+                "Какую вы хотите пиццу? Большую или маленькую?",
+                "Как вы будете платить?",
+                f"Вы хотите {size} пиццу, оплата - картой?",
+            ])
+        telegram.dispatcher.close()
@@ -0,0 +1,162 @@
+import time
+import random
+import unittest
+from unittest.mock import Mock, patch
+from src.intents.fuzzy import FuzzyIndex
+from src.intents.classifier import MessageClassifier
+from src.intents.pizza import Pizza
+
+# Dialogs with misspelled slot words (every message answers the question of its state)
+TYPO_DIALOGS = [
+    ['привет', 'болшую', 'налчкой', 'да'],
+    ['привет', 'бльшую', 'кратой', 'да'],
+    ['привет', 'маленкую', 'наличнми', 'да'],
+    ['привет', 'хочу малинькую', 'каротй', 'да'],
+    ['привет', 'большю пожалуйста', 'крточкой', 'да'],
+]
+
+
+class TestFuzzyIndex(unittest.TestCase):
+    """
+    Typo tolerant index cases test class
+    """
+    def test_edits(self):
+        """
+        Deletion, insertion, substitution and transposition are single edits, two edits are allowed in long words,
+        short words match exactly only
+        :return:
+        """
+        index = FuzzyIndex({'наличкой': 'cash', 'картой': 'card', 'карточкой': 'card', 'да': 'yes'})
+        self.assertEqual(index.lookup('наличкой'), ('cash', 1.0))
+        for typo in ['налчкой', 'наличккой', 'наличкай', 'налчикой']:
+            self.assertEqual(index.lookup(typo)[0], 'cash', typo)
+        self.assertEqual(index.lookup('каротй')[0], 'card')
+        self.assertIsNone(index.lookup('налчкй'))
+        self.assertIsNone(index.lookup('кот'))
+        self.assertIsNone(index.lookup('дп'))
+        self.assertLess(index.lookup('крточкй')[1], index.lookup('крточкой')[1])
+
+    def test_long_word(self):
+        """
+        Words longer than any vocabulary word plus max distance are rejected without building deletion variants
+        :return:
+        """
+        index = FuzzyIndex({'наличными': 'cash', 'картой': 'card'})
+        self.assertEqual(index.max_length, 9)
+        self.assertEqual(index.lookup('наличныммии')[0], 'cash')
+        self.assertIsNone(index.lookup('наличныммиии'))
+        started = time.perf_counter()
+        self.assertIsNone(index.lookup('я' * 4096))
+        classifier = Pizza.get_classifier()
+        rng = random.Random(1)
+        message = classifier.classify(' '.join(''.join(rng.choice('абвгдежз') for _ in range(800)) for _ in range(5)))
+        self.assertEqual(message.slots, {})
+        self.assertLess(time.perf_counter() - started, 0.5)
+
+    def test_brute_force(self):
+        """
+        Index agrees with distance to every vocabulary word
+        :return:
+        """
+        rng = random.Random(1)
+        alphabet = 'абвгдеклмнопрст'
+        words = {''.join(rng.choice(alphabet) for _ in range(rng.randint(3, 9))): i for i in range(300)}
+        index = FuzzyIndex(words)
+        for _ in range(300):
+            word = rng.choice(list(words))
+            position = rng.randrange(len(word))
+            query = word[:position] + rng.choice(alphabet) + word[position + 1:]
+            expected = min(
+                [
+                    (index.distance(query, other, index.allowed(len(other))) / len(other), index.order[other], other)
+                    for other in index.words
+                    if index.distance(query, other, index.allowed(len(other))) <= index.allowed(len(other))
+                ],
+                default=None
+            )
+            found = index.lookup(query)
+            if expected is None:
+                self.assertIsNone(found, query)
+            else:
+                self.assertEqual(found, (index.words[expected[2]], 1.0 - expected[0]), query)
+
+
+class TestFuzzySlots(unittest.TestCase):
+    """
+    Typo tolerant slots cases test class
+    """
+    def test_confidence(self):
+        """
+        Pattern matches are certain, misspelled words are matched with lower confidence
+        :return:
+        """
+        classifier = Pizza.get_classifier()
+        message = classifier.classify('большую, картой')
+        self.assertEqual(message.confidence, {'size': 1.0, 'payment': 1.0})
+        message = classifier.classify('болшую, налчкой')
+        self.assertEqual(message.slots, {'size': 'большую', 'payment': 'наличкой'})
+        self.assertLess(message.confidence['size'], message.confidence['payment'])
+        self.assertLess(message.confidence['payment'], 1.0)
+
+    def test_expected_slot(self):
+        """
+        Typo tolerant lookup runs only for the slot which is asked for and only if patterns missed it
+        :return:
+        """
+        classifier = Pizza.get_classifier()
+        with patch.object(classifier, 'match_fuzzy', wraps=classifier.match_fuzzy) as match_fuzzy:
+            message = classifier.classify('большую, налчкой')
+            self.assertEqual(message.slot('size'), ('большую', 1.0))
+            match_fuzzy.assert_not_called()
+            self.assertEqual(message.slot('payment')[0], 'наличкой')
+            self.assertEqual(message.slot('payment')[0], 'наличкой')
+            match_fuzzy.assert_called_once_with('большую, налчкой', 'payment')
+            self.assertEqual(classifier.classify('маленькую').slot('payment'), (None, 0.0))
+
+    def test_clarification_turns(self):
+        """
+        Misspelled dialogs are finished without clarifications, patterns alone ask for every slot again
+        :return:
+        """
+        strict = MessageClassifier(slots={'size': Pizza.pizza_size, 'payment': Pizza.payment_methods}, max_distance=0)
+        strict_clarifications = sum(
+            not strict.classify(text).slots for dialog in TYPO_DIALOGS for text in dialog[1:3]
+        )
+        self.assertEqual(strict_clarifications, 2 * len(TYPO_DIALOGS))
+
+        clarifications = 0
+        for dialog in TYPO_DIALOGS:
+            api = Mock()
+            intent = Pizza(api)
+            for text in dialog:
+                intent.next(chat_id=1, text=text)
+            replies = [call.kwargs['text'] for call in api.send_message.call_args_list]
+            clarifications += sum(reply.startswith('Я не совсем понимаю') for reply in replies)
+            self.assertEqual(replies[-1], 'Спасибо за заказ!', dialog)
+        self.assertEqual(clarifications, 0)
+
+    def test_low_confidence(self):
+        """
+        Too distant words still ask for clarification
+        :return:
+        """
+        for text in ['бшую', 'маленько']:
+            api = Mock()
+            intent = Pizza(api)
+            intent.machine.set_state('ask_pizza_size')
+            intent.next(chat_id=1, text=text)
+            self.assertEqual(intent.state, 'ask_pizza_size', text)
+
+    def test_real_words(self):
+        """
+        Real words close to short slot words are not slot values
+        :return:
+        """
+        classifier = Pizza.get_classifier()
+        for text, slot in [('больно', 'size'), ('карма', 'payment'), ('карета', 'payment'), ('наличие', 'payment')]:
+            self.assertEqual(classifier.classify(text).slots, {}, text)
+            api = Mock()
+            intent = Pizza(api)
+            intent.machine.set_state('ask_pizza_size' if slot == 'size' else 'ask_payment_method')
+            intent.next(chat_id=1, text=text)
+            self.assertTrue(api.send_message.call_args.kwargs['text'].startswith('Я не совсем понимаю'), text)
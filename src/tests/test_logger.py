@@ -0,0 +1,88 @@
+import io
+import json
+import logging
+import threading
+import unittest
+from queue import Queue
+from logging.handlers import QueueListener
+from src.utils.logger import CategoryLimiter, DeferredQueueHandler, JsonFormatter
+
+
+class Payload:
+    """
+    Object which remembers thread it was formatted in
+    """
+    def __init__(self):
+        self.formatted_in = []
+
+    def __str__(self):
+        self.formatted_in.append(threading.current_thread().name)
+        return 'payload'
+
+
+class TestLogger(unittest.TestCase):
+    """
+    Logging pipeline cases test class
+    """
+    def setUp(self) -> None:
+        self.stream = io.StringIO()
+        self.handler = logging.StreamHandler(self.stream)
+        self.queue = Queue()
+        self.listener = QueueListener(self.queue, self.handler)
+        self.listener.start()
+        self.logger = logging.getLogger(f"test.{self.id()}")
+        self.logger.propagate = False
+        self.logger.addHandler(DeferredQueueHandler(self.queue))
+
+    def tearDown(self) -> None:
+        self.listener.stop()
+
+    def test_deferred_formatting(self):
+        """
+        Payload is formatted by listener thread and is not formatted at all when level is disabled
+        :return:
+        """
+        payload = Payload()
+        self.logger.setLevel(logging.WARNING)
+        self.logger.info("Get updates: %s", payload)
+        self.logger.setLevel(logging.INFO)
+        self.logger.info("Get updates: %s", payload)
+        self.listener.stop()
+        self.assertEqual(len(payload.formatted_in), 1)
+        self.assertNotEqual(payload.formatted_in[0], threading.current_thread().name)
+        self.assertEqual(self.stream.getvalue(), "Get updates: payload\n")
+        self.listener.start()
+
+    def test_json_lines(self):
+        """
+        JSON formatter writes one object per line
+        :return:
+        """
+        self.handler.setFormatter(JsonFormatter())
+        self.logger.warning("Get message: %s", 'привет', extra={'category': 'update'})
+        self.listener.stop()
+        entry = json.loads(self.stream.getvalue())
+        self.assertEqual(entry['message'], "Get message: привет")
+        self.assertEqual(entry['category'], 'update')
+        self.assertEqual(entry['level'], 'WARNING')
+        self.listener.start()
+
+    def test_category_limit(self):
+        """
+        Records over category limit are dropped in current second
+        :return:
+        """
+        now = [0.0]
+        limiter = CategoryLimiter({'update': 2}, clock=lambda: now[0])
+        self.logger.addFilter(limiter)
+        for i in range(5):
+            self.logger.warning("update %s", i, extra={'category': 'update'})
+            self.logger.warning("other %s", i)
+        now[0] = 1.5
+        self.logger.warning("update %s", 5, extra={'category': 'update'})
+        self.listener.stop()
+        lines = self.stream.getvalue().splitlines()
+        self.assertEqual([line for line in lines if line.startswith('update')], ['update 0', 'update 1', 'update 5'])
+        self.assertEqual(len([line for line in lines if line.startswith('other')]), 5)
+        self.assertEqual(limiter.dropped, {'update': 3})
+        self.listener.start()
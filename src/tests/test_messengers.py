@@ -0,0 +1,194 @@
+import hmac
+import json
+import hashlib
+import unittest
+from src.bot import Bot
+from src.api.vk import Vk
+from src.api.facebook import Facebook
+from src.tests.servers import FakeVk, FakeFacebook
+
+DIALOG = [
+    ('привет', 'Какую вы хотите пиццу? Большую или маленькую?'),
+    ('большую', 'Как вы будете платить?'),
+    ('картой', 'Вы хотите большую пиццу, оплата - картой?'),
+    ('да', 'Спасибо за заказ!'),
+]
+FAST_OUTBOX = {'rate': 0, 'chat_rate': 0, 'backoff': 0.01}
+
+
+class TestVk(unittest.TestCase):
+    """
+    Vk Callback API cases test class
+    """
+    def setUp(self) -> None:
+        self.server = FakeVk().__enter__()
+        self.vk = Vk(token='token', confirmation='abc123', api=self.server.api, secret='secret', group_id=1, outbox=FAST_OUTBOX)
+        bot = Bot()
+        bot.register(self.vk)
+        self.client = bot.get_app().test_client()
+        self.event_id = 0
+
+    def tearDown(self) -> None:
+        self.vk.close()
+        self.server.__exit__(None, None, None)
+
+    def post(self, peer_id, text, **event):
+        self.event_id += 1
+        body = {
+            'type': 'message_new', 'group_id': 1, 'secret': 'secret', 'event_id': f"e{self.event_id}",
+            'object': {'message': {'peer_id': peer_id, 'from_id': peer_id, 'text': text}}, **event,
+        }
+        return self.client.post('/vk', json=body)
+
+    def test_confirmation(self):
+        """
+        Server confirmation and secret check
+        :return:
+        """
+        resp = self.client.post('/vk', json={'type': 'confirmation', 'group_id': 1, 'secret': 'secret'})
+        self.assertEqual(resp.get_data(as_text=True), 'abc123')
+        self.assertEqual(self.post(1, 'привет', secret='wrong').status_code, 403)
+        self.assertEqual(self.post(1, 'привет', group_id=2).status_code, 403)
+
+    def test_dialog(self):
+        """
+        Pizza dialog over Vk, redelivered event is handled once
+        :return:
+        """
+        for text, _ in DIALOG:
+            resp = self.post(7, text)
+            self.assertEqual(resp.get_data(as_text=True), 'ok')
+        self.client.post('/vk', json={
+            'type': 'message_new', 'group_id': 1, 'secret': 'secret', 'event_id': f"e{self.event_id}",
+            'object': {'message': {'peer_id': 7, 'text': 'да'}},
+        })
+        self.post(7, '', attachments=[{'type': 'sticker'}])
+        self.vk.dispatcher.join()
+        self.vk.outbox.flush()
+        self.assertEqual(self.server.sent(7), [reply for _, reply in DIALOG] + ["Я понимаю только текстовые сообщения!"])
+
+    def test_retry(self):
+        """
+        Rate limit error in 200 response is retried with the same random_id, other errors are dropped
+        :return:
+        """
+        self.server.fail(7, 200, {'error': {'error_code': 6, 'error_msg': 'Too many requests per second'}}, times=2)
+        self.server.fail(8, 200, {'error': {'error_code': 901, 'error_msg': 'Can\'t send messages without permission'}})
+        self.vk.send_message(7, 'hello')
+        self.vk.send_message(8, 'hello')
+        self.vk.outbox.flush()
+        self.assertEqual(self.server.sent(7), ['hello'])
+        self.assertEqual(self.server.sent(8), [])
+        attempts = [params['random_id'] for method, params, _, _ in self.server.calls if params.get('peer_id') == '7']
+        self.assertEqual(len(attempts), 3)
+        self.assertEqual(len(set(attempts)), 1)
+
+    def test_bulk(self):
+        """
+        Bulk send packs up to 100 peers into one call
+        :return:
+        """
+        self.vk.send_bulk(list(range(1, 251)), 'news')
+        self.vk.outbox.flush()
+        self.assertEqual(len(self.server.calls), 3)
+        self.assertEqual(len(self.server.sent()), 3)
+        self.assertEqual(self.server.sent(250), ['news'])
+
+    def test_coalesce(self):
+        """
+        Replies to a peer are merged, bulk messages are not
+        :return:
+        """
+        self.vk.close()
+        self.vk = Vk(token='token', confirmation='abc123', api=self.server.api, outbox={**FAST_OUTBOX, 'coalesce': 0.2})
+        self.vk.send_message(7, 'hello')
+        self.vk.send_message(7, 'again')
+        self.vk.send_bulk([1, 2], 'news')
+        self.vk.send_bulk([1, 3], 'more news')
+        self.vk.outbox.flush()
+        self.assertEqual(self.server.sent(7), ['hello\nagain'])
+        self.assertEqual(self.server.sent(1), ['news', 'more news'])
+
+
+class TestFacebook(unittest.TestCase):
+    """
+    Facebook Messenger cases test class
+    """
+    def setUp(self) -> None:
+        self.server = FakeFacebook().__enter__()
+        self.facebook = Facebook(token='token', verify_token='verify', app_secret='secret', api=self.server.api, outbox=FAST_OUTBOX)
+        bot = Bot()
+        bot.register(self.facebook)
+        self.client = bot.get_app().test_client()
+        self.mid = 0
+
+    def tearDown(self) -> None:
+        self.facebook.close()
+        self.server.__exit__(None, None, None)
+
+    def post(self, payload: dict, secret: bytes = b'secret'):
+        body = json.dumps(payload).encode('utf-8')
+        signature = 'sha256=' + hmac.new(secret, body, hashlib.sha256).hexdigest()
+        return self.client.post('/facebook', data=body, content_type='application/json', headers={'X-Hub-Signature-256': signature})
+
+    def messages(self, sender, *texts) -> dict:
+        events = []
+        for text in texts:
+            self.mid += 1
+            events.append({'sender': {'id': str(sender)}, 'recipient': {'id': '1'}, 'message': {'mid': f"m{self.mid}", 'text': text}})
+        return {'object': 'page', 'entry': [{'id': '1', 'messaging': events}]}
+
+    def test_verification(self):
+        """
+        Webhook verification handshake and signature check
+        :return:
+        """
+        resp = self.client.get('/facebook?hub.mode=subscribe&hub.verify_token=verify&hub.challenge=42')
+        self.assertEqual(resp.get_data(as_text=True), '42')
+        self.assertEqual(self.client.get('/facebook?hub.mode=subscribe&hub.verify_token=bad&hub.challenge=42').status_code, 403)
+        self.assertEqual(self.post(self.messages(5, 'привет'), secret=b'wrong').status_code, 403)
+
+    def test_dialog(self):
+        """
+        Pizza dialog over Facebook (several messages in one webhook batch), echoes and redeliveries are skipped
+        :return:
+        """
+        resp = self.post(self.messages(5, *[text for text, _ in DIALOG[:2]]))
+        self.assertEqual(resp.get_data(as_text=True), 'EVENT_RECEIVED')
+        payload = self.messages(5, *[text for text, _ in DIALOG[2:]])
+        self.post(payload)
+        self.post(payload)
+        self.post({'object': 'page', 'entry': [{'id': '1', 'messaging': [
+            {'sender': {'id': '1'}, 'recipient': {'id': '5'}, 'message': {'mid': 'echo', 'text': 'x', 'is_echo': True}},
+            {'sender': {'id': '5'}, 'recipient': {'id': '1'}, 'delivery': {'mids': ['m1']}},
+        ]}]})
+        self.facebook.dispatcher.join()
+        self.facebook.outbox.flush()
+        self.assertEqual(self.server.sent(5), [reply for _, reply in DIALOG])
+
+    def test_retry(self):
+        """
+        Rate limit and temporary errors are retried, permanent errors are dropped
+        :return:
+        """
+        self.server.fail(5, 400, {'error': {'code': 613, 'message': 'Calls to this api have exceeded the rate limit'}})
+        self.server.fail(5, 500, {'error': {'code': 2, 'message': 'Service temporarily unavailable'}})
+        self.server.fail(6, 400, {'error': {'code': 100, 'message': 'No matching user found'}})
+        self.facebook.send_message(5, 'hello')
+        self.facebook.send_message(6, 'hello')
+        self.facebook.outbox.flush()
+        self.assertEqual(self.server.sent(5), ['hello'])
+        self.assertEqual(len([call for call in self.server.calls if call[1]['recipient']['id'] == '6']), 1)
+
+    def test_coalesce(self):
+        """
+        Replies are merged within Send API text limit
+        :return:
+        """
+        self.facebook.close()
+        self.facebook = Facebook(token='token', verify_token='verify', api=self.server.api, outbox={**FAST_OUTBOX, 'coalesce': 0.2})
+        self.facebook.send_message(5, 'a' * 1500)
+        self.facebook.send_message(5, 'b')
+        self.facebook.send_message(5, 'c' * 600)
+        self.facebook.outbox.flush()
+        self.assertEqual(self.server.sent(5), ['a' * 1500 + '\nb', 'c' * 600])
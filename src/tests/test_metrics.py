@@ -0,0 +1,110 @@
+import unittest
+from src.bot import Bot
+from src.utils.metrics import Metrics, Histogram
+from src.tests.servers import RecordingTelegram
+
+
+class TestMetrics(unittest.TestCase):
+    """
+    Metrics and tracing cases test class
+    """
+    def assertExposition(self, text: str):
+        """
+        Every metric has one TYPE line followed by all its samples (prometheus text format)
+        :param text: rendered metrics
+        :return: metric name -> type
+        """
+        types = {}
+        current = None
+        for line in text.splitlines():
+            if line.startswith('# TYPE '):
+                name, kind = line[len('# TYPE '):].split(' ')
+                self.assertNotIn(name, types, line)
+                types[name] = current = name, kind
+            else:
+                name = line.split('{', 1)[0].split(' ', 1)[0]
+                self.assertIsNotNone(current, line)
+                suffixes = ('', '_bucket', '_sum', '_count') if current[1] == 'histogram' else ('',)
+                self.assertIn(name, [current[0] + suffix for suffix in suffixes], line)
+        return {name: kind for name, kind in types.values()}
+
+    def test_histogram(self):
+        """
+        Observations land in first bucket with bound not less than value
+        :return:
+        """
+        histogram = Histogram((0.1, 1))
+        for value in (0.05, 0.1, 0.5, 5):
+            histogram.observe(value)
+        self.assertEqual(histogram.counts, [2, 1, 1])
+        self.assertEqual(histogram.count, 4)
+        self.assertAlmostEqual(histogram.sum, 5.65)
+
+    def test_render(self):
+        """
+        Prometheus text has cumulative buckets, sum and count
+        :return:
+        """
+        Metrics().histogram('test_render_seconds', kind='a').observe(0.003)
+        Metrics().counter('test_render_total', kind='a').inc(2)
+        text = Metrics().render()
+        self.assertIn('# TYPE test_render_seconds histogram', text)
+        self.assertIn('test_render_seconds_bucket{kind="a",le="0.0025"} 0', text)
+        self.assertIn('test_render_seconds_bucket{kind="a",le="0.005"} 1', text)
+        self.assertIn('test_render_seconds_bucket{kind="a",le="+Inf"} 1', text)
+        self.assertIn('test_render_seconds_count{kind="a"} 1', text)
+        self.assertIn('test_render_total{kind="a"} 2', text)
+
+    def test_grouped(self):
+        """
+        Samples of a metric from several collectors are rendered together under one TYPE line
+        :return:
+        """
+        Metrics().counter('test_grouped_total', kind='a').inc()
+        Metrics().collector(lambda: [('test_grouped_depth', {'shard': 0}, 1), ('test_grouped_hits_total', {}, 5, 'counter')])
+        Metrics().collector(lambda: [('test_grouped_depth', {'shard': 1}, 2)])
+        Metrics().counter('test_grouped_total', kind='b').inc()
+        types = self.assertExposition(Metrics().render())
+        self.assertEqual(types['test_grouped_depth'], 'gauge')
+        self.assertEqual(types['test_grouped_hits_total'], 'counter')
+        self.assertEqual(types['test_grouped_total'], 'counter')
+
+    def test_endpoint(self):
+        """
+        Dialog over webhook is visible on /metrics, reply carries trace id of its update
+        :return:
+        """
+        bot = Bot()
+        telegram = RecordingTelegram()
+        bot.register(telegram)
+        client = bot.get_app().test_client()
+
+        for text in ('привет', 'большую', 'картой', 'да'):
+            resp = client.post('/telegram', json={'message': {'chat': {'id': 1}, 'text': text}})
+            self.assertEqual(resp.status_code, 200)
+        client.post('/telegram', json={'message': {'chat': {'id': 1}, 'sticker': {}}})
+        client.post('/telegram', json={'edited_message': {}})
+        telegram.dispatcher.join()
+
+        traces = telegram.traces[1]
+        self.assertTrue(all(traces))
+        self.assertEqual(len(traces), 5)
+        self.assertEqual(len(set(traces)), 5)       # Every update has its own trace
+
+        resp = client.get('/metrics')
+        self.assertEqual(resp.status_code, 200)
+        text = resp.get_data(as_text=True)
+        self.assertIn('telegram_update_parse_seconds_count', text)
+        self.assertIn('telegram_updates_total{result="non_text"}', text)
+        self.assertIn('telegram_updates_total{result="skipped"}', text)
+        self.assertIn(
+            'intent_event_seconds_count{intent="Pizza",outcome="ask_payment_method",state="ask_pizza_size",trigger="next"}',
+            text
+        )
+        self.assertIn('dispatcher_queue_depth{api="telegram",shard="0"} 0', text)
+        self.assertIn('sessions_size{api="telegram"} 1', text)
+        types = self.assertExposition(text)
+        self.assertEqual(types['sessions_size'], 'gauge')
+        self.assertEqual(types['sessions_misses_total'], 'counter')
+        self.assertEqual(types['dispatcher_queue_depth'], 'gauge')
+        telegram.close()
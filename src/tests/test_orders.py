@@ -0,0 +1,171 @@
+import os
+import stat
+import time
+import signal
+import tempfile
+import unittest
+import multiprocessing
+from threading import Thread, Event
+from unittest.mock import Mock, patch
+from src.intents.pizza import Pizza
+from src.orders import OrderJournal
+
+
+def confirm(path: str, acknowledged):
+    """
+    Append orders forever, count every durable one (runs in child process, killed by test)
+    """
+    journal = OrderJournal(path)
+    while True:
+        journal.append({'chat_id': acknowledged.value, 'size': 'большую', 'payment': 'картой'})
+        acknowledged.value += 1
+
+
+class TestOrderJournal(unittest.TestCase):
+    """
+    Orders journal cases test class
+    """
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'orders.jsonl')
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_tail_from_offset(self):
+        """
+        Consumer resumes from offset of last read order
+        :return:
+        """
+        journal = OrderJournal(self.path)
+        for chat_id in range(3):
+            journal.append({'chat_id': chat_id})
+        orders = list(OrderJournal.tail(self.path))
+        self.assertEqual([order['chat_id'] for _, order in orders], [0, 1, 2])
+        self.assertEqual([order['chat_id'] for _, order in OrderJournal.tail(self.path, orders[0][0])], [1, 2])
+        self.assertEqual(list(OrderJournal.tail(self.path, orders[-1][0])), [])
+        journal.close()
+
+    def test_follow(self):
+        """
+        Following consumer gets orders appended later
+        :return:
+        """
+        journal = OrderJournal(self.path)
+        stop = Event()
+        received = []
+
+        def consume():
+            for _, order in OrderJournal.tail(self.path, follow=True, interval=0.01, stop=stop):
+                received.append(order['chat_id'])
+
+        consumer = Thread(target=consume)
+        consumer.start()
+        for chat_id in range(5):
+            journal.append({'chat_id': chat_id})
+            time.sleep(0.01)
+        deadline = time.monotonic() + 5
+        while len(received) < 5 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        stop.set()
+        consumer.join()
+        self.assertEqual(received, [0, 1, 2, 3, 4])
+        journal.close()
+
+    @unittest.skipUnless(os.name == 'posix', "directory fsync is posix only")
+    def test_directory_sync(self):
+        """
+        Directory is fsynced once when journal file is created
+        :return:
+        """
+        synced = []
+
+        def fsync(fd):
+            synced.append(stat.S_ISDIR(os.fstat(fd).st_mode))
+            real_fsync(fd)
+
+        real_fsync = os.fsync
+        with patch('src.orders.os.fsync', side_effect=fsync):
+            journal = OrderJournal(self.path)
+            journal.append({'chat_id': 1})
+            journal.append({'chat_id': 2})
+            journal.close()
+            self.assertEqual(synced.count(True), 1)
+            journal = OrderJournal(self.path)
+            journal.append({'chat_id': 3})
+            journal.close()
+            self.assertEqual(synced.count(True), 1)
+
+    def test_crash(self):
+        """
+        Every acknowledged order survives process kill, torn record is cut on open
+        :return:
+        """
+        acknowledged = multiprocessing.Value('i', 0, lock=False)
+        process = multiprocessing.get_context('fork').Process(target=confirm, args=(self.path, acknowledged))
+        process.start()
+        deadline = time.monotonic() + 10
+        while acknowledged.value < 100 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        os.kill(process.pid, signal.SIGKILL)
+        process.join()
+        count = acknowledged.value
+        self.assertGreaterEqual(count, 100)
+
+        with open(self.path, 'ab') as file:
+            file.write(b'{"chat_id": 99999, "si')     # Record torn by crash
+        journal = OrderJournal(self.path)
+        journal.append({'chat_id': 'after restart'})
+        journal.close()
+
+        chat_ids = [order['chat_id'] for _, order in OrderJournal.tail(self.path)]
+        self.assertEqual(chat_ids[:count], list(range(count)))
+        self.assertEqual(chat_ids[-1], 'after restart')
+        self.assertNotIn(99999, chat_ids)
+
+    def test_group_commit(self):
+        """
+        Concurrent confirmations share fsyncs
+        :return:
+        """
+        journal = OrderJournal(self.path)
+        threads, orders = 16, 100
+
+        def confirm_orders(thread):
+            for i in range(orders):
+                journal.append({'chat_id': thread * orders + i})
+
+        workers = [Thread(target=confirm_orders, args=(thread,)) for thread in range(threads)]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        seconds = time.perf_counter() - started
+        journal.close()
+
+        self.assertEqual(sorted(order['chat_id'] for _, order in OrderJournal.tail(self.path)), list(range(threads * orders)))
+        self.assertLess(journal.syncs, threads * orders / 2)
+        self.assertGreater(threads * orders / seconds, 100)     # Durable orders per second
+
+    def test_confirmed_order(self):
+        """
+        Only confirmed pizza orders are written
+        :return:
+        """
+        api = Mock()
+        api.name = 'telegram'
+        api.orders = OrderJournal(self.path)
+        for answer in ('да', 'нет'):
+            intent = Pizza(api)
+            for text in ('привет', 'маленькую', 'картой', answer):
+                intent.next(chat_id=7, text=text, trace_id='trace')
+        api.orders.close()
+
+        orders = [order for _, order in OrderJournal.tail(self.path)]
+        self.assertEqual(len(orders), 1)
+        self.assertEqual(orders[0]['size'], 'маленькую')
+        self.assertEqual(orders[0]['payment'], 'картой')
+        self.assertEqual(orders[0]['messenger'], 'telegram')
+        self.assertEqual(orders[0]['chat_id'], 7)
+        self.assertEqual(orders[0]['trace_id'], 'trace')
@@ -0,0 +1,191 @@
+import os
+import time
+import unittest
+from src.api.outbox import Outbox, RateLimit
+from src.api.telegram import Telegram
+from src.tests.servers import FakeTelegram
+from src.utils.metrics import Metrics
+
+
+class TestOutbox(unittest.TestCase):
+    """
+    Outbound queue cases test class (against local fake telegram api)
+    """
+    def setUp(self) -> None:
+        self.server = FakeTelegram().__enter__()
+        self.outbox = None
+
+    def tearDown(self) -> None:
+        if self.outbox:
+            self.outbox.close()
+        self.server.__exit__()
+
+    def create(self, **kwargs) -> Outbox:
+        self.outbox = Outbox(f"{self.server.api}{self.server.token}/sendMessage", **kwargs)
+        return self.outbox
+
+    def test_chat_order(self):
+        """
+        Messages of a chat are delivered in FIFO order
+        :return:
+        """
+        outbox = self.create(workers=4, rate=0, chat_rate=0)
+        for i in range(20):
+            for chat_id in range(10):
+                outbox.put(chat_id, {'chat_id': chat_id, 'text': str(i)})
+        outbox.flush()
+        for chat_id in range(10):
+            self.assertEqual(self.server.sent(chat_id), [str(i) for i in range(20)])
+
+    def test_pooled_connections(self):
+        """
+        Workers reuse keep-alive connections
+        :return:
+        """
+        outbox = self.create(workers=2, rate=0, chat_rate=0)
+        for i in range(50):
+            outbox.put(i, {'chat_id': i, 'text': 'hi'})
+        outbox.flush()
+        self.assertEqual(len(self.server.sent()), 50)
+        self.assertLessEqual(len({client for _, _, client, _ in self.server.calls}), 2)
+
+    @unittest.skipUnless(hasattr(os, 'fork'), "fork is not available")
+    def test_forked_pool(self):
+        """
+        Forked process (server worker) does not send over connections of parent
+        :return:
+        """
+        outbox = self.create(workers=1, rate=0, chat_rate=0)
+        outbox.session.post(f"{self.server.api}{self.server.token}/getWebhookInfo")     # Webhook call before fork
+        parent = outbox.session
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                if outbox.session is not parent:
+                    outbox.put(1, {'chat_id': 1, 'text': 'from worker'})
+                    outbox.flush()
+                    code = 0
+            finally:
+                os._exit(code)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(os.waitstatus_to_exitcode(status), 0)
+        self.assertIs(outbox.session, parent)
+        self.assertEqual(self.server.sent(1), ['from worker'])
+        self.assertEqual(len({client for _, _, client, _ in self.server.calls}), 2)
+
+    def test_retry_after(self):
+        """
+        429 is retried after "retry_after", chat order is kept
+        :return:
+        """
+        outbox = self.create(workers=1, rate=0, chat_rate=0)
+        self.server.fail(1, 429, {'ok': False, 'error_code': 429, 'parameters': {'retry_after': 0.3}})
+        started = time.monotonic()
+        outbox.put(1, {'chat_id': 1, 'text': 'first'})
+        outbox.put(1, {'chat_id': 1, 'text': 'second'})
+        outbox.put(2, {'chat_id': 2, 'text': 'other'})
+        outbox.flush()
+        self.assertGreaterEqual(time.monotonic() - started, 0.3)
+        self.assertEqual(self.server.sent(1), ['first', 'second'])
+        self.assertEqual(self.server.sent(2), ['other'])
+
+    def test_client_error_dropped(self):
+        """
+        Message rejected by api is dropped, next messages are delivered
+        :return:
+        """
+        outbox = self.create(workers=1, rate=0, chat_rate=0)
+        self.server.fail(1, 400, {'ok': False, 'error_code': 400})
+        outbox.put(1, {'chat_id': 1, 'text': 'bad'})
+        outbox.put(1, {'chat_id': 1, 'text': 'good'})
+        outbox.flush()
+        self.assertEqual(self.server.sent(1), ['good'])
+
+    def test_chat_rate(self):
+        """
+        Per chat rate limit spaces messages of a chat
+        :return:
+        """
+        outbox = self.create(workers=1, rate=0, chat_rate=10, chat_burst=1)
+        started = time.monotonic()
+        for i in range(5):
+            outbox.put(1, {'chat_id': 1, 'text': str(i)})
+        outbox.flush()
+        self.assertGreaterEqual(time.monotonic() - started, 0.4)
+
+    def test_coalesce(self):
+        """
+        Messages of a chat queued within coalescing window are sent as one, in order, up to max length
+        :return:
+        """
+        telegram = Telegram(token=self.server.token, api=self.server.api, webhook='',
+                            outbox={'rate': 0, 'chat_rate': 0, 'coalesce': 0.2})
+        self.outbox = telegram.outbox
+        telegram.max_length = 12
+        coalesced = Metrics().counter('outbox_coalesced_total', api='telegram').value
+        for text in ('one', 'two', 'three', 'four'):
+            telegram.send_message(1, text)
+        telegram.send_message(2, 'other')
+        telegram.outbox.flush()
+        self.assertEqual(self.server.sent(1), ['one\ntwo', 'three\nfour'])
+        self.assertEqual(self.server.sent(2), ['other'])
+        self.assertEqual(len(self.server.calls), 3)
+        self.assertEqual(Metrics().counter('outbox_coalesced_total', api='telegram').value - coalesced, 2)
+
+    def test_coalesce_dialog(self):
+        """
+        Replies to quick messages of a dialog (cancel and new order) are merged
+        :return:
+        """
+        telegram = Telegram(token=self.server.token, api=self.server.api, webhook='',
+                            outbox={'rate': 0, 'chat_rate': 0, 'coalesce': 0.3})
+        self.outbox = telegram.outbox
+        telegram.handle_updates([
+            {'update_id': i + 1, 'message': {'chat': {'id': 1}, 'text': text}} for i, text in enumerate(['привет', 'выход', 'привет'])
+        ])
+        telegram.dispatcher.join()
+        telegram.outbox.flush()
+        question = 'Какую вы хотите пиццу? Большую или маленькую?'
+        self.assertEqual(self.server.sent(1), [f"{question}\nОк, спасибо за обращение!\n{question}"])
+
+    def test_split(self):
+        """
+        Text over platform max length is sent in parts, broken at line or word breaks
+        :return:
+        """
+        telegram = Telegram(token=self.server.token, api=self.server.api, webhook='')
+        self.outbox = telegram.outbox
+        self.assertEqual(telegram.split('short'), ['short'])
+        text = '\n'.join(['word ' * 100] * 20)
+        parts = telegram.split(text)
+        self.assertTrue(all(len(part) <= telegram.max_length for part in parts))
+        self.assertEqual(' '.join(parts).split(), text.split())
+        self.assertEqual(telegram.split('x' * 5000), ['x' * 4096, 'x' * 904])
+
+    def test_rate_limit(self):
+        """
+        Rate limit reservations
+        :return:
+        """
+        limit = RateLimit(10, burst=2)
+        delay, tat = limit.reserve(0.0, 100.0)
+        self.assertEqual(delay, 0.0)
+        delay, tat = limit.reserve(tat, 100.0)
+        self.assertEqual(delay, 0.0)
+        delay, tat = limit.reserve(tat, 100.0)
+        self.assertAlmostEqual(delay, 0.1)
+
+    def test_webhook_not_blocked(self):
+        """
+        Telegram.send_message returns before slow api responds
+        :return:
+        """
+        self.server.latency = 0.5
+        telegram = Telegram(token=self.server.token, api=self.server.api, webhook='')
+        self.outbox = telegram.outbox
+        started = time.monotonic()
+        telegram.send_message(1, 'hi')
+        self.assertLess(time.monotonic() - started, 0.2)
+        telegram.outbox.flush()
+        self.assertEqual(self.server.sent(1), ['hi'])
@@ -118,4 +118,31 @@ class TestPizza(unittest.TestCase):
         self.intent.next(chat_id='', text='Воздухом')
         self.assertIsNone(self.intent.order['payment'])
         self.assertEqual(self.intent.state, 'ask_payment_method')
-        self.intent.order['payment'] = None
\ No newline at end of file
+        self.intent.order['payment'] = None
+
+
+class TestPizzaSessions(unittest.TestCase):
+    """
+    Shared machine cases test class
+    """
+    def test_machine_shared(self):
+        """
+        Machine is built once per intent class
+        :return:
+        """
+        first, second = Pizza(Mock()), Pizza(Mock())
+        self.assertIs(first.machine.machine, second.machine.machine)
+        self.assertFalse(hasattr(first, '__dict__'))
+
+    def test_sessions_independent(self):
+        """
+        Sessions do not share state and order
+        :return:
+        """
+        first, second = Pizza(Mock()), Pizza(Mock())
+        first.next(chat_id=1, text='привет')
+        first.next(chat_id=1, text='маленькую')
+        self.assertEqual(first.state, 'ask_payment_method')
+        self.assertEqual(first.order['size'], 'маленькую')
+        self.assertEqual(second.state, 'start')
+        self.assertEqual(second.order['size'], 'большую')
@@ -0,0 +1,56 @@
+import time
+import unittest
+from src.api.telegram import Telegram
+from src.tests.servers import FakeTelegram
+
+
+class TestPolling(unittest.TestCase):
+    """
+    getUpdates polling cases test class (against local fake telegram api)
+    """
+    def setUp(self) -> None:
+        self.server = FakeTelegram().__enter__()
+        self.telegram = Telegram(
+            token=self.server.token, api=self.server.api, webhook='',
+            mode='polling', polling={'limit': 2, 'timeout': 1},
+            outbox={'rate': 0, 'chat_rate': 0},
+        )
+
+    def tearDown(self) -> None:
+        self.telegram.stop_polling()
+        self.telegram.dispatcher.close()
+        self.telegram.outbox.close()
+        self.server.__exit__()
+
+    def wait_sent(self, count: int, timeout: float = 5):
+        deadline = time.monotonic() + timeout
+        while len(self.server.sent()) < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.telegram.dispatcher.join()
+        self.telegram.outbox.flush()
+
+    def test_batches(self):
+        """
+        Scripted batches are handled in order, offset confirms every batch
+        :return:
+        """
+        self.server.push(
+            {'chat': {'id': 1}, 'text': 'привет'},
+            {'chat': {'id': 2}, 'text': 'привет'},
+            {'chat': {'id': 1}, 'text': 'большую'},
+        )
+        self.telegram.register(app=None)
+        self.wait_sent(3)
+        self.server.push({'chat': {'id': 1}, 'text': 'картой'}, {'chat': {'id': 3}})
+        self.wait_sent(5)
+
+        self.assertEqual(self.telegram.clients.get(1).state, 'ask_order')
+        self.assertEqual(self.telegram.clients.get(2).state, 'ask_pizza_size')
+        self.assertEqual(self.server.sent(3), ["Я понимаю только текстовые сообщения!"])
+
+        self.telegram.stop_polling()
+        methods = [method for method, _, _, _ in self.server.calls]
+        self.assertEqual(methods[0], 'deleteWebhook')
+        offsets = [params.get('offset') for method, params, _, _ in self.server.calls if method == 'getUpdates']
+        self.assertEqual(offsets[:3], [None, '3', '4'])
+        self.assertIn('6', offsets)
@@ -0,0 +1,134 @@
+import unittest
+from contextlib import nullcontext
+from src.bot import Bot
+from src.api.telegram import Telegram
+from src.tests.servers import FakeTelegram
+from src.tests.test_admission import SlowTelegram
+from src.utils.profiler import Profiler, CallStacks
+
+DIALOG = ['привет', 'большую', 'картой', 'да']
+
+
+class TestProfiler(unittest.TestCase):
+    """
+    Updates profiler and admin routes cases test class
+    """
+    def setUp(self) -> None:
+        self.server = FakeTelegram().__enter__()
+        self.telegram = None
+        self.update_id = 0
+
+    def tearDown(self) -> None:
+        Profiler().configure()
+        if self.telegram:
+            self.telegram.close()
+        self.server.__exit__(None, None, None)
+
+    def create(self, api_class=Telegram, **options):
+        self.telegram = api_class(
+            token=self.server.token, api=self.server.api, webhook='http://127.0.0.1/telegram', outbox={'rate': 0, 'chat_rate': 0},
+        )
+        bot = Bot()
+        bot.profile(**{'token': 'secret', **options})
+        bot.register(self.telegram)
+        return bot.get_app().test_client()
+
+    def post(self, client, chat_id, *texts):
+        for text in texts:
+            self.update_id += 1
+            client.post('/telegram', json={'update_id': self.update_id, 'message': {'chat': {'id': chat_id}, 'text': text}})
+        self.telegram.dispatcher.join()
+
+    @staticmethod
+    def get(client, url):
+        return client.get(url, headers={'X-Admin-Token': 'secret'})
+
+    def test_sampled_stacks(self):
+        """
+        Sampled updates give collapsed stacks of receive and handle parts
+        :return:
+        """
+        client = self.create(sample_every=2)
+        self.post(client, 1, *DIALOG)
+        resp = self.get(client, '/admin/profile')
+        stacks = {}
+        for line in resp.get_data(as_text=True).splitlines():
+            key, micros = line.rsplit(' ', 1)
+            stacks[key] = int(micros)
+        self.assertTrue(any(key.startswith('receive;') for key in stacks))
+        self.assertTrue(any('src.api:Api.message_handle' in key and 'src.intents:Intent.trigger' in key for key in stacks))
+        self.assertTrue(all(key.split(';', 1)[0] in ('receive', 'handle') for key in stacks))
+        self.assertEqual(Profiler().stats()['sampled'], 2)
+
+        self.get(client, '/admin/profile?reset=1')
+        self.assertEqual(self.get(client, '/admin/profile').get_data(as_text=True), '')
+
+    def test_slow_updates(self):
+        """
+        Updates over threshold are captured with payload, transitions and timings, ring buffer keeps the latest ones
+        :return:
+        """
+        client = self.create(type('SlowerTelegram', (SlowTelegram,), {'work': 0.05}), slow_threshold=0.04, slow_capacity=3)
+        self.post(client, 1, *DIALOG)
+        updates = self.get(client, '/admin/slow').get_json()['updates']
+        self.assertEqual([update['payload']['message']['text'] for update in updates], DIALOG[1:])
+        self.assertEqual(
+            [(t['intent'], t['source'], t['outcome']) for t in updates[0]['transitions']],
+            [('Pizza', 'ask_pizza_size', 'ask_payment_method')],
+        )
+        timings = updates[-1]['timings']
+        self.assertGreaterEqual(timings['handle'], 0.05)
+        self.assertAlmostEqual(timings['total'], timings['receive'] + timings['wait'] + timings['handle'])
+        self.assertIsNotNone(updates[-1]['trace_id'])
+
+    def test_fast_updates_not_captured(self):
+        """
+        Updates under threshold are not captured
+        :return:
+        """
+        client = self.create(slow_threshold=10)
+        self.post(client, 1, *DIALOG)
+        self.assertEqual(self.get(client, '/admin/slow').get_json()['updates'], [])
+        self.assertEqual(self.get(client, '/admin/profile').get_data(as_text=True), '')
+
+    def test_token(self):
+        """
+        Admin routes require token, they are not registered without it or with config placeholder
+        :return:
+        """
+        client = self.create(slow_threshold=0)
+        self.assertEqual(client.get('/admin/slow').status_code, 403)
+        self.assertEqual(client.get('/admin/profile', headers={'X-Admin-Token': 'wrong'}).status_code, 403)
+        self.assertEqual(self.get(client, '/admin/slow').status_code, 200)
+        for token in (None, '', '<token>'):
+            bot = Bot()
+            bot.profile(token=token, slow_threshold=0)
+            client = bot.get_app().test_client()
+            self.assertEqual(client.get('/admin/slow', headers={'X-Admin-Token': token or ''}).status_code, 404)
+
+    def test_off(self):
+        """
+        Profiler is off by default, updates get no profile
+        :return:
+        """
+        profiler = Profiler()
+        self.assertFalse(profiler.active)
+        self.assertIsInstance(profiler.update('telegram', {}), nullcontext)
+
+    def test_call_stacks(self):
+        """
+        Self time is charged to collapsed stack of every function
+        :return:
+        """
+        def leaf():
+            return sum(range(1000))
+
+        def parent():
+            return leaf() + leaf()
+
+        with CallStacks('root') as stacks:
+            parent()
+        keys = set(stacks.times)
+        prefix = f"root;{__name__}:TestProfiler.test_call_stacks.<locals>"
+        self.assertIn(f"{prefix}.parent", keys)
+        self.assertIn(f"{prefix}.parent;{__name__}:TestProfiler.test_call_stacks.<locals>.leaf;builtins:sum", keys)
@@ -0,0 +1,138 @@
+import os
+import sys
+import unittest
+import subprocess
+from threading import Thread, Barrier
+from src.intents import Intent
+from src.intents.pizza import Pizza
+from src.intents.router import IntentRouter, NgramHasher
+from src.tests.servers import RecordingTelegram
+
+
+class Support(Intent):
+    """
+    Second intent for routing cases
+    """
+    states = ['start', 'ask_order_number']
+    transitions = [
+        {'trigger': 'next', 'source': 'start', 'dest': 'ask_order_number', 'after': ['send_order_number_question']},
+        {'trigger': 'next', 'source': 'ask_order_number', 'dest': 'start'},
+    ]
+    examples = [
+        'где мой заказ', 'заказ не приехал', 'курьер опаздывает', 'жалоба', 'верните деньги',
+        'позовите оператора', 'проблема с заказом', 'долго везут',
+    ]
+
+    __slots__ = ('api', 'state')
+
+    def __init__(self, api):
+        self.api = api
+        self.state = self.initial
+
+    def send_order_number_question(self, event):
+        self.api.send_message(chat_id=event.kwargs.get("chat_id"), text="Назовите номер заказа")
+
+
+class TestIntentRouter(unittest.TestCase):
+    """
+    Intent router cases test class
+    """
+    def test_hasher(self):
+        """
+        Every n-gram of padded text is counted once, texts of a batch do not share n-grams
+        :return:
+        """
+        hasher = NgramHasher(bits=16)
+        matrix = hasher.transform(['ab', 'abc', ''])
+        self.assertEqual(matrix.shape, (3, 1 << 16))
+        self.assertEqual([int(count) for count in (matrix > 0).sum(axis=1)], [6, 9, 1])
+        self.assertAlmostEqual(float((matrix[1] ** 2).sum()), 1.0, places=5)
+        self.assertTrue((hasher.transform(['abc'])[0] == matrix[1]).all())
+
+    def test_route(self):
+        """
+        Message starts the most probable intent, unsure messages start default one
+        :return:
+        """
+        router = IntentRouter([Pizza, Support])
+        self.assertIs(router.route('хочу большую пиццу'), Pizza)
+        self.assertIs(router.route('Где мой заказ?'), Support)
+        self.assertIs(router.route('курьер где'), Support)
+        self.assertEqual(router.classify(['пиццу пожалуйста', 'оператора позовите']), [Pizza, Support])
+        self.assertIs(IntentRouter([Pizza, Support], default=Support, threshold=0.99).route('ммм'), Support)
+        self.assertIs(IntentRouter([Pizza]).route('где мой заказ'), Pizza)
+
+    def test_lazy_numpy(self):
+        """
+        Bot with a single intent does not import numpy (startup time)
+        :return:
+        """
+        code = (
+            "import sys; from src.api.telegram import Telegram; "
+            "telegram = Telegram(token='token', api='http://127.0.0.1:1/bot', webhook=''); "
+            "telegram.router.route('привет'); print('numpy' in sys.modules)"
+        )
+        root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        result = subprocess.run([sys.executable, '-c', code], cwd=root, capture_output=True, text=True, timeout=60)
+        self.assertEqual(result.stdout.strip(), 'False', result.stderr)
+
+    def test_registry(self):
+        """
+        Built-in intents are registered without importing their modules (adapter alone, snapshot sessions)
+        :return:
+        """
+        code = (
+            "import tempfile; from src.api.vk import Vk; "
+            "vk = Vk(token='token', confirmation='ok', sessions={'snapshot': tempfile.mkdtemp()}); "
+            "print([name for name, _ in vk.clients.backend.intents], [intent.__name__ for intent in vk.router.intents])"
+        )
+        root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        result = subprocess.run([sys.executable, '-c', code], cwd=root, capture_output=True, text=True, timeout=60)
+        self.assertEqual(result.stdout.strip(), "['Pizza'] ['Pizza']", result.stderr)
+
+    def test_micro_batches(self):
+        """
+        Concurrent messages are scored together, a batch holds at most one message of every thread
+        :return:
+        """
+        router = IntentRouter([Pizza, Support])
+        router.build()
+        threads, messages = 8, 50
+        barrier = Barrier(threads)
+        results = [[] for _ in range(threads)]
+
+        def route(index):
+            barrier.wait()
+            for i in range(messages):
+                text = 'хочу пиццу' if (index + i) % 2 else 'где мой заказ'
+                results[index].append((text, router.route(text)))
+
+        workers = [Thread(target=route, args=(index,)) for index in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        for routed in results:
+            for text, intent in routed:
+                self.assertIs(intent, Pizza if text == 'хочу пиццу' else Support)
+        self.assertEqual(router.routed, threads * messages)
+        self.assertLess(router.batches, threads * messages)
+        self.assertLessEqual(router.largest, threads)
+
+    def test_dialog(self):
+        """
+        Routed intent handles the whole dialog of a chat
+        :return:
+        """
+        telegram = RecordingTelegram(router={'intents': ['Pizza', 'Support']})
+        telegram.message_handle(1, 'где мой заказ')
+        telegram.message_handle(1, 'хочу пиццу')    # Answer to support question, not a new dialog
+        telegram.message_handle(2, 'хочу пиццу')
+        self.assertEqual(telegram.replies[1], ["Назовите номер заказа"])
+        self.assertEqual(telegram.replies[2], ["Какую вы хотите пиццу? Большую или маленькую?"])
+        self.assertIsInstance(telegram.clients.get(2), Pizza)
+        telegram.message_handle(1, 'хочу пиццу')    # Support dialog is finished, message is routed again
+        self.assertEqual(telegram.replies[1][-1], "Какую вы хотите пиццу? Большую или маленькую?")
+        self.assertIsInstance(telegram.clients.get(1), Pizza)
+        telegram.close()
@@ -0,0 +1,32 @@
+import unittest
+import requests
+from src.tests.servers import FakeTelegram, BotProcess
+
+
+class TestServer(unittest.TestCase):
+    """
+    Server modes cases test class (bot runs in subprocess against local fake telegram api)
+    """
+    def dialog(self, server: dict):
+        with FakeTelegram(latency=0.2) as telegram:
+            with BotProcess(telegram.api, server=server) as bot:
+                for text in ('привет', 'большую'):
+                    resp = requests.post(f"{bot.url}/telegram", json={'message': {'chat': {'id': 7}, 'text': text}})
+                    self.assertEqual(resp.status_code, 200)
+                # Replies are still queued (api answers slowly), SIGTERM should drain them
+                self.assertEqual(bot.stop(), 0)
+            self.assertEqual(telegram.sent(7), ["Какую вы хотите пиццу? Большую или маленькую?", "Как вы будете платить?"])
+
+    def test_flask_drain(self):
+        """
+        Development server drains queued replies on SIGTERM
+        :return:
+        """
+        self.dialog({'name': 'flask'})
+
+    def test_gunicorn_drain(self):
+        """
+        Gunicorn worker drains queued replies on SIGTERM
+        :return:
+        """
+        self.dialog({'name': 'gunicorn', 'workers': 1, 'threads': 4})
@@ -0,0 +1,291 @@
+import os
+import time
+import tempfile
+import unittest
+import multiprocessing
+from unittest.mock import Mock
+from src.intents.pizza import Pizza
+from src.sessions import SessionStore
+from src.sessions.sqlite import SqliteBackend
+from src.sessions.snapshot import SnapshotBackend, Segment
+from src.sessions.locks import ChatLocks
+from src.tests.servers import Clock
+
+
+def increment(path: str, times: int):
+    """
+    Read-increment-write counter file under chat lock (runs in child process)
+    """
+    locks = ChatLocks(f"{path}.lock")
+    for _ in range(times):
+        with locks(1):
+            with open(path) as file:
+                value = int(file.read())
+            with open(path, 'w') as file:
+                file.write(str(value + 1))
+
+
+def advance(path: str, text: str):
+    """
+    Handle one dialog message with shared store (runs in child process)
+    """
+    store = SessionStore(Mock(), backend=SqliteBackend(path, shared=True))
+    with store.lock_chat(1):
+        intent = store.get(1) or Pizza(Mock())
+        intent.next(chat_id=1, text=text)
+        store.put(1, intent)
+    store.close()
+
+
+class TestSessionStore(unittest.TestCase):
+    """
+    Sessions store cases test class
+    """
+    def setUp(self) -> None:
+        self.api = Mock()
+        self.clock = Clock()
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'sessions.db')
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_capacity(self):
+        """
+        Least recently used session is evicted when capacity is reached
+        :return:
+        """
+        store = SessionStore(self.api, capacity=2, clock=self.clock)
+        for chat_id in (1, 2):
+            store.put(chat_id, Pizza(self.api))
+        store.get(1)
+        store.put(3, Pizza(self.api))
+        self.assertIsNotNone(store.get(1))
+        self.assertIsNone(store.get(2))
+        self.assertEqual(len(store), 2)
+        self.assertEqual(store.stats()['evictions'], 1)
+
+    def test_has_dialog(self):
+        """
+        Only sessions out of initial state have dialog (admission priority)
+        :return:
+        """
+        store = SessionStore(self.api, clock=self.clock)
+        self.assertFalse(store.has_dialog(1))
+        intent = Pizza(self.api)
+        store.put(1, intent)
+        self.assertFalse(store.has_dialog(1))
+        intent.next(chat_id=1, text='привет')
+        self.assertTrue(store.has_dialog(1))
+        intent.next(chat_id=1, text='выход')
+        self.assertFalse(store.has_dialog(1))
+
+    def test_ttl(self):
+        """
+        Idle sessions are evicted after ttl
+        :return:
+        """
+        store = SessionStore(self.api, ttl=10, clock=self.clock)
+        store.put(1, Pizza(self.api))
+        self.clock.now = 5
+        store.put(2, Pizza(self.api))
+        self.clock.now = 12
+        self.assertIsNone(store.get(1))
+        self.assertIsNotNone(store.get(2))
+        self.assertEqual(store.stats()['expirations'], 1)
+        self.assertEqual(store.stats()['hits'], 1)
+        self.assertEqual(store.stats()['misses'], 1)
+
+    def test_rehydration(self):
+        """
+        Evicted session is restored from sqlite backend with its state and order
+        :return:
+        """
+        store = SessionStore(self.api, capacity=1, backend=SqliteBackend(self.path), clock=self.clock)
+        intent = Pizza(self.api)
+        intent.next(chat_id=1, text='привет')
+        intent.next(chat_id=1, text='маленькую')
+        store.put(1, intent)
+        store.put(2, Pizza(self.api))
+
+        restored = store.get(1)
+        self.assertIsNot(restored, intent)
+        self.assertEqual(restored.state, 'ask_payment_method')
+        self.assertEqual(restored.order['size'], 'маленькую')
+        self.assertEqual(store.stats()['restores'], 1)
+        store.close()
+
+    def test_restart(self):
+        """
+        Sessions survive store restart
+        :return:
+        """
+        store = SessionStore(self.api, backend=SqliteBackend(self.path))
+        intent = Pizza(self.api)
+        intent.next(chat_id=1, text='привет')
+        store.put(1, intent)
+        store.close()
+
+        store = SessionStore(self.api, backend=SqliteBackend(self.path))
+        self.assertEqual(store.get(1).state, 'ask_pizza_size')
+        store.pop(1)
+        self.assertIsNone(store.get(1))
+        store.close()
+
+
+class TestSharedSessions(unittest.TestCase):
+    """
+    Sessions shared by worker processes cases test class
+    """
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'sessions.db')
+        self.context = multiprocessing.get_context('fork')
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def run_processes(self, target, args_list):
+        processes = [self.context.Process(target=target, args=args) for args in args_list]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+            self.assertEqual(process.exitcode, 0)
+
+    def test_chat_lock(self):
+        """
+        Chat lock excludes other processes
+        :return:
+        """
+        counter = os.path.join(self.directory.name, 'counter')
+        with open(counter, 'w') as file:
+            file.write('0')
+        self.run_processes(increment, [(counter, 200)] * 4)
+        with open(counter) as file:
+            self.assertEqual(int(file.read()), 800)
+
+    def test_dialog_across_processes(self):
+        """
+        Every process continues dialog from the state left by the others
+        :return:
+        """
+        SqliteBackend(self.path, shared=True).close()
+        for text in ('привет', 'маленькую', 'картой'):
+            self.run_processes(advance, [(self.path, text)])
+
+        store = SessionStore(Mock(), backend=SqliteBackend(self.path, shared=True))
+        intent = store.get(1)
+        self.assertEqual(intent.state, 'ask_order')
+        self.assertEqual(intent.order, {'size': 'маленькую', 'payment': 'картой'})
+        self.assertEqual(len(store), 0)
+        store.close()
+
+
+class TestSnapshotSessions(unittest.TestCase):
+    """
+    Compact sessions snapshots cases test class
+    """
+    def setUp(self) -> None:
+        self.api = Mock()
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'snapshots')
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def files(self) -> list:
+        return sorted(os.listdir(self.path))
+
+    def dialog(self, store, chat_id, *texts):
+        intent = store.get(chat_id) or Pizza(self.api)
+        for text in texts:
+            intent.next(chat_id=chat_id, text=text)
+        store.put(chat_id, intent)
+
+    def test_restart(self):
+        """
+        Dialogs survive restart, record takes a dozen bytes
+        :return:
+        """
+        store = SessionStore(self.api, backend=SnapshotBackend(self.path, interval=0))
+        for chat_id in range(1000):
+            self.dialog(store, chat_id, 'привет', 'маленькую' if chat_id % 2 else 'большую')
+        self.dialog(store, 5, 'картой')
+        store.close()
+
+        self.assertEqual(self.files(), ['0000000001.base'])
+        segment = Segment(os.path.join(self.path, '0000000001.base'))
+        self.assertEqual(segment.count, 1000)
+        self.assertEqual(segment.record.size, 12)
+
+        store = SessionStore(self.api, backend=SnapshotBackend(self.path, interval=0))
+        intent = store.get(5)
+        self.assertEqual(intent.state, 'ask_order')
+        self.assertEqual(intent.order, {'size': 'маленькую', 'payment': 'картой'})
+        self.assertEqual(store.get(998).state, 'ask_payment_method')
+        self.assertEqual(store.get(998).order['size'], 'большую')
+        self.assertIsNone(store.get(1000))
+        store.close()
+
+    def test_incremental(self):
+        """
+        Only changed sessions are written, deltas are merged into base when limit is reached
+        :return:
+        """
+        backend = SnapshotBackend(self.path, interval=0, max_deltas=3)
+        store = SessionStore(self.api, backend=backend)
+        for chat_id in range(100):
+            self.dialog(store, chat_id, 'привет')
+        backend.snapshot()
+        self.dialog(store, 1, 'маленькую')
+        backend.snapshot()
+        store.pop(2)
+        backend.snapshot()
+        self.assertEqual(self.files(), ['0000000001.base', '0000000002.delta', '0000000003.delta'])
+        self.assertEqual([segment.count for segment in backend.segments], [1, 1, 100])
+
+        backend.snapshot()      # Nothing changed
+        self.dialog(store, 3, 'большую')
+        backend.snapshot()
+        self.assertEqual(self.files(), ['0000000004.base'])
+        self.assertEqual(backend.segments[0].count, 99)
+        store.close()
+
+        store = SessionStore(self.api, backend=SnapshotBackend(self.path, interval=0))
+        self.assertEqual(store.get(1).state, 'ask_payment_method')
+        self.assertEqual(store.get(3).state, 'ask_payment_method')
+        self.assertEqual(store.get(4).state, 'ask_pizza_size')
+        self.assertIsNone(store.get(2))
+        store.close()
+
+    def test_interrupted_write(self):
+        """
+        Snapshot being written when process died is ignored
+        :return:
+        """
+        store = SessionStore(self.api, backend=SnapshotBackend(self.path, interval=0))
+        self.dialog(store, 1, 'привет')
+        store.close()
+        with open(os.path.join(self.path, '0000000002.delta.tmp'), 'wb') as file:
+            file.write(b'PZS1\x00')
+
+        store = SessionStore(self.api, backend=SnapshotBackend(self.path, interval=0))
+        self.assertEqual(self.files(), ['0000000001.base'])
+        self.assertEqual(store.get(1).state, 'ask_pizza_size')
+        store.close()
+
+    def test_periodic(self):
+        """
+        Changes are written by background thread
+        :return:
+        """
+        backend = SnapshotBackend(self.path, interval=0.05)
+        store = SessionStore(self.api, backend=backend)
+        self.dialog(store, 1, 'привет')
+        for _ in range(100):
+            if backend.snapshots:
+                break
+            time.sleep(0.02)
+        self.assertEqual(self.files(), ['0000000001.base'])
+        store.close()
@@ -0,0 +1,66 @@
+import os
+import time
+import tempfile
+import unittest
+from unittest.mock import patch
+from flask import Flask
+from src.api.telegram import Telegram
+from src.utils.config import load_config, cache_path
+from src.tests.servers import FakeTelegram, BotProcess
+
+
+class TestStartup(unittest.TestCase):
+    """
+    Cold start cases test class
+    """
+    def test_time_to_first_response(self):
+        """
+        Process start to first 200: cold start serves before slow webhook round-trips are done
+        :return:
+        """
+        with FakeTelegram(latency=1.0) as telegram:
+            with BotProcess(telegram.api) as bot:
+                blocking = bot.wait()
+            with BotProcess(telegram.api, bot={'cold_start': True}) as bot:
+                cold = bot.wait()
+                deadline = time.monotonic() + 10
+                while telegram.webhook != f"{bot.url}/telegram" and time.monotonic() < deadline:
+                    time.sleep(0.05)
+                self.assertEqual(telegram.webhook, f"{bot.url}/telegram")     # Webhook is set in background
+        self.assertGreater(blocking, 2.0)     # getWebhookInfo and setWebhook
+        self.assertLess(cold, blocking - 1.5)
+
+    def test_webhook_is_not_set_twice(self):
+        """
+        Webhook already set to the same url is not set again
+        :return:
+        """
+        with FakeTelegram() as telegram:
+            for _ in range(2):
+                api = Telegram(token=telegram.token, api=telegram.api, webhook='https://bot.example/telegram')
+                api.register(Flask(__name__))
+                api.close()
+            methods = [method for method, *_ in telegram.calls]
+        self.assertEqual(methods, ['getWebhookInfo', 'setWebhook', 'getWebhookInfo'])
+
+    def test_config_cache(self):
+        """
+        Parsed config is reused until yaml file changes
+        :return:
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'config.yaml')
+            with open(path, 'w', encoding='utf-8') as file:
+                file.write('bot:\n  port: 5000\n')
+            self.assertEqual(load_config(path), {'bot': {'port': 5000}})
+            self.assertTrue(os.path.exists(cache_path(path)))
+            if os.name == 'posix':
+                self.assertEqual(os.stat(cache_path(path)).st_mode & 0o777, 0o600)    # Cache keeps secrets
+
+            with patch('yaml.load', side_effect=AssertionError('yaml is parsed')):
+                self.assertEqual(load_config(path), {'bot': {'port': 5000}})
+
+            with open(path, 'w', encoding='utf-8') as file:
+                file.write('bot:\n  port: 5001\n')
+            os.utime(path, ns=(time.time_ns(), time.time_ns() + 1000))
+            self.assertEqual(load_config(path), {'bot': {'port': 5001}})
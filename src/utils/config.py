@@ -0,0 +1,53 @@
+import os
+import json
+
+
+def cache_path(path: str) -> str:
+    """
+    Parsed config cache file (next to config, so it can be prepared at build time)
+    :param path: yaml config path
+    :return:
+    """
+    directory, name = os.path.split(os.path.abspath(path))
+    return os.path.join(directory, f".{name}.cache.json")
+
+
+def load_config(path: str, cache: bool = True) -> dict:
+    """
+    Read yaml config
+    Parsed config is cached as JSON and reused while yaml file is not modified, so yaml is not even imported
+    Cache keeps every secret of config, so it is readable by owner only
+    :param path: yaml config path
+    :param cache: use and refresh cache
+    :return:
+    """
+    stat = os.stat(path)
+    key = f"{stat.st_mtime_ns}:{stat.st_size}"
+    cached = cache_path(path)
+    if cache:
+        try:
+            with open(cached, encoding='utf-8') as file:
+                entry = json.load(file)
+            if entry.get('key') == key:
+                return entry['config']
+        except (OSError, ValueError, KeyError, AttributeError):
+            pass
+
+    from yaml import load, FullLoader     # Parsing is needed only when config is changed
+    with open(path, encoding='utf-8') as file:
+        config = load(file, Loader=FullLoader)
+
+    if cache:
+        temporary = f"{cached}.{os.getpid()}"
+        try:
+            descriptor = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with open(descriptor, 'w', encoding='utf-8') as file:
+                json.dump({'key': key, 'config': config}, file, ensure_ascii=False)
+            os.replace(temporary, cached)
+        except (OSError, TypeError, ValueError):
+            # Read-only file system or values JSON can not keep (config is still parsed)
+            try:
+                os.remove(temporary)
+            except OSError:
+                pass
+    return config
@@ -0,0 +1,81 @@
+import time
+from threading import Lock
+
+
+class Deduplicator:
+    """
+    Bounded time windowed index of seen ids
+    Ring buffer keeps insertion order for eviction, set gives O(1) lookup, memory is fixed by capacity
+    With backend ids are remembered in the database shared by worker processes instead (redelivery may reach
+    any worker), capacity does not apply there
+    """
+    def __init__(self, capacity: int = 100000, window: float = 3600, clock=time.monotonic, backend=None):
+        """
+        :param capacity: max remembered ids
+        :param window: seconds an id is remembered
+        :param clock: time source
+        :param backend: shared store of seen ids (see SqliteBackend.seen), ids are remembered in memory without it
+        """
+        self.capacity = capacity
+        self.window = window
+        self.clock = clock
+        self.backend = backend
+        self.ids = [None] * capacity    # Ring buffer of ids
+        self.times = [0.0] * capacity   # Ring buffer of ids insertion time
+        self.head = 0                   # Oldest entry
+        self.size = 0                   # Entries in ring
+        self.index = set()
+        self.lock = Lock()
+
+        # Counters
+        self.total = 0
+        self.duplicates = 0
+
+    def seen(self, key) -> bool:
+        """
+        Check id and remember it
+        :param key: id
+        :return: True if id was already seen inside window
+        """
+        if self.backend is not None:
+            duplicate = self.backend.seen(key, self.window)
+            with self.lock:
+                self.total += 1
+                self.duplicates += duplicate
+            return duplicate
+        now = self.clock()
+        with self.lock:
+            self.total += 1
+            self.expire(now)
+            if key in self.index:
+                self.duplicates += 1
+                return True
+            if self.size == self.capacity:
+                self.index.discard(self.ids[self.head])
+                self.head = (self.head + 1) % self.capacity
+                self.size -= 1
+            tail = (self.head + self.size) % self.capacity
+            self.ids[tail] = key
+            self.times[tail] = now
+            self.size += 1
+            self.index.add(key)
+            return False
+
+    def expire(self, now):
+        deadline = now - self.window
+        while self.size and self.times[self.head] <= deadline:
+            self.index.discard(self.ids[self.head])
+            self.ids[self.head] = None
+            self.head = (self.head + 1) % self.capacity
+            self.size -= 1
+
+    @property
+    def rate(self) -> float:
+        """
+        Duplicates rate
+        :return:
+        """
+        return self.duplicates / self.total if self.total else 0.0
+
+    def stats(self) -> dict:
+        return {'size': self.size, 'total': self.total, 'duplicates': self.duplicates, 'rate': self.rate}
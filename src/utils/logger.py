@@ -1,12 +1,98 @@
-import logging
+import os
 import sys
+import json
+import time
+import atexit
+import logging
+from queue import Queue, Full
+from logging.handlers import QueueHandler, QueueListener
 from src.utils import Singleton
+from src.utils.tracing import TraceFilter
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Queue handler which leaves formatting to listener thread
+    Records are dropped (and counted) when queue is full instead of blocking caller
+    """
+    def __init__(self, queue: Queue):
+        super().__init__(queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    JSON lines formatter
+    """
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'name': record.name,
+            'module': record.module,
+            'level': record.levelname,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        category = getattr(record, 'category', None)
+        if category:
+            entry['category'] = category
+        trace_id = getattr(record, 'trace_id', None)
+        if trace_id:
+            entry['trace_id'] = trace_id
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class CategoryLimiter(logging.Filter):
+    """
+    Per category rate limit (records per second) for high volume logs
+    Record category is passed with extra={'category': ...}, records without limited category always pass
+    Counters are not locked, limit is approximate under concurrency
+    """
+    def __init__(self, limits: dict = None, clock=time.monotonic):
+        """
+        :param limits: category -> max records per second
+        :param clock: time source
+        """
+        super().__init__()
+        self.clock = clock
+        self.limits = dict(limits or {})
+        self.windows = {}   # Category -> [window start, records in window]
+        self.dropped = {}   # Category -> dropped records
+
+    def filter(self, record):
+        category = getattr(record, 'category', None)
+        limit = self.limits.get(category)
+        if limit is None:
+            return True
+        now = self.clock()
+        window = self.windows.get(category)
+        if window is None or now - window[0] >= 1:
+            window = self.windows[category] = [now, 0]
+        window[1] += 1
+        if window[1] <= limit:
+            return True
+        self.dropped[category] = self.dropped.get(category, 0) + 1
+        return False
 
 
 class Logger(metaclass=Singleton):
     """
-    Simple stream logger
+    Non blocking stream logger
+    Callers only put records into queue, formatting and writing is done by background listener thread
     """
+    text_formatter = logging.Formatter('[%(asctime)s] - %(name)-15s - %(module)-10s - [%(levelname)-8s] - %(threadName)-15s - %(message)s')
+
     def __init__(self):
 
         # Logger
@@ -15,14 +101,59 @@ class Logger(metaclass=Singleton):
         logger = logging.getLogger(self.logger_name)
         logger.setLevel(logging.INFO)
         logger.propagate = False
-        formatter = logging.Formatter('[%(asctime)s] - %(name)-15s - %(module)-10s - [%(levelname)-8s] - %(threadName)-15s - %(message)s')
 
         ch = logging.StreamHandler(sys.stdout)
         ch.setLevel(logging.INFO)
-        ch.setFormatter(formatter)
-        logger.addHandler(ch)
+        ch.setFormatter(self.text_formatter)
+        self.stream_handler = ch
+
+        self.limiter = CategoryLimiter()
+        logger.addFilter(self.limiter)
+        logger.addFilter(TraceFilter())
+
+        self.queue_handler = DeferredQueueHandler(Queue(maxsize=10000))
+        logger.addHandler(self.queue_handler)
+        self.listener = None
+        self.start()
 
         self.logger = logger
 
+        atexit.register(self.stop)
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self.start)     # Listener thread does not survive fork
+
+    def start(self):
+        """
+        Start listener (with fresh queue)
+        :return:
+        """
+        self.queue_handler.queue = Queue(maxsize=self.queue_handler.queue.maxsize)
+        self.listener = QueueListener(self.queue_handler.queue, self.stream_handler, respect_handler_level=True)
+        self.listener.start()
+
+    def stop(self):
+        """
+        Write queued records and stop listener
+        :return:
+        """
+        if self.listener is not None and self.listener._thread is not None:
+            self.listener.stop()
+
+    def configure(self, level: str = 'INFO', json_lines: bool = False, limits: dict = None):
+        """
+        Configure logger
+        :param level: logging level
+        :param json_lines: write records as JSON lines
+        :param limits: category -> max records per second ("update", "state")
+        :return:
+        """
+        self.logger.setLevel(level)
+        self.stream_handler.setLevel(level)
+        self.stream_handler.setFormatter(JsonFormatter() if json_lines else self.text_formatter)
+        self.limiter.limits = dict(limits or {})
+
+    def stats(self) -> dict:
+        return {'dropped_queue_full': self.queue_handler.dropped, 'dropped_by_limit': dict(self.limiter.dropped)}
+
     def get(self):
         return self.logger
@@ -0,0 +1,136 @@
+import bisect
+from threading import Lock
+from src.utils import Singleton
+
+
+class Histogram:
+    """
+    Fixed buckets histogram
+    """
+    __slots__ = ('buckets', 'counts', 'sum', 'lock')
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets                      # Buckets upper bounds
+        self.counts = [0] * (len(buckets) + 1)      # Observations per bucket (last one is +Inf)
+        self.sum = 0.0
+        self.lock = Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+
+class Counter:
+    """
+    Monotonic counter
+    """
+    __slots__ = ('value', 'lock')
+
+    def __init__(self):
+        self.value = 0
+        self.lock = Lock()
+
+    def inc(self, amount: int = 1):
+        with self.lock:
+            self.value += amount
+
+
+class Metrics(metaclass=Singleton):
+    """
+    Process metrics registry, rendered in prometheus text format
+    Gauges (and counters kept by other components) are collected on render from registered collectors
+    Every server worker process has its own registry
+    """
+    buckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)   # Seconds
+
+    def __init__(self):
+        self.histograms = {}    # (name, labels) -> Histogram
+        self.counters = {}      # (name, labels) -> Counter
+        self.collectors = []    # Callables returning [(name, labels, value)] or [(name, labels, value, type)]
+        self.lock = Lock()
+
+    def histogram(self, name: str, **labels) -> Histogram:
+        """
+        Get or create histogram
+        :param name: metric name
+        :param labels: metric labels
+        :return:
+        """
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(key, Histogram(self.buckets))
+        return histogram
+
+    def counter(self, name: str, **labels) -> Counter:
+        """
+        Get or create counter
+        :param name: metric name
+        :param labels: metric labels
+        :return:
+        """
+        key = (name, tuple(sorted(labels.items())))
+        counter = self.counters.get(key)
+        if counter is None:
+            with self.lock:
+                counter = self.counters.setdefault(key, Counter())
+        return counter
+
+    def collector(self, func):
+        """
+        Register samples collector
+        :param func: callable returning list of (name, labels dict, value) gauges,
+                     monotonic values are returned as (name, labels dict, value, 'counter')
+        :return:
+        """
+        self.collectors.append(func)
+
+    @staticmethod
+    def format_labels(labels) -> str:
+        if not labels:
+            return ''
+        return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+    def render(self) -> str:
+        """
+        Prometheus text exposition
+        Samples are grouped by metric name, every metric is one TYPE line followed by all its samples
+        :return:
+        """
+        families = {}   # Metric name -> (type, sample lines)
+
+        def family(name, kind) -> list:
+            return families.setdefault(name, (kind, []))[1]
+
+        for (name, labels), counter in sorted(self.counters.items()):
+            family(name, 'counter').append(f"{name}{self.format_labels(labels)} {counter.value}")
+
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            samples = family(name, 'histogram')
+            with histogram.lock:
+                counts, total = list(histogram.counts), histogram.sum
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + ('+Inf',), counts):
+                cumulative += count
+                samples.append(f"{name}_bucket{self.format_labels(labels + (('le', bound),))} {cumulative}")
+            samples.append(f"{name}_sum{self.format_labels(labels)} {total}")
+            samples.append(f"{name}_count{self.format_labels(labels)} {cumulative}")
+
+        for collect in list(self.collectors):
+            for name, labels, value, *kind in collect():
+                family(name, kind[0] if kind else 'gauge').append(
+                    f"{name}{self.format_labels(tuple(sorted(labels.items())))} {value}"
+                )
+
+        lines = []
+        for name, (kind, samples) in families.items():
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,230 @@
+import sys
+import time
+from collections import deque
+from contextlib import nullcontext
+from contextvars import ContextVar
+from threading import Lock
+from src.utils import Singleton
+from src.utils.tracing import current_trace
+
+current_profile = ContextVar('profile', default=None)     # UpdateProfile of update handled by current thread
+no_profile = nullcontext()                                  # Update context when profiler is off (reusable)
+
+
+class CallStacks:
+    """
+    Deterministic profiler of the current thread (sys.setprofile) collecting collapsed stacks:
+    "root;module:function;... microseconds" lines of self time, flamegraph.pl and speedscope read them as is
+    Costly, so it runs only for sampled updates
+    """
+    __slots__ = ('keys', 'times', 'last', 'previous')
+
+    def __init__(self, root: str):
+        """
+        :param root: name of stack root (handling stage)
+        """
+        self.keys = [root]      # Collapsed key of every open frame, root first
+        self.times = {}         # Collapsed key -> self seconds
+        self.last = 0.0         # Time of last event
+        self.previous = None    # Thread profile function before start
+
+    @staticmethod
+    def frame_name(frame) -> str:
+        code = frame.f_code
+        return f"{frame.f_globals.get('__name__', '?')}:{getattr(code, 'co_qualname', code.co_name)}"
+
+    def callback(self, frame, event, arg):
+        now = time.perf_counter()
+        key = self.keys[-1]
+        self.times[key] = self.times.get(key, 0.0) + now - self.last
+        if event == 'call':
+            self.keys.append(f"{key};{self.frame_name(frame)}")
+        elif event == 'c_call':
+            self.keys.append(f"{key};{getattr(arg, '__module__', None) or 'builtins'}:{getattr(arg, '__qualname__', None) or '?'}")
+        elif len(self.keys) > 1:     # Returns of frames opened before start are not popped
+            self.keys.pop()
+        self.last = time.perf_counter()     # Profiler own time is not charged
+
+    def __enter__(self):
+        self.previous = sys.getprofile()
+        self.last = time.perf_counter()
+        sys.setprofile(self.callback)
+        return self
+
+    def __exit__(self, *args):
+        sys.setprofile(self.previous)
+        key = self.keys[-1]
+        self.times[key] = self.times.get(key, 0.0) + time.perf_counter() - self.last
+
+
+class UpdateProfile:
+    """
+    Timings, intent transitions and (for sampled updates) call stacks of one update
+    Follows update from webhook thread to dispatcher shard in context (see current_profile)
+    """
+    __slots__ = ('profiler', 'api', 'payload', 'trace_id', 'sampled', 'marks', 'transitions', 'token', 'stacks')
+
+    def __init__(self, profiler: 'Profiler', api: str, payload, sampled: bool):
+        self.profiler = profiler
+        self.api = api
+        self.payload = payload
+        self.trace_id = current_trace.get()
+        self.sampled = sampled
+        self.marks = {}             # Stage -> perf counter: received, queued, handling, handled
+        self.transitions = []       # (intent, trigger, source state, outcome, seconds), see Intent.trigger
+        self.token = None
+        self.stacks = None
+
+    def __enter__(self):
+        self.marks['received'] = time.perf_counter()
+        self.token = current_profile.set(self)
+        if self.sampled:
+            self.stacks = CallStacks('receive').__enter__()
+        return self
+
+    def __exit__(self, *args):
+        if self.stacks is not None:
+            self.stacks.__exit__()
+            self.profiler.add_stacks(self.stacks.times)
+            self.stacks = None
+        current_profile.reset(self.token)
+        self.marks['queued'] = time.perf_counter()
+
+    def handle(self, func, *args, **kwargs):
+        """
+        Run update handling task (dispatcher shard), update is finished after it
+        :param func: handling task
+        :return:
+        """
+        self.marks['handling'] = time.perf_counter()
+        try:
+            if self.sampled:
+                with CallStacks('handle') as stacks:
+                    func(*args, **kwargs)
+                self.profiler.add_stacks(stacks.times)
+            else:
+                func(*args, **kwargs)
+        finally:
+            self.marks['handled'] = time.perf_counter()
+            self.profiler.finish(self)
+
+    def transition(self, intent: str, trigger: str, source: str, outcome: str, seconds: float):
+        self.transitions.append((intent, trigger, source, outcome, seconds))
+
+    def timings(self) -> dict:
+        """
+        Stage seconds: receive (webhook or polling thread, up to queueing), wait (dispatcher and admission queues), handle, total
+        :return:
+        """
+        marks = self.marks
+        received = marks['received']
+        queued = marks.get('queued', received)
+        handling = marks.get('handling', queued)
+        handled = marks.get('handled', handling)
+        return {'receive': queued - received, 'wait': handling - queued, 'handle': handled - handling, 'total': handled - received}
+
+    def record(self) -> dict:
+        return {
+            'api': self.api,
+            'trace_id': self.trace_id,
+            'payload': self.payload,
+            'timings': self.timings(),
+            'transitions': [
+                {'intent': intent, 'trigger': trigger, 'source': source, 'outcome': outcome, 'seconds': seconds}
+                for intent, trigger, source, outcome, seconds in self.transitions
+            ],
+        }
+
+
+class Profiler(metaclass=Singleton):
+    """
+    Opt-in updates profiler of the serving process
+    1 in sample_every updates is profiled (collapsed call stacks of receive and handle parts are summed up),
+    updates slower than slow_threshold from received to handled are kept in a ring buffer with payload,
+    intent transitions and stage timings. When both are off an update costs a flag check
+    """
+    def __init__(self):
+        self.active = False         # Any of sampling and slow updates capture is on
+        self.sample_every = 0
+        self.slow_threshold = None
+        self.updates = 0            # Updates seen while active
+        self.stacks = {}            # Collapsed key -> self seconds of sampled updates
+        self.sampled = 0
+        self.slow = deque(maxlen=100)
+        self.lock = Lock()
+
+    def configure(self, sample_every: int = 0, slow_threshold: float = None, slow_capacity: int = 100):
+        """
+        Configure profiler (profiled data is reset)
+        :param sample_every: profile call stacks of 1 in N updates, 0 disables sampling
+        :param slow_threshold: seconds from received to handled an update is captured over, None disables capture
+        :param slow_capacity: max captured slow updates (oldest are dropped)
+        :return:
+        """
+        with self.lock:
+            self.sample_every = max(int(sample_every or 0), 0)
+            self.slow_threshold = slow_threshold
+            self.slow = deque(maxlen=slow_capacity)
+            self.stacks = {}
+            self.sampled = 0
+            self.updates = 0
+            self.active = bool(self.sample_every) or slow_threshold is not None
+
+    def update(self, api: str, payload):
+        """
+        Profile of incoming update, use as context of receive part of update handling (inside update trace)
+        :param api: platform name
+        :param payload: update
+        :return: UpdateProfile or no-op context if profiler is off
+        """
+        if not self.active:
+            return no_profile
+        self.updates += 1       # Not locked, sampling is approximate under concurrent webhooks
+        sampled = bool(self.sample_every) and self.updates % self.sample_every == 0
+        if sampled:
+            self.sampled += 1
+        return UpdateProfile(self, api, payload, sampled)
+
+    def add_stacks(self, times: dict):
+        with self.lock:
+            for key, seconds in times.items():
+                self.stacks[key] = self.stacks.get(key, 0.0) + seconds
+
+    def finish(self, profile: UpdateProfile):
+        """
+        Capture update if it is slow
+        :param profile: handled update profile
+        :return:
+        """
+        if self.slow_threshold is not None:
+            marks = profile.marks
+            if marks['handled'] - marks['received'] >= self.slow_threshold:
+                self.slow.append(profile.record())
+
+    def collapsed(self) -> str:
+        """
+        Sampled call stacks in collapsed format (microseconds of self time)
+        :return:
+        """
+        with self.lock:
+            stacks = sorted(self.stacks.items())
+        return ''.join(f"{key} {round(seconds * 1e6)}\n" for key, seconds in stacks if seconds >= 5e-7)
+
+    def slow_updates(self) -> list:
+        return list(self.slow)
+
+    def stats(self) -> dict:
+        return {
+            'sample_every': self.sample_every, 'slow_threshold': self.slow_threshold, 'updates': self.updates,
+            'sampled': self.sampled, 'slow': len(self.slow),
+        }
+
+    def reset(self):
+        """
+        Drop profiled data, keep settings
+        :return:
+        """
+        with self.lock:
+            self.stacks = {}
+            self.sampled = 0
+            self.slow.clear()
@@ -0,0 +1,33 @@
+import os
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+current_trace = ContextVar('trace_id', default=None)    # Trace id of update handled by current thread
+
+
+def new_trace_id() -> str:
+    return os.urandom(8).hex()
+
+
+@contextmanager
+def trace(trace_id: str):
+    """
+    Set current trace id for block
+    :param trace_id: trace id
+    :return:
+    """
+    token = current_trace.set(trace_id)
+    try:
+        yield trace_id
+    finally:
+        current_trace.reset(token)
+
+
+class TraceFilter(logging.Filter):
+    """
+    Adds current trace id to log records (record.trace_id)
+    """
+    def filter(self, record):
+        record.trace_id = current_trace.get()
+        return True